@@ -10,5 +10,7 @@
 """
 BCDI algorithms.
 
-This package contains functions related to image deconvolution.
+This package contains:
+ - algorithms_utils: functions related to image deconvolution
+ - fft_convolution: convolution with a precomputed kernel spectrum
 """
@@ -15,8 +15,8 @@ Richardson-Lucy algorithm, blind deconvolution...
 import matplotlib.pyplot as plt
 from numbers import Real
 import numpy as np
-from scipy.signal import fftconvolve, convolve
 import sys
+from .fft_convolution import FFTConvolution
 from ..graph import graph_utils as gu
 from ..utils import utilities as util
 from ..utils import validation as valid
@@ -30,6 +30,8 @@ def blind_deconvolution_rl(
     sub_iterations=10,
     update_psf_first=True,
     debugging=False,
+    dtype=np.float64,
+    workers=None,
     **kwargs,
 ):
     """
@@ -48,6 +50,10 @@ def blind_deconvolution_rl(
     :param update_psf_first: bool, if True the psf estimate is updated first and then
      the perfect object estimate
     :param debugging: True to see plots
+    :param dtype: numpy.float32 or numpy.float64, type used for the calculation
+    :param workers: number of threads used for the Fourier transforms, negative
+     values counting from the number of CPUs. Leave None to use the default of
+     scipy.fft.
     :param kwargs:
      - 'scale': tuple, scale for the plots, 'linear' or 'log'
      - 'reciprocal_space': bool, True if the data is in reciprocal space,
@@ -136,6 +142,8 @@ def blind_deconvolution_rl(
                 iterations=sub_iterations,
                 clip=False,
                 guess=psf,
+                dtype=dtype,
+                workers=workers,
             )
             # udpate the estimate of the perfect object
             perfect_object, _ = richardson_lucy(
@@ -144,6 +152,8 @@ def blind_deconvolution_rl(
                 iterations=sub_iterations,
                 clip=True,
                 guess=perfect_object,
+                dtype=dtype,
+                workers=workers,
             )
         else:
             # udpate the estimate of the perfect object
@@ -153,6 +163,8 @@ def blind_deconvolution_rl(
                 iterations=sub_iterations,
                 clip=True,
                 guess=perfect_object,
+                dtype=dtype,
+                workers=workers,
             )
             # update the estimate of the psf
             psf, _ = richardson_lucy(
@@ -161,6 +173,8 @@ def blind_deconvolution_rl(
                 iterations=sub_iterations,
                 clip=False,
                 guess=psf,
+                dtype=dtype,
+                workers=workers,
             )
     psf = (np.abs(psf) / np.abs(psf).sum()).astype(np.float)
 
@@ -348,12 +362,16 @@ def partial_coherence_rl(
     return psf, error
 
 
-def richardson_lucy(image, psf, iterations=50, clip=True, guess=None):
+def richardson_lucy(
+    image, psf, iterations=50, clip=True, guess=None, dtype=np.float64, workers=None
+):
     """
     Richardson-Lucy algorithm.
 
     The algorithm is as implemented in scikit-image.restoration.deconvolution with an
-    additional parameter for the initial guess of the psf.
+    additional parameter for the initial guess of the psf. The spectra of the psf and
+    of its mirror are calculated once, and the convolutions use real-to-complex
+    Fourier transforms.
 
     :param image: ndarray, input degraded image (can be N dimensional).
     :param psf: ndarray, the point spread function.
@@ -363,48 +381,46 @@ def richardson_lucy(image, psf, iterations=50, clip=True, guess=None):
      thresholded for skimage pipeline compatibility.
     :param guess: ndarray, the initial guess for the deconvoluted image.
      Leave None to use the default (flat array of 0.5)
+    :param dtype: numpy.float32 or numpy.float64, type used for the calculation.
+     numpy.float32 halves the memory footprint and speeds up the Fourier transforms.
+    :param workers: number of threads used for the Fourier transforms, negative
+     values counting from the number of CPUs. Leave None to use the default of
+     scipy.fft.
     :return: the deconvolved image (ndarray) and the error metric (1D ndarray,
      len = iterations). The error is given by
      np.linalg.norm(previous_deconv-new_deconv) / np.linalg.norm(previous_deconv)
     """
-    # compute the times for direct convolution and the fft method. The fft is of
-    # complexity O(N log(N)) for each dimension and the direct method does
-    # straight arithmetic (and is O(n*k) to add n elements k times)
-    direct_time = np.prod(image.shape + psf.shape)
-    fft_time = np.sum([n * np.log(n) for n in image.shape + psf.shape])
-
-    # see whether the fourier transform convolution method or the direct
-    # convolution method is faster (discussed in scikit-image PR #1792)
-    time_ratio = 40.032 * fft_time / direct_time
-
-    if time_ratio <= 1 or len(image.shape) > 2:
-        convolve_method = fftconvolve
-    else:
-        convolve_method = convolve
-
     valid.valid_ndarray((image, psf))
-    image = image.astype(np.float)
-    psf = psf.astype(np.float)
+    image = image.astype(dtype)
 
     if guess is not None:
         valid.valid_ndarray(guess, shape=image.shape)
-        im_deconv = guess
+        im_deconv = guess.astype(dtype, copy=False)
     else:
-        im_deconv = np.full(image.shape, 0.5)
+        im_deconv = np.full(image.shape, 0.5, dtype=dtype)
 
-    psf_mirror = psf[::-1, ::-1]
+    convolve_psf = FFTConvolution(
+        kernel=psf, shape=image.shape, dtype=dtype, workers=workers
+    )
+    convolve_mirror = FFTConvolution(
+        kernel=psf[::-1, ::-1], shape=image.shape, dtype=dtype, workers=workers
+    )
+    # buffers reused at each iteration
+    previous_deconv = np.empty_like(im_deconv)
+    relative_blur = np.empty_like(im_deconv)
 
     error = np.empty(iterations)
     for idx in range(iterations):
         if (idx % 10) == 0:
             sys.stdout.write(f"\rRL iteration {idx}")
             sys.stdout.flush()
-        previous_deconv = np.copy(im_deconv)
-        relative_blur = image / convolve_method(im_deconv, psf, "same")
-        im_deconv *= convolve_method(relative_blur, psf_mirror, "same")
-        error[idx] = np.linalg.norm(previous_deconv - im_deconv) / np.linalg.norm(
-            previous_deconv
-        )
+        np.copyto(previous_deconv, im_deconv)
+        convolve_psf(im_deconv, out=relative_blur)
+        np.divide(image, relative_blur, out=relative_blur)
+        im_deconv *= convolve_mirror(relative_blur, out=relative_blur)
+        previous_norm = np.linalg.norm(previous_deconv)
+        previous_deconv -= im_deconv
+        error[idx] = np.linalg.norm(previous_deconv) / previous_norm
     print("\n")
     if clip:
         im_deconv[im_deconv > 1] = 1
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+"""FFTConvolution class."""
+import numpy as np
+from scipy.fft import irfftn, next_fast_len, rfftn
+
+from ..utils import validation as valid
+
+
+class FFTConvolution:
+    """
+    Class convolving real arrays of a given shape with a fixed real kernel.
+
+    The spectrum of the kernel is calculated once, using real-to-complex Fourier
+    transforms of a shape padded to a length efficient for the FFT. The result is the
+    same as scipy.signal.fftconvolve(array, kernel, mode="same") for arrays of the
+    defined shape.
+
+    :param kernel: real ndarray, the kernel of the convolution
+    :param shape: shape of the arrays to be convolved, of the same number of
+     dimensions as the kernel
+    :param dtype: numpy.float32 or numpy.float64, type used for the calculation
+    :param workers: number of threads used by scipy.fft, negative values counting
+     from the number of CPUs. Leave None to use the default of scipy.fft.
+    """
+
+    def __init__(self, kernel, shape, dtype=np.float64, workers=None):
+        valid.valid_ndarray(kernel, name="kernel")
+        valid.valid_container(
+            shape,
+            container_types=(tuple, list),
+            length=kernel.ndim,
+            item_types=int,
+            min_excluded=0,
+            name="shape",
+        )
+        if np.dtype(dtype) not in {np.dtype(np.float32), np.dtype(np.float64)}:
+            raise ValueError(f"dtype should be float32 or float64, got {dtype}")
+        valid.valid_item(workers, allowed_types=int, allow_none=True, name="workers")
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        self._workers = workers
+        self._fft_shape = tuple(
+            next_fast_len(nb_points + nb_kernel - 1, real=True)
+            for nb_points, nb_kernel in zip(self._shape, kernel.shape)
+        )
+        # zero-padded buffer where the arrays to be convolved are copied
+        self._padded = np.zeros(self._fft_shape, dtype=self._dtype)
+        self._input_slices = tuple(slice(0, nb_points) for nb_points in self._shape)
+        # mode "same": the output is centered with respect to the full convolution
+        self._output_slices = tuple(
+            slice((nb_kernel - 1) // 2, (nb_kernel - 1) // 2 + nb_points)
+            for nb_points, nb_kernel in zip(self._shape, kernel.shape)
+        )
+        self._spectrum = rfftn(
+            np.asarray(kernel, dtype=self._dtype),
+            s=self._fft_shape,
+            workers=self._workers,
+        )
+
+    @property
+    def dtype(self):
+        """Type used for the calculation."""
+        return self._dtype
+
+    @property
+    def fft_shape(self):
+        """Shape of the padded arrays used for the Fourier transforms."""
+        return self._fft_shape
+
+    @property
+    def shape(self):
+        """Shape of the arrays to be convolved."""
+        return self._shape
+
+    @property
+    def workers(self):
+        """Number of threads used by scipy.fft."""
+        return self._workers
+
+    def __call__(self, array, out=None):
+        """
+        Convolve an array with the kernel.
+
+        :param array: real ndarray of shape self.shape
+        :param out: optional ndarray of shape self.shape where to write the result
+        :return: the convolved array, of the same shape as array
+        """
+        valid.valid_ndarray(array, shape=self.shape, name="array")
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        else:
+            valid.valid_ndarray(out, shape=self.shape, name="out")
+        self._padded[self._input_slices] = array
+        spectrum = rfftn(self._padded, workers=self.workers)
+        spectrum *= self._spectrum
+        out[...] = irfftn(
+            spectrum, s=self.fft_shape, overwrite_x=True, workers=self.workers
+        )[self._output_slices]
+        return out
@@ -1879,7 +1879,7 @@ class BeamlineP10SAXS(BeamlineP10):
             container_types=(tuple, list),
             length=3,
             item_types=int,
-            min_excluded=1,
+            min_excluded=0,
             name="array_shape",
         )
         valid.valid_1d_array(
@@ -2029,10 +2029,13 @@ class BeamlineSIXS(Beamline):
             # no specfile, load directly the dataset
             import bcdi.preprocessing.ReadNxs3 as ReadNxs3
 
+            # lazy mode: only the counters and frames actually used are read, the
+            # file is closed by the diffractometer once frames and motors are read
             return ReadNxs3.DataSet(
                 directory=datadir,
                 filename=shortname,
                 alias_dict=filename,
+                lazy=True,
             )
         raise NotImplementedError(f"{name} is not implemented")
 
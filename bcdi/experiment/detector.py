@@ -513,6 +513,105 @@ class Detector(ABC):
             return data - background
         return data
 
+    def correct_frames(
+        self,
+        data,
+        mask,
+        nb_frames=1,
+        flatfield=None,
+        background=None,
+        hotpixels=None,
+        monitor=None,
+        roi=None,
+    ):
+        """
+        Apply in place the detector corrections to a stack of frames.
+
+        The corrections are the same as in mask_detector() and are applied in the same
+        order: linearity, flatfield, background, hotpixels, detector gaps and
+        saturation, followed by the optional normalization by the monitor. They are
+        broadcast over chunks of frames in a single pass, which bounds the size of
+        temporary arrays. Floating point data is modified in place, e.g. float32 data
+        stays float32, other types are converted once to float32.
+
+        :param data: the 3D stack of frames, the first axis being the frame index
+        :param mask: the 2D mask to be updated, of shape data.shape[1:]
+        :param nb_frames: number of frames summed to yield each 2D frame
+         (e.g. in a series measurement), used when defining the threshold for hot pixels
+        :param flatfield: the 2D flatfield array to be multiplied with the data
+        :param background: a 2D array to be subtracted to the data
+        :param hotpixels: a 2D array with hotpixels to be masked
+         (1=hotpixel, 0=normal pixel)
+        :param monitor: optional 1D array of length data.shape[0], the frames are
+         multiplied by the monitor values
+        :param roi: optional region of interest [y_start, y_stop, x_start, x_stop] of
+         the unbinned detector, when the frames cover only this part of the detector.
+         flatfield, background and hotpixels should then be already cropped to roi.
+        :return: the corrected data and the updated mask
+        """
+        valid.valid_ndarray(data, ndim=3, name="data")
+        valid.valid_ndarray(mask, shape=data.shape[1:], name="mask")
+        if roi is not None:
+            valid.valid_container(
+                roi, container_types=(tuple, list), length=4, item_types=int, name="roi"
+            )
+            if (roi[1] - roi[0], roi[3] - roi[2]) != data.shape[1:]:
+                raise ValueError(
+                    f"roi {roi} does not match the shape of the frames {data.shape[1:]}"
+                )
+        valid.valid_item(nb_frames, allowed_types=int, min_excluded=0, name="nb_frames")
+        for array, name in ((flatfield, "flatfield"), (background, "background")):
+            if array is not None:
+                valid.valid_ndarray(array, shape=data.shape[1:], name=name)
+        if monitor is not None:
+            valid.valid_1d_array(monitor, length=data.shape[0], name="monitor")
+            monitor = np.asarray(monitor)
+        if not np.issubdtype(data.dtype, np.floating):
+            data = data.astype(np.float32)
+
+        # pixels masked in all frames: hotpixels and detector gaps
+        if roi is None:
+            dead_pixels = np.zeros(data.shape[1:], dtype=bool)
+            _, dead_pixels = self._mask_gaps(np.zeros(data.shape[1:]), dead_pixels)
+        else:  # the gaps are defined in the full detector frame
+            dead_pixels = np.zeros(self.unbinned_pixel_number, dtype=bool)
+            _, dead_pixels = self._mask_gaps(
+                np.zeros(self.unbinned_pixel_number), dead_pixels
+            )
+            dead_pixels = dead_pixels[roi[0] : roi[1], roi[2] : roi[3]]
+        if hotpixels is not None:
+            valid.valid_ndarray(hotpixels, shape=data.shape[1:], name="hotpixels")
+            if ((hotpixels == 0).sum() + (hotpixels == 1).sum()) != hotpixels.size:
+                raise ValueError("hotpixels should be an array of 0 and 1")
+            dead_pixels |= hotpixels == 1
+        mask[dead_pixels] = 1
+
+        saturated = np.zeros(data.shape[1:], dtype=bool)
+        chunk_length = max(1, 2 ** 22 // (data.shape[1] * data.shape[2]))
+        for start in range(0, data.shape[0], chunk_length):
+            chunk = data[start : start + chunk_length]
+            if self._linearity_func is not None:
+                chunk[...] = self._linearity_func(chunk.reshape(-1)).reshape(
+                    chunk.shape
+                )
+            if flatfield is not None:
+                np.multiply(chunk, flatfield, out=chunk)
+            if background is not None:
+                np.subtract(chunk, background, out=chunk)
+            chunk[:, dead_pixels] = 0
+            if self.saturation_threshold is not None:
+                is_saturated = chunk > self.saturation_threshold * nb_frames
+                chunk[is_saturated] = 0
+                saturated |= is_saturated.any(axis=0)
+            if monitor is not None:
+                np.multiply(
+                    chunk,
+                    monitor[start : start + chunk_length, np.newaxis, np.newaxis],
+                    out=chunk,
+                )
+        mask[saturated] = 1
+        return data, mask
+
     @staticmethod
     def _flatfield_correction(data, flatfield):
         """
@@ -581,28 +680,15 @@ class Detector(ABC):
         :return: the masked data and the updated mask
         """
         valid.valid_ndarray((data, mask), ndim=2)
-
-        # linearity correctiondata
-        if self._linearity_func is not None:
-            data = self._linearity_func(data)
-
-        # flatfield correction
-        data = self._flatfield_correction(data=data, flatfield=flatfield)
-
-        # remove the background
-        data = self._background_subtraction(data=data, background=background)
-
-        # mask hotpixels
-        data, mask = self._hotpixels_correction(
-            data=data, mask=mask, hotpixels=hotpixels
+        data, mask = self.correct_frames(
+            data=data[np.newaxis, :, :].astype(float),
+            mask=mask,
+            nb_frames=nb_frames,
+            flatfield=flatfield,
+            background=background,
+            hotpixels=hotpixels,
         )
-        # mask detector gaps
-        data, mask = self._mask_gaps(data, mask)
-
-        # remove saturated pixels
-        data, mask = self._saturation_correction(data, mask, nb_frames=nb_frames)
-
-        return data, mask
+        return data[0], mask
 
     def _mask_gaps(self, data, mask):
         """
@@ -64,12 +64,15 @@ from abc import ABC, abstractmethod
 import fabio
 from functools import reduce
 import h5py
+from itertools import groupby
 from matplotlib import pyplot as plt
+from multiprocessing.pool import ThreadPool
 from numbers import Integral, Number, Real
 import numpy as np
 import os
 import re
 import sys
+import threading
 import tkinter as tk
 from tkinter import filedialog
 
@@ -223,13 +226,8 @@ def check_pixels(data, mask, debugging=False):
         )
     )
 
-    # update the data array
-    indices_badpixels = np.nonzero(mask)  # update indices
-    for index in range(nbz):
-        tempdata = data[index, :, :]
-        tempdata[
-            indices_badpixels
-        ] = 0  # numpy array is mutable hence data will be modified
+    # update the data array, the 2D mask is broadcast along the frames
+    data[:, mask != 0] = 0
 
     if debugging:
         meandata = data.mean(axis=0)
@@ -373,8 +371,8 @@ def normalize_dataset(array, monitor, savedir=None, norm_to_min=True, debugging=
             f"got {nbz} frames but {len(monitor)} monitor values",
         )
 
-    for idx in range(nbz):
-        array[idx, :, :] = array[idx, :, :] * monitor[idx]
+    # in place, without temporary copy of the array
+    np.multiply(array, monitor[:, np.newaxis, np.newaxis], out=array, casting="unsafe")
 
     if debugging:
         norm_data = np.copy(array)
@@ -1012,8 +1010,10 @@ class Diffractometer(ABC):
             ########################################
             data, mask2d = check_pixels(data=data, mask=mask2d, debugging=debugging)
             mask3d = np.repeat(mask2d[np.newaxis, :, :], data.shape[0], axis=0)
-            mask3d[np.isnan(data)] = 1
-            data[np.isnan(data)] = 0
+            nan_pixels = np.isnan(data)
+            mask3d[nan_pixels] = 1
+            data[nan_pixels] = 0
+            del nan_pixels
 
             ####################################
             # check for empty frames (no beam) #
@@ -1040,9 +1040,10 @@ class Diffractometer(ABC):
             ##########################################################################
             # check for negative pixels, it can happen when subtracting a background #
             ##########################################################################
-            print((data < 0).sum(), " negative data points masked")
-            mask3d[data < 0] = 1
-            data[data < 0] = 0
+            negative_pixels = data < 0
+            print(negative_pixels.sum(), " negative data points masked")
+            mask3d[negative_pixels] = 1
+            data[negative_pixels] = 0
 
         return data, mask3d, monitor, frames_logical.astype(int)
 
@@ -1154,6 +1155,177 @@ class Diffractometer(ABC):
 
         return frame, mask2d, monitor
 
+    def load_frames(
+        self,
+        data,
+        mask2d,
+        monitor,
+        read_frame,
+        detector,
+        loading_roi,
+        nb_workers=1,
+        flatfield=None,
+        background=None,
+        hotpixels=None,
+        normalize="skip",
+        bin_during_loading=False,
+        debugging=False,
+        read_roi=False,
+        read_blocks=False,
+    ):
+        """
+        Load frames, apply corrections to them and store them in the data array.
+
+        Frames can be read and corrected concurrently in a pool of threads, each frame
+        being written directly in the preallocated data array. Each frame updates its
+        own mask, the masks are then merged into mask2d in the order of the frames.
+        The result is therefore independent of the number of workers.
+
+        When read_roi is True, only the region of the detector which is needed is read
+        from the file: the loading ROI, extended to detector.sum_roi if normalize is
+        'sum_roi'. The corrections are then applied to this region only, and mask2d
+        is not updated outside of it.
+
+        :param data: the preallocated 3D data array, output of init_data_mask()
+        :param mask2d: the 2D mask array, output of init_data_mask()
+        :param monitor: the monitor values as a 1D array, output of init_data_mask()
+        :param read_frame: callable taking the index of a data point and returning the
+         raw 2D frame, or a 3D stack of frames (series measurement) which are
+         corrected individually and summed. If read_roi is True, it takes as second
+         argument the region of the detector to read [y_start, y_stop, x_start,
+         x_stop]. If read_blocks is True, the index is replaced by a slice of
+         consecutive data points and it returns a 3D stack with one frame per point.
+        :param detector: an instance of the class Detector
+        :param loading_roi: user-defined region of interest, it may be larger than the
+         physical size of the detector
+        :param nb_workers: number of threads used for loading frames
+        :param flatfield: the 2D flatfield array
+        :param background: the 2D background array to subtract to the data
+        :param hotpixels: the 2D hotpixels array
+        :param normalize: 'monitor' to return the default monitor values, 'sum_roi' to
+         return a monitor based on the integrated intensity in the region of interest
+         defined by detector.sum_roi, 'skip' to do nothing
+        :param bin_during_loading: if True, the data will be binned in the detector
+         frame while loading. It saves a lot of memory space for large 2D detectors.
+        :param debugging: set to True to see plots. Frames are then loaded serially.
+        :param read_roi: True if read_frame can read only a region of the detector
+        :param read_blocks: True if read_frame can read blocks of consecutive data
+         points, not compatible with series measurements
+        :return: the updated data, mask2d and monitor
+        """
+        valid.valid_item(
+            nb_workers, allowed_types=int, min_excluded=0, name="nb_workers"
+        )
+        valid.valid_item(read_roi, allowed_types=bool, name="read_roi")
+        valid.valid_item(read_blocks, allowed_types=bool, name="read_blocks")
+        if debugging:
+            nb_workers = 1  # plots cannot be created from several threads
+
+        # define the region of the detector to be read and corrected
+        if read_roi:
+            region = list(loading_roi)
+            if normalize == "sum_roi":
+                region = [
+                    min(region[0], detector.sum_roi[0]),
+                    max(region[1], detector.sum_roi[1]),
+                    min(region[2], detector.sum_roi[2]),
+                    max(region[3], detector.sum_roi[3]),
+                ]
+            flatfield, background, hotpixels = (
+                None
+                if array is None
+                else array[region[0] : region[1], region[2] : region[3]]
+                for array in (flatfield, background, hotpixels)
+            )
+        else:
+            region = [0, mask2d.shape[0], 0, mask2d.shape[1]]
+        region_shape = (region[1] - region[0], region[3] - region[2])
+        # loading ROI and sum ROI in the frame of the region
+        crop_roi = [
+            loading_roi[0] - region[0],
+            loading_roi[1] - region[0],
+            loading_roi[2] - region[2],
+            loading_roi[3] - region[2],
+        ]
+        sum_roi = [
+            detector.sum_roi[0] - region[0],
+            detector.sum_roi[1] - region[0],
+            detector.sum_roi[2] - region[2],
+            detector.sum_roi[3] - region[2],
+        ]
+
+        nb_points = data.shape[0]
+        if read_blocks:
+            # bound the size of the blocks, keeping enough blocks for all workers
+            block_length = min(
+                -(-nb_points // nb_workers),
+                max(1, 2 ** 22 // (region_shape[0] * region_shape[1])),
+            )
+        else:
+            block_length = 1
+
+        def process_block(start):
+            stop = min(start + block_length, nb_points)
+            points = slice(start, stop) if read_blocks else start
+            raw_frames = read_frame(points, region) if read_roi else read_frame(points)
+            # the raw frames are copied, their type is converted at the same time
+            frames = np.array(raw_frames, dtype=float)
+            if frames.ndim == 2:
+                frames = frames[np.newaxis, :, :]
+            frame_mask = np.zeros(region_shape, dtype=bool)
+            frames, frame_mask = detector.correct_frames(
+                data=frames,
+                mask=frame_mask,
+                flatfield=flatfield,
+                background=background,
+                hotpixels=hotpixels,
+                roi=region if read_roi else None,
+            )
+            if read_blocks:  # one frame per data point
+                frames_per_point = [
+                    frames[idx : idx + 1] for idx in range(stop - start)
+                ]
+            else:  # eventually a series of frames summed in a single data point
+                frames_per_point = [frames]
+
+            for idx, point_frames in zip(range(start, stop), frames_per_point):
+                point_monitor = 0
+                for frame_idx, frame in enumerate(point_frames):
+                    if normalize == "sum_roi":
+                        point_monitor += util.sum_roi(array=frame, roi=sum_roi)
+                    frame = frame[crop_roi[0] : crop_roi[1], crop_roi[2] : crop_roi[3]]
+                    if bin_during_loading:
+                        frame = util.bin_data(
+                            frame,
+                            (detector.binning[1], detector.binning[2]),
+                            debugging=debugging,
+                        )
+                    if frame_idx == 0:
+                        data[idx, :, :] = frame
+                    else:
+                        data[idx, :, :] += frame
+                if normalize == "sum_roi":
+                    monitor[idx] = point_monitor
+            return stop, frame_mask
+
+        starts = range(0, nb_points, block_length)
+        mask_region = mask2d[region[0] : region[1], region[2] : region[3]]
+        if nb_workers == 1:
+            frame_masks = map(process_block, starts)
+            for stop, frame_mask in frame_masks:
+                mask_region[frame_mask] = 1
+                sys.stdout.write("\rLoading frame {:d}".format(stop))
+                sys.stdout.flush()
+        else:
+            with ThreadPool(processes=nb_workers) as pool:
+                # imap yields the results in the order of the frames
+                frame_masks = pool.imap(process_block, starts)
+                for stop, frame_mask in frame_masks:
+                    mask_region[frame_mask] = 1
+                    sys.stdout.write("\rLoading frame {:d}".format(stop))
+                    sys.stdout.flush()
+        return data, mask2d, monitor
+
     @abstractmethod
     def motor_positions(self, setup, **kwargs):
         """
@@ -1510,23 +1682,21 @@ class DiffractometerCRISTAL(Diffractometer):
         )
 
         # loop over frames, mask the detector and normalize / bin
-        for idx in range(nb_img):
-            data[idx, :, :], mask2d, monitor[idx] = self.load_frame(
-                frame=tmp_data[idx, :, :],
-                mask2d=mask2d,
-                monitor=monitor[idx],
-                frames_per_point=1,
-                detector=detector,
-                loading_roi=loading_roi,
-                flatfield=flatfield,
-                background=background,
-                hotpixels=hotpixels,
-                normalize=normalize,
-                bin_during_loading=bin_during_loading,
-                debugging=debugging,
-            )
-            sys.stdout.write("\rLoading frame {:d}".format(idx + 1))
-            sys.stdout.flush()
+        data, mask2d, monitor = self.load_frames(
+            data=data,
+            mask2d=mask2d,
+            monitor=monitor,
+            read_frame=lambda idx: tmp_data[idx, :, :],
+            detector=detector,
+            loading_roi=loading_roi,
+            nb_workers=setup.nb_workers,
+            flatfield=flatfield,
+            background=background,
+            hotpixels=hotpixels,
+            normalize=normalize,
+            bin_during_loading=bin_during_loading,
+            debugging=debugging,
+        )
         return data, mask2d, monitor, loading_roi
 
     def motor_positions(self, setup, **kwargs):
@@ -1901,36 +2071,33 @@ class DiffractometerID01(Diffractometer):
             scan_number=scan_number,
         )
 
-        # loop over frames, mask the detector and normalize / bin
-        for idx in range(nb_img):
+        def read_frame(idx):
             if data_stack is not None:
                 # custom scan with a stacked data loaded
-                ccdraw = data_stack[idx, :, :]
+                return data_stack[idx, :, :]
+            if setup.custom_scan:
+                # custom scan with one file per frame
+                i = int(setup.custom_images[idx])
             else:
-                if setup.custom_scan:
-                    # custom scan with one file per frame
-                    i = int(setup.custom_images[idx])
-                else:
-                    i = int(ccdn[idx])
-                e = fabio.open(ccdfiletmp % i)
-                ccdraw = e.data
+                i = int(ccdn[idx])
+            return fabio.open(ccdfiletmp % i).data
 
-            data[idx, :, :], mask2d, monitor[idx] = self.load_frame(
-                frame=ccdraw,
-                mask2d=mask2d,
-                monitor=monitor[idx],
-                frames_per_point=1,
-                detector=detector,
-                loading_roi=loading_roi,
-                flatfield=flatfield,
-                background=background,
-                hotpixels=hotpixels,
-                normalize=normalize,
-                bin_during_loading=bin_during_loading,
-                debugging=debugging,
-            )
-            sys.stdout.write("\rLoading frame {:d}".format(idx + 1))
-            sys.stdout.flush()
+        # loop over frames, mask the detector and normalize / bin
+        data, mask2d, monitor = self.load_frames(
+            data=data,
+            mask2d=mask2d,
+            monitor=monitor,
+            read_frame=read_frame,
+            detector=detector,
+            loading_roi=loading_roi,
+            nb_workers=setup.nb_workers,
+            flatfield=flatfield,
+            background=background,
+            hotpixels=hotpixels,
+            normalize=normalize,
+            bin_during_loading=bin_during_loading,
+            debugging=debugging,
+        )
         return data, mask2d, monitor, loading_roi
 
     def motor_positions(self, setup, **kwargs):
@@ -2207,10 +2374,12 @@ class DiffractometerNANOMAX(Diffractometer):
         if setup.custom_scan:
             raise NotImplementedError("custom scan not implemented for NANOMAX")
         group_key = list(logfile.keys())[0]  # currently 'entry'
+        # the dataset is not read here, only the region of interest of the frames is
+        # read afterwards, by blocks of frames
         try:
-            tmp_data = logfile["/" + group_key + "/measurement/merlin/frames"][:]
+            tmp_data = logfile["/" + group_key + "/measurement/merlin/frames"]
         except KeyError:
-            tmp_data = logfile["/" + group_key + "measurement/Merlin/data"][()]
+            tmp_data = logfile["/" + group_key + "measurement/Merlin/data"]
 
         # find the number of images
         nb_img = tmp_data.shape[0]
@@ -2225,23 +2394,25 @@ class DiffractometerNANOMAX(Diffractometer):
         )
 
         # loop over frames, mask the detector and normalize / bin
-        for idx in range(nb_img):
-            data[idx, :, :], mask2d, monitor[idx] = self.load_frame(
-                frame=tmp_data[idx, :, :],
-                mask2d=mask2d,
-                monitor=monitor[idx],
-                frames_per_point=1,
-                detector=detector,
-                loading_roi=loading_roi,
-                flatfield=flatfield,
-                background=background,
-                hotpixels=hotpixels,
-                normalize=normalize,
-                bin_during_loading=bin_during_loading,
-                debugging=debugging,
-            )
-            sys.stdout.write("\rLoading frame {:d}".format(idx + 1))
-            sys.stdout.flush()
+        data, mask2d, monitor = self.load_frames(
+            data=data,
+            mask2d=mask2d,
+            monitor=monitor,
+            read_frame=lambda points, roi: tmp_data[
+                points, roi[0] : roi[1], roi[2] : roi[3]
+            ],
+            detector=detector,
+            loading_roi=loading_roi,
+            nb_workers=setup.nb_workers,
+            flatfield=flatfield,
+            background=background,
+            hotpixels=hotpixels,
+            normalize=normalize,
+            bin_during_loading=bin_during_loading,
+            debugging=debugging,
+            read_roi=True,
+            read_blocks=True,
+        )
         return data, mask2d, monitor, loading_roi
 
     def motor_positions(self, setup, **kwargs):
@@ -2441,21 +2612,31 @@ class DiffractometerP10(Diffractometer):
 
             # find the number of images
             # (i.e. points, not including series at each point)
+            # and the location of each point in the data files
             if is_series:
                 nb_img = len(list(h5file["entry/data"]))
+                frame_locations = [
+                    ("data_" + str("{:06d}".format(idx + 1)), slice(None))
+                    for idx in range(nb_img)
+                ]
             else:
                 idx = 0
-                nb_img = 0
+                frame_locations = []
                 while True:
                     data_path = "data_" + str("{:06d}".format(idx + 1))
                     try:
-                        nb_img += len(h5file["entry"]["data"][data_path])
-                        idx += 1
+                        nb_frames = len(h5file["entry"]["data"][data_path])
                     except KeyError:
                         break
+                    frame_locations.extend(
+                        (data_path, frame_idx) for frame_idx in range(nb_frames)
+                    )
+                    idx += 1
+                nb_img = len(frame_locations)
             print("Number of points :", nb_img)
         else:
-            h5file = None  # this will be define directly in the while loop
+            h5file = None  # one data file per point, opened when reading the frame
+            frame_locations = None
             # create the template for the image files
             if len(setup.custom_images) > 0:
                 nb_img = len(setup.custom_images)
@@ -2472,17 +2653,12 @@ class DiffractometerP10(Diffractometer):
             bin_during_loading=bin_during_loading,
         )
 
-        # loop over frames, mask the detector and normalize / bin
-        start_index = 0  # offset when not is_series
-        for point_idx in range(nb_img):
-            idx = 0
-            series_data = []
-            series_monitor = []
+        def read_frame(points, roi):
             if setup.custom_scan:
                 # custom scan with one file per frame/series of frame, no master file in
                 # this case, load directly data files.
-                i = int(setup.custom_images[idx])
-                ccdfiletmp = (
+                i = int(setup.custom_images[points])
+                ccdfile = (
                     detector.rootdir
                     + detector.sample_name
                     + "_{:05d}".format(i)
@@ -2491,65 +2667,55 @@ class DiffractometerP10(Diffractometer):
                     + "_{:05d}".format(i)
                     + detector.template_file
                 )
-                h5file = h5py.File(ccdfiletmp, "r")  # load the data file
-                data_path = "data_000001"
-            else:
-                # normal scan, h5file is in this case the master .h5 file
-                data_path = "data_" + str("{:06d}".format(point_idx + 1))
-
-            while True:
-                try:
-                    try:
-                        tmp_data = h5file["entry"]["data"][data_path][idx]
-                    except OSError:
-                        raise OSError("hdf5plugin is not installed")
-
-                    # a single frame from the (eventual) series is loaded
-                    ccdraw, mask2d, temp_mon = self.load_frame(
-                        frame=tmp_data,
-                        mask2d=mask2d,
-                        monitor=monitor[idx],
-                        frames_per_point=1,
-                        detector=detector,
-                        loading_roi=loading_roi,
-                        flatfield=flatfield,
-                        background=background,
-                        hotpixels=hotpixels,
-                        normalize=normalize,
-                        bin_during_loading=bin_during_loading,
-                        debugging=debugging,
-                    )
-                    series_data.append(ccdraw)
-                    series_monitor.append(temp_mon)
-
-                    if not is_series:
-                        sys.stdout.write(
-                            "\rLoading frame {:d}".format(start_index + idx + 1)
-                        )
-                        sys.stdout.flush()
-                    idx = idx + 1
-                except IndexError:  # reached the end of the series
-                    break
-                except ValueError:  # something went wrong
-                    break
-            if is_series:
-                data[point_idx, :, :] = np.asarray(series_data).sum(axis=0)
-                if normalize == "sum_roi":
-                    monitor[point_idx] = np.asarray(series_monitor).sum()
-                sys.stdout.write("\rSeries: loading frame {:d}".format(point_idx + 1))
-                sys.stdout.flush()
-            else:
-                tempdata_length = len(series_data)
-                data[start_index : start_index + tempdata_length, :, :] = np.asarray(
-                    series_data
-                )
-                if normalize == "sum_roi":
-                    monitor[start_index : start_index + tempdata_length] = np.asarray(
-                        series_monitor
+                with h5py.File(ccdfile, "r") as datafile:
+                    dataset = datafile["entry"]["data"]["data_000001"]
+                    return dataset[
+                        slice(None) if is_series else 0,
+                        roi[0] : roi[1],
+                        roi[2] : roi[3],
+                    ]
+            # normal scan, h5file is in this case the master .h5 file
+            try:
+                if is_series:
+                    data_path, location = frame_locations[points]
+                    return h5file["entry"]["data"][data_path][
+                        location, roi[0] : roi[1], roi[2] : roi[3]
+                    ]
+                # block of consecutive frames, eventually spread over several files
+                blocks = []
+                for data_path, locations in groupby(
+                    frame_locations[points], key=lambda location: location[0]
+                ):
+                    frame_indices = [location[1] for location in locations]
+                    blocks.append(
+                        h5file["entry"]["data"][data_path][
+                            frame_indices[0] : frame_indices[-1] + 1,
+                            roi[0] : roi[1],
+                            roi[2] : roi[3],
+                        ]
                     )
-                start_index += tempdata_length
-                if start_index == nb_img:
-                    break
+                return np.concatenate(blocks)
+            except OSError:
+                raise OSError("hdf5plugin is not installed")
+
+        # loop over frames (or series of frames), mask the detector and normalize / bin
+        data, mask2d, monitor = self.load_frames(
+            data=data,
+            mask2d=mask2d,
+            monitor=monitor,
+            read_frame=read_frame,
+            detector=detector,
+            loading_roi=loading_roi,
+            nb_workers=setup.nb_workers,
+            flatfield=flatfield,
+            background=background,
+            hotpixels=hotpixels,
+            normalize=normalize,
+            bin_during_loading=bin_during_loading,
+            debugging=debugging,
+            read_roi=True,
+            read_blocks=not (setup.custom_scan or is_series),
+        )
         return data, mask2d, monitor, loading_roi
 
     def motor_positions(self, setup, **kwargs):
@@ -2901,52 +3067,70 @@ class DiffractometerSIXS(Diffractometer):
         # load the data
         if setup.custom_scan:
             raise NotImplementedError("custom scan not implemented for NANOMAX")
-        if detector.name == "Merlin":
-            tmp_data = logfile.merlin[:]
-        else:  # Maxipix
-            if setup.beamline == "SIXS_2018":
-                tmp_data = logfile.mfilm[:]
-            else:
-                try:
-                    tmp_data = logfile.mpx_image[:]
-                except AttributeError:
+        try:
+            # the stack of images is not copied in memory, if the logfile was opened
+            # in lazy mode only the region of interest of the frames is read from the
+            # file, by blocks of frames
+            if detector.name == "Merlin":
+                tmp_data = logfile.merlin
+            else:  # Maxipix
+                if setup.beamline == "SIXS_2018":
+                    tmp_data = logfile.mfilm
+                else:
                     try:
-                        tmp_data = logfile.maxpix[:]
+                        tmp_data = logfile.mpx_image
                     except AttributeError:
-                        # the alias dictionnary was probably not provided
-                        tmp_data = logfile.image[:]
+                        try:
+                            tmp_data = logfile.maxpix
+                        except AttributeError:
+                            # the alias dictionnary was probably not provided
+                            tmp_data = logfile.image
 
-        # find the number of images
-        nb_img = tmp_data.shape[0]
+            # find the number of images
+            nb_img = tmp_data.shape[0]
 
-        # initialize arrays and loading ROI
-        data, mask2d, monitor, loading_roi = self.init_data_mask(
-            detector=detector,
-            setup=setup,
-            logfile=logfile,
-            normalize=normalize,
-            nb_frames=nb_img,
-            bin_during_loading=bin_during_loading,
-        )
+            # initialize arrays and loading ROI
+            data, mask2d, monitor, loading_roi = self.init_data_mask(
+                detector=detector,
+                setup=setup,
+                logfile=logfile,
+                normalize=normalize,
+                nb_frames=nb_img,
+                bin_during_loading=bin_during_loading,
+            )
 
-        # loop over frames, mask the detector and normalize / bin
-        for idx in range(nb_img):
-            data[idx, :, :], mask2d, monitor[idx] = self.load_frame(
-                frame=tmp_data[idx, :, :],
+            # PyTables is not thread-safe, serialize the reads from the file
+            file_lock = threading.Lock()
+
+            def read_frame(points, roi):
+                with file_lock:
+                    return np.asarray(
+                        tmp_data[points, roi[0] : roi[1], roi[2] : roi[3]]
+                    )
+
+            # loop over frames, mask the detector and normalize / bin
+            data, mask2d, monitor = self.load_frames(
+                data=data,
                 mask2d=mask2d,
-                monitor=monitor[idx],
-                frames_per_point=1,
+                monitor=monitor,
+                read_frame=read_frame,
                 detector=detector,
                 loading_roi=loading_roi,
+                nb_workers=setup.nb_workers,
                 flatfield=flatfield,
                 background=background,
                 hotpixels=hotpixels,
                 normalize=normalize,
                 bin_during_loading=bin_during_loading,
                 debugging=debugging,
+                read_roi=True,
+                read_blocks=True,
             )
-            sys.stdout.write("\rLoading frame {:d}".format(idx + 1))
-            sys.stdout.flush()
+        finally:
+            if setup.beamline == "SIXS_2019":
+                # release the file kept open by the logfile in lazy mode, also if
+                # the loading failed
+                logfile.close()
         return data, mask2d, monitor, loading_roi
 
     def motor_positions(self, setup, **kwargs):
@@ -2961,17 +3145,22 @@ class DiffractometerSIXS(Diffractometer):
         """
         logfile = kwargs["logfile"]
         if not setup.custom_scan:
-            mu = logfile.mu[:]  # scanned
-            delta = logfile.delta[0]  # not scanned
-            gamma = logfile.gamma[0]  # not scanned
             try:
-                beta = logfile.basepitch[0]  # not scanned
-            except AttributeError:  # data recorder changed after 11/03/2019
+                mu = logfile.mu[:]  # scanned
+                delta = logfile.delta[0]  # not scanned
+                gamma = logfile.gamma[0]  # not scanned
                 try:
-                    beta = logfile.beta[0]  # not scanned
-                except AttributeError:
-                    # the alias dictionnary was probably not provided
-                    beta = 0
+                    beta = logfile.basepitch[0]  # not scanned
+                except AttributeError:  # data recorder changed after 11/03/2019
+                    try:
+                        beta = logfile.beta[0]  # not scanned
+                    except AttributeError:
+                        # the alias dictionnary was probably not provided
+                        beta = 0
+            finally:
+                if setup.beamline == "SIXS_2019":
+                    # release the file kept open by the logfile in lazy mode
+                    logfile.close()
 
             # remove user-defined sample offsets (sample: beta, mu)
             beta = beta - self.sample_offsets[0]
@@ -18,13 +18,17 @@ from collections.abc import Sequence
 import datetime
 import gc
 import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
 from numbers import Real, Integral
 import numpy as np
+import os
 from scipy.interpolate import griddata, RegularGridInterpolator
 import sys
 import time
 from ..graph import graph_utils as gu
 from ..utils import utilities as util
+from ..utils.interpolation_plan import InterpolationPlan
+from ..utils.scatter_gridder import ScatterGridder
 from ..utils import validation as valid
 from .diffractometer import create_diffractometer
 from .beamline import create_beamline
@@ -79,6 +83,10 @@ class Setup:
      - 'actuators': optional dictionary that can be used to define the entries
        corresponding to actuators in data files (useful at CRISTAL where the location
        of data keeps changing)
+     - 'is_series': boolean, True for series measurement at P10 (several frames per
+       point).
+     - 'nb_workers': number of threads used for loading and correcting detector
+       frames, 1 by default.
 
     """
 
@@ -123,6 +131,7 @@ class Setup:
                 "offset_inplane",
                 "actuators",
                 "is_series",
+                "nb_workers",
             },
             name="Setup.__init__",
         )
@@ -143,6 +152,8 @@ class Setup:
         self.offset_inplane = kwargs.get("offset_inplane", 0)
         # kwargs for series (several frames per point) at P10
         self.is_series = kwargs.get("is_series", False)  # boolean
+        # number of threads used for loading and correcting frames
+        self.nb_workers = kwargs.get("nb_workers", 1)
         # load positional arguments corresponding to instance properties
         self.beamline = beamline
         self.detector = detector
@@ -161,6 +172,10 @@ class Setup:
             sample_offsets=sample_offsets,
         )
 
+        # interpolation plans of the last orthogonalization, reused for the next calls
+        # with the same geometry
+        self._interpolation_plans = {}
+
     @property
     def actuators(self):
         """
@@ -542,6 +557,16 @@ class Setup:
             raise TypeError(f"is_series should be a boolean, got {type(val)}")
         self._is_series = val
 
+    @property
+    def nb_workers(self):
+        """Number of threads used for loading and correcting detector frames."""
+        return self._nb_workers
+
+    @nb_workers.setter
+    def nb_workers(self, value):
+        valid.valid_item(value, allowed_types=int, min_excluded=0, name="nb_workers")
+        self._nb_workers = value
+
     @property
     def outofplane_angle(self):
         """Vertical detector angle, in degrees."""
@@ -594,6 +619,7 @@ class Setup:
             "offset_inplane_deg": self.offset_inplane,
             "wavelength_m": self.wavelength,
             "is_series": self.is_series,
+            "nb_workers": self.nb_workers,
         }
 
     @property
@@ -672,9 +698,139 @@ class Setup:
             f"sample_inplane={self.sample_inplane}, "
             f"sample_outofplane={self.sample_outofplane}, "
             f"offset_inplane={self.offset_inplane}, "
-            f"is_series={self.is_series})"
+            f"is_series={self.is_series}, "
+            f"nb_workers={self.nb_workers})"
         )
 
+    def _get_interpolation_plan(
+        self,
+        name,
+        input_shape,
+        output_axes,
+        matrix,
+        plan_file=None,
+        memory_budget=None,
+        verbose=False,
+    ):
+        """
+        Get the interpolation plan for an orthogonalization.
+
+        The plan of the previous call with the same name is reused if the geometry did
+        not change, otherwise it is loaded from plan_file if compatible, or calculated
+        and optionally saved to plan_file. If a memory budget is provided, the plan is
+        not precomputed but calculated slab by slab during the interpolation: the
+        precomputed indices and weights of a reused plan are discarded, and they are
+        not loaded from plan_file.
+
+        :param name: name of the orthogonalization, key of the plan cache
+        :param input_shape: shape of the arrays to be interpolated
+        :param output_axes: tuple of three 1D arrays, coordinates of the nodes of the
+         output grid along each array axis
+        :param matrix: 3x3 array transforming output coordinates into the voxel
+         coordinates of the input arrays, in the order of the array axes
+        :param plan_file: optional path of a npz file where to load/save the plan
+        :param memory_budget: maximum memory in bytes used by the temporary arrays of
+         the interpolation of one slab of the output grid
+        :param verbose: True to have printed comments
+        :return: an instance of InterpolationPlan
+        """
+        plan = self._interpolation_plans.get(name)
+        if plan is not None and plan.is_compatible(input_shape, output_axes, matrix):
+            if verbose:
+                print("Reusing the interpolation plan of the previous call")
+            plan.memory_budget = memory_budget
+            if memory_budget is not None:
+                plan.discard_precomputed()
+            return plan
+
+        plan = None
+        if plan_file is not None and os.path.isfile(plan_file):
+            plan = InterpolationPlan.load(
+                plan_file,
+                memory_budget=memory_budget,
+                precompute=memory_budget is None,
+            )
+            if plan.is_compatible(input_shape, output_axes, matrix):
+                if verbose:
+                    print(f"Interpolation plan loaded from {plan_file}")
+            else:
+                if verbose:
+                    print(f"The interpolation plan in {plan_file} is not compatible")
+                plan = None
+
+        if plan is None:
+            plan = InterpolationPlan(
+                input_shape=input_shape,
+                output_axes=output_axes,
+                matrix=matrix,
+                precompute=memory_budget is None,
+                memory_budget=memory_budget,
+            )
+            if plan_file is not None:
+                plan.save(plan_file)
+                if verbose:
+                    print(f"Interpolation plan saved to {plan_file}")
+        self._interpolation_plans[name] = plan
+        return plan
+
+    @staticmethod
+    def _polar_weights(
+        rotation_angle, direct_beam, number_x, interp_angle, interp_radius
+    ):
+        """
+        Calculate the bilinear interpolation weights of a slice in polar coordinates.
+
+        The slices perpendicular to the rotation axis are sampled on a regular grid of
+        rotation angles and radii. The weights follow the convention of
+        RegularGridInterpolator(method="linear", bounds_error=False).
+
+        :param rotation_angle: increasing array of rotation angles in degrees
+        :param direct_beam: position in pixels of the rotation pivot in the direction
+         perpendicular to the rotation axis
+        :param number_x: number of pixels in the direction perpendicular to the
+         rotation axis
+        :param interp_angle: 2D array, polar angles for the interpolation
+        :param interp_radius: 2D array, polar radii for the interpolation
+        :return:
+
+         - an array of shape (4, interp_angle.size), for each corner of the grid cell
+           enclosing an interpolation point its flat index in the (angle, radius)
+           slice
+         - an array of shape (4, interp_angle.size), the corresponding weights
+         - a 1D boolean array, True for the points outside of the grid
+         - a 1D boolean array, True for the points with nan coordinates
+
+        """
+        grids = (
+            rotation_angle * np.pi / 180,
+            np.arange(-direct_beam, -direct_beam + number_x, 1),
+        )
+        points = (interp_angle.ravel(), interp_radius.ravel())
+        indices = []
+        distances = []
+        outside = np.zeros(interp_angle.size, dtype=bool)
+        for grid, coordinates in zip(grids, points):
+            lower = np.searchsorted(grid, coordinates) - 1
+            lower = np.clip(lower, 0, grid.size - 2)
+            indices.append(lower)
+            distances.append(
+                (coordinates - grid[lower]) / (grid[lower + 1] - grid[lower])
+            )
+            outside |= np.logical_or(coordinates < grid[0], coordinates > grid[-1])
+        nans = np.logical_or(np.isnan(points[0]), np.isnan(points[1]))
+
+        flat_indices = []
+        weights = []
+        for angle_offset, radius_offset in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            flat_indices.append(
+                (indices[0] + angle_offset) * number_x + indices[1] + radius_offset
+            )
+            weights.append(
+                (distances[0] if angle_offset else 1 - distances[0])
+                * (distances[1] if radius_offset else 1 - distances[1])
+            )
+        return np.array(flat_indices), np.array(weights), outside, nans
+
     def calc_qvalues_xrutils(self, logfile, hxrd, nb_frames, **kwargs):
         """
         Calculate the 3D q values of the BCDI scan using xrayutilities.
@@ -824,51 +980,20 @@ class Setup:
         ################################################
         # interpolate the data into the detector frame #
         ################################################
-        myz, myy, myx = np.meshgrid(
-            np.arange(-nbz // 2, nbz // 2, 1),
-            np.arange(-nby // 2, nby // 2, 1),
-            np.arange(-nbx // 2, nbx // 2, 1),
-            indexing="ij",
-        )
-
-        new_x = (
-            ortho_matrix[0, 0] * myx
-            + ortho_matrix[0, 1] * myy
-            + ortho_matrix[0, 2] * myz
-        )
-        new_y = (
-            ortho_matrix[1, 0] * myx
-            + ortho_matrix[1, 1] * myy
-            + ortho_matrix[1, 2] * myz
-        )
-        new_z = (
-            ortho_matrix[2, 0] * myx
-            + ortho_matrix[2, 1] * myy
-            + ortho_matrix[2, 2] * myz
-        )
-        del myx, myy, myz
-        # la partie rgi est sure: c'est la taille de l'objet orthogonal de depart
-        rgi = RegularGridInterpolator(
-            (
-                np.arange(-nbz // 2, nbz // 2) * voxel_size[0],
-                np.arange(-nby // 2, nby // 2) * voxel_size[1],
-                np.arange(-nbx // 2, nbx // 2) * voxel_size[2],
+        # the detector voxel of coordinates r (in the order x y z) takes the value of
+        # the orthogonal object at the position ortho_matrix * r, expressed here in
+        # voxels of the object and in the order of the array axes
+        plan = InterpolationPlan(
+            input_shape=(nbz, nby, nbx),
+            output_axes=(
+                np.arange(-nbz // 2, nbz // 2, 1),
+                np.arange(-nby // 2, nby // 2, 1),
+                np.arange(-nbx // 2, nbx // 2, 1),
             ),
-            obj,
-            method="linear",
-            bounds_error=False,
-            fill_value=0,
+            matrix=ortho_matrix[::-1, ::-1] / np.asarray(voxel_size)[:, np.newaxis],
+            precompute=False,
         )
-        detector_obj = rgi(
-            np.concatenate(
-                (
-                    new_z.reshape((1, new_z.size)),
-                    new_y.reshape((1, new_z.size)),
-                    new_x.reshape((1, new_z.size)),
-                )
-            ).transpose()
-        )
-        detector_obj = detector_obj.reshape((nbz, nby, nbx)).astype(obj.dtype)
+        detector_obj = plan.apply(obj, fill_value=0).astype(obj.dtype)
 
         if debugging:
             gu.multislices_plot(
@@ -896,8 +1021,12 @@ class Setup:
         """
         Interpolate a tomographic dataset onto cartesian coordinates.
 
-        The initial 3D array is in cylindrical coordinates. There is no benefit from
-        multiprocessing, the data transfers are the limiting factor.
+        The initial 3D array is in cylindrical coordinates. The interpolation points
+        are the same in all slices perpendicular to the rotation axis, the bilinear
+        interpolation weights are therefore calculated once and applied to blocks of
+        contiguous slices. With multiprocessing, the blocks are processed in a pool of
+        threads which read the input array and write the output array in place, no
+        data is copied between workers.
 
         :param array: 3D array of intensities measured in the detector frame
         :param rotation_angle: array, rotation angle values for the rocking scan
@@ -910,34 +1039,11 @@ class Setup:
         :param fill_value: real number (np.nan allowed), fill_value parameter for the
          RegularGridInterpolator
         :param comment: a comment to be printed
-        :param multiprocessing: True to use multiprocessing
+        :param multiprocessing: True to process blocks of slices in parallel
         :return: the 3D array interpolated onto the 3D cartesian grid
         """
         valid.valid_ndarray(arrays=array, ndim=3)
 
-        def collect_result(result):
-            """
-            Process the result after asynchronous multiprocessing.
-
-            This callback function updates global arrays.
-
-            :param result: the output of interp_slice, containing the 2d interpolated
-             slice and the slice index
-            """
-            nonlocal interp_array, number_y, slices_done
-            slices_done = slices_done + 1
-            # result is a tuple: data, mask, counter, file_index
-            # stack the 2D interpolated frame along the rotation axis,
-            # taking into account the flip of the detector Y axis (pointing down)
-            # compare to the laboratory frame vertical axis (pointing up)
-            interp_array[:, number_y - (result[1] + 1), :] = result[0]
-            sys.stdout.write(
-                "\r    gridding progress: {:d}%".format(
-                    int(slices_done / number_y * 100)
-                )
-            )
-            sys.stdout.flush()
-
         rotation_step = rotation_angle[1] - rotation_angle[0]
         if rotation_step < 0:
             # flip rotation_angle and the data accordingly, RegularGridInterpolator
@@ -945,76 +1051,69 @@ class Setup:
             rotation_angle = np.flip(rotation_angle)
             array = np.flip(array, axis=0)
 
-        _, number_y, _ = array.shape
+        nb_angles, number_y, number_x = array.shape
         _, numx = interp_angle.shape  # data shape is (numx, numx) by construction
         interp_array = np.zeros((numx, number_y, numx), dtype=array.dtype)
-        slices_done = 0
 
-        start = time.time()
+        # interpolation weights, identical for all slices
+        flat_indices, weights, outside, nans = self._polar_weights(
+            rotation_angle=rotation_angle,
+            direct_beam=direct_beam,
+            number_x=number_x,
+            interp_angle=interp_angle,
+            interp_radius=interp_radius,
+        )
+
         if multiprocessing:
-            print(
-                "\nGridding",
-                comment,
-                ", number of processors used: ",
-                min(mp.cpu_count(), number_y),
-            )
-            mp.freeze_support()
-            pool = mp.Pool(
-                processes=min(mp.cpu_count(), number_y)
-            )  # use this number of processesu
-
-            for idx in range(number_y):
-                pool.apply_async(
-                    self.interp_2dslice,
-                    args=(
-                        array[:, idx, :],
-                        idx,
-                        rotation_angle,
-                        direct_beam,
-                        interp_angle,
-                        interp_radius,
-                        fill_value,
-                    ),
-                    callback=collect_result,
-                    error_callback=util.catch_error,
-                )
-                # interp_2dslice must be a pickable object,
-                # i.e. defined at the top level of the module
+            nb_workers = min(mp.cpu_count(), number_y)
+            print("\nGridding", comment, ", number of threads used: ", nb_workers)
+        else:
+            nb_workers = 1
+            print("\nGridding", comment, ", no multiprocessing")
+        # bound the size of the temporary arrays, keeping enough blocks for all workers
+        block_length = min(-(-number_y // nb_workers), max(1, 2 ** 22 // (numx * numx)))
 
-            pool.close()
-            pool.join()
-            # postpones the execution of next line of code until all processes
-            # in the queue are done.
+        def grid_block(start):
+            """
+            Interpolate a block of contiguous slices and write it in interp_array.
 
-        else:  # no multiprocessing
-            print("\nGridding", comment, ", no multiprocessing")
-            for idx in range(
-                number_y
-            ):  # loop over 2D frames perpendicular to the rotation axis
-                temp_array, _ = self.interp_2dslice(
-                    array=array[:, idx, :],
-                    slice_index=idx,
-                    rotation_angle=rotation_angle,
-                    direct_beam=direct_beam,
-                    interp_angle=interp_angle,
-                    interp_radius=interp_radius,
-                    fill_value=fill_value,
-                )
+            :param start: index of the first slice of the block along the rotation axis
+            :return: the index of the last slice of the block, excluded
+            """
+            stop = min(start + block_length, number_y)
+            # slices (angle, radius) of the block, flattened
+            block = np.ascontiguousarray(
+                np.moveaxis(array[:, start:stop, :], 1, 0)
+            ).reshape((stop - start, nb_angles * number_x))
+            if not np.issubdtype(block.dtype, np.inexact):
+                block = block.astype(float)
+            result = 0.0
+            for corner_indices, corner_weights in zip(flat_indices, weights):
+                result = result + block[:, corner_indices] * corner_weights
+            result[:, outside] = fill_value
+            result[:, nans] = np.nan
+            # stack the 2D interpolated frames along the rotation axis,
+            # taking into account the flip of the detector Y axis (pointing down)
+            # compare to the laboratory frame vertical axis (pointing up)
+            interp_array[:, number_y - stop : number_y - start, :] = np.moveaxis(
+                result.reshape((stop - start, numx, numx))[::-1], 0, 1
+            )
+            return stop
 
-                # stack the 2D interpolated frame along the rotation axis,
-                # taking into account the flip of the
-                # detector Y axis (pointing down) compare to the laboratory frame
-                # vertical axis (pointing up)
-                interp_array[:, number_y - (idx + 1), :] = temp_array
+        starts = range(0, number_y, block_length)
+        start_time = time.time()
+        with ThreadPool(processes=nb_workers) as pool:
+            # imap yields the results in the order of the blocks
+            for stop in pool.imap(grid_block, starts):
                 sys.stdout.write(
-                    "\rGridding progress: {:d}%".format(int((idx + 1) / number_y * 100))
+                    "\rGridding progress: {:d}%".format(int(stop / number_y * 100))
                 )
                 sys.stdout.flush()
 
-        end = time.time()
+        end_time = time.time()
         print(
             "\nTime ellapsed for gridding data:",
-            str(datetime.timedelta(seconds=int(end - start))),
+            str(datetime.timedelta(seconds=int(end_time - start_time))),
         )
         return interp_array
 
@@ -1230,6 +1329,8 @@ class Setup:
         fill_value=0,
         correct_curvature=False,
         debugging=False,
+        gridder="griddata",
+        fill_holes=False,
     ):
         """
         Interpolate forward CDI data in the laboratory frame.
@@ -1240,8 +1341,13 @@ class Setup:
         :param fill_value: tuple of real numbers (np.nan allowed), fill_value parameter
          for the RegularGridInterpolator, same length as the number of arrays
         :param correct_curvature: bool, True to take into account the curvature of the
-         Ewald sphere (uses griddata, very slow)
+         Ewald sphere
         :param debugging: bool, True to see more plots
+        :param gridder: method used when correct_curvature is True, "griddata" to
+         interpolate the data with scipy.interpolate.griddata (very slow), "nearest"
+         or "linear" to spread the data onto the grid with a scatter-add
+        :param fill_holes: True to fill the empty voxels of the grid with the average
+         of their neighbours, used only with the "nearest" and "linear" gridders
         :return:
          - an array (if a single array was provided) or a tuple of arrays interpolated
            on an orthogonal grid (same length as the number of input arrays)
@@ -1293,6 +1399,8 @@ class Setup:
                 direct_beam=(directbeam_y, directbeam_x),
                 cdi_angle=cdi_angle,
                 fill_value=fill_value,
+                gridder=gridder,
+                fill_holes=fill_holes,
             )
         else:
             arrays, q_values = self.transformation_cdi(
@@ -1348,6 +1456,8 @@ class Setup:
            the initial array
          - width_x: size of the area to plot in x (axis 2), centered on the middle of
            the initial array
+         - 'plan_file': path of a npz file where to load/save the interpolation plan,
+           in order to reuse it for other reconstructions with the same geometry
 
         :return:
 
@@ -1369,7 +1479,7 @@ class Setup:
         #########################
         valid.valid_kwargs(
             kwargs=kwargs,
-            allowed_kwargs={"title", "width_z", "width_y", "width_x"},
+            allowed_kwargs={"title", "width_z", "width_y", "width_x", "plan_file"},
             name="kwargs",
         )
         title = kwargs.get("title", ("Object",) * nb_arrays)
@@ -1406,6 +1516,10 @@ class Setup:
             allow_none=True,
             name="width_x",
         )
+        plan_file = kwargs.get("plan_file")
+        valid.valid_container(
+            plan_file, container_types=str, allow_none=True, name="plan_file"
+        )
 
         #########################
         # check some parameters #
@@ -1577,29 +1691,9 @@ class Setup:
         # the extent of the data after transformation  #
         ################################################
 
-        # calculate the voxel coordinates of the data points in the laboratory frame
-        myz, myy, myx = np.meshgrid(
-            np.arange(-input_shape[0] // 2, input_shape[0] // 2, 1),
-            np.arange(-input_shape[1] // 2, input_shape[1] // 2, 1),
-            np.arange(-input_shape[2] // 2, input_shape[2] // 2, 1),
-            indexing="ij",
-        )
-
-        pos_along_x = (
-            transfer_matrix[0, 0] * myx
-            + transfer_matrix[0, 1] * myy
-            + transfer_matrix[0, 2] * myz
-        )
-        pos_along_y = (
-            transfer_matrix[1, 0] * myx
-            + transfer_matrix[1, 1] * myy
-            + transfer_matrix[1, 2] * myz
-        )
-        pos_along_z = (
-            transfer_matrix[2, 0] * myx
-            + transfer_matrix[2, 1] * myy
-            + transfer_matrix[2, 2] * myz
-        )
+        # the transformation is linear, the extent of the positions of the data
+        # points is calculated from the corners of the detector grid
+        extent = util.transformed_extent(transfer_matrix, shape=input_shape[::-1])
 
         if verbose:
             print(
@@ -1612,45 +1706,36 @@ class Setup:
             )
         # these positions are not equally spaced,
         # we just extract the data extent from them
-        nx_output = int(np.rint((pos_along_x.max() - pos_along_x.min()) / d_along_x))
-        ny_output = int(np.rint((pos_along_y.max() - pos_along_y.min()) / d_along_y))
-        nz_output = int(np.rint((pos_along_z.max() - pos_along_z.min()) / d_along_z))
+        nx_output = int(np.rint(extent[0] / d_along_x))
+        ny_output = int(np.rint(extent[1] / d_along_y))
+        nz_output = int(np.rint(extent[2] / d_along_z))
 
         # add some margin to the output shape for easier visualization
         nx_output += 10
         ny_output += 10
         nz_output += 10
 
-        #########################################
-        # calculate the interpolation positions #
-        #########################################
-        myz, myy, myx = np.meshgrid(
-            np.arange(-nz_output // 2, nz_output // 2, 1) * voxel_size[0],
-            np.arange(-ny_output // 2, ny_output // 2, 1) * voxel_size[1],
-            np.arange(-nx_output // 2, nx_output // 2, 1) * voxel_size[2],
-            indexing="ij",
-        )
-
+        ##########################################
+        # calculate the interpolation plan, the  #
+        # same plan is used for all input arrays #
+        ##########################################
         # ortho_matrix is the transformation matrix from the detector
         # coordinates to the laboratory frame
-        # in RGI, we want to calculate the coordinates that would have
+        # for the interpolation, we want to calculate the coordinates that would have
         # a grid of the laboratory frame expressed in the
         # detector frame, i.e. one has to inverse the transformation matrix.
         transfer_imatrix = np.linalg.inv(transfer_matrix)
-        new_x = (
-            transfer_imatrix[0, 0] * myx
-            + transfer_imatrix[0, 1] * myy
-            + transfer_imatrix[0, 2] * myz
-        )
-        new_y = (
-            transfer_imatrix[1, 0] * myx
-            + transfer_imatrix[1, 1] * myy
-            + transfer_imatrix[1, 2] * myz
-        )
-        new_z = (
-            transfer_imatrix[2, 0] * myx
-            + transfer_imatrix[2, 1] * myy
-            + transfer_imatrix[2, 2] * myz
+        plan = self._get_interpolation_plan(
+            name="ortho_directspace",
+            input_shape=input_shape,
+            output_axes=(
+                np.arange(-nz_output // 2, nz_output // 2, 1) * voxel_size[0],
+                np.arange(-ny_output // 2, ny_output // 2, 1) * voxel_size[1],
+                np.arange(-nx_output // 2, nx_output // 2, 1) * voxel_size[2],
+            ),
+            matrix=transfer_imatrix[::-1, ::-1],  # xyz to array axes order
+            plan_file=plan_file,
+            verbose=verbose,
         )
 
         ######################
@@ -1658,27 +1743,7 @@ class Setup:
         ######################
         output_arrays = []
         for idx, array in enumerate(arrays):
-            rgi = RegularGridInterpolator(
-                (
-                    np.arange(-input_shape[0] // 2, input_shape[0] // 2, 1),
-                    np.arange(-input_shape[1] // 2, input_shape[1] // 2, 1),
-                    np.arange(-input_shape[2] // 2, input_shape[2] // 2, 1),
-                ),
-                array,
-                method="linear",
-                bounds_error=False,
-                fill_value=fill_value[idx],
-            )
-            ortho_array = rgi(
-                np.concatenate(
-                    (
-                        new_z.reshape((1, new_z.size)),
-                        new_y.reshape((1, new_z.size)),
-                        new_x.reshape((1, new_z.size)),
-                    )
-                ).transpose()
-            )
-            ortho_array = ortho_array.reshape((nz_output, ny_output, nx_output)).astype(
+            ortho_array = plan.apply(array, fill_value=fill_value[idx]).astype(
                 array.dtype
             )
             output_arrays.append(ortho_array)
@@ -1754,6 +1819,14 @@ class Setup:
            the middle of the initial array
          - width_x: size of the area to plot in x (axis 2), centered on
            the middle of the initial array
+         - 'plan_file': path of a npz file where to load/save the interpolation plan,
+           in order to reuse it for other datasets with the same geometry
+         - 'memory_budget': maximum memory in bytes used by the temporary arrays of
+           the interpolation. If provided, the output is calculated slab by slab
+           along axis 0 and the interpolation plan is not kept in memory.
+         - 'memmap_dir': path of a directory where to save the output arrays as
+           memory-mapped .npy files (one file per array, named
+           'ortho_reciprocal_<index>.npy'), for arrays not fitting in memory
 
         :return:
 
@@ -1771,7 +1844,16 @@ class Setup:
         #########################
         valid.valid_kwargs(
             kwargs=kwargs,
-            allowed_kwargs={"title", "scale", "width_z", "width_y", "width_x"},
+            allowed_kwargs={
+                "title",
+                "scale",
+                "width_z",
+                "width_y",
+                "width_x",
+                "plan_file",
+                "memory_budget",
+                "memmap_dir",
+            },
             name="kwargs",
         )
         title = kwargs.get("title", ("Object",) * nb_arrays)
@@ -1817,6 +1899,24 @@ class Setup:
             allow_none=True,
             name="width_x",
         )
+        plan_file = kwargs.get("plan_file")
+        valid.valid_container(
+            plan_file, container_types=str, allow_none=True, name="plan_file"
+        )
+        memory_budget = kwargs.get("memory_budget")
+        valid.valid_item(
+            memory_budget,
+            allowed_types=Real,
+            min_excluded=0,
+            allow_none=True,
+            name="memory_budget",
+        )
+        memmap_dir = kwargs.get("memmap_dir")
+        valid.valid_container(
+            memmap_dir, container_types=str, allow_none=True, name="memmap_dir"
+        )
+        if memmap_dir is not None and not os.path.isdir(memmap_dir):
+            raise ValueError(f"The directory {memmap_dir} does not exist")
 
         #########################
         # check some parameters #
@@ -1873,29 +1973,14 @@ class Setup:
         # the extent of the data after transformation  #
         ################################################
 
-        # calculate the q coordinates of the data points in the laboratory frame
-        myz, myy, myx = np.meshgrid(
-            np.arange(-nbz // 2, nbz // 2, 1),
-            np.arange(-nby // 2, nby // 2, 1),
-            np.arange(-nbx // 2, nbx // 2, 1),
-            indexing="ij",
+        # the transformation is linear, the extent of the q coordinates of the data
+        # points is calculated from the corners of the detector grid
+        q_extent = util.transformed_extent(transfer_matrix, shape=(nbx, nby, nbz))
+        # voxel coordinates of the center of the array (in the order x y z)
+        center = np.array(
+            [-nbx // 2 + nbx // 2, -nby // 2 + nby // 2, -nbz // 2 + nbz // 2]
         )
 
-        q_along_x = (
-            transfer_matrix[0, 0] * myx
-            + transfer_matrix[0, 1] * myy
-            + transfer_matrix[0, 2] * myz
-        )
-        q_along_y = (
-            transfer_matrix[1, 0] * myx
-            + transfer_matrix[1, 1] * myy
-            + transfer_matrix[1, 2] * myz
-        )
-        q_along_z = (
-            transfer_matrix[2, 0] * myx
-            + transfer_matrix[2, 1] * myy
-            + transfer_matrix[2, 2] * myz
-        )
         if verbose:
             print(
                 "\nInterpolating:"
@@ -1903,9 +1988,9 @@ class Setup:
                 f"({dq_along_z:.5f} 1/nm, {dq_along_y:.5f} 1/nm, {dq_along_x:.5f} 1/nm)"
             )
         # these q values are not equally spaced, we just extract the q extent from them
-        nx_output = int(np.rint((q_along_x.max() - q_along_x.min()) / dq_along_x))
-        ny_output = int(np.rint((q_along_y.max() - q_along_y.min()) / dq_along_y))
-        nz_output = int(np.rint((q_along_z.max() - q_along_z.min()) / dq_along_z))
+        nx_output = int(np.rint(q_extent[0] / dq_along_x))
+        ny_output = int(np.rint(q_extent[1] / dq_along_y))
+        nz_output = int(np.rint(q_extent[2] / dq_along_z))
 
         if align_q:
             #######################################################################
@@ -1914,11 +1999,10 @@ class Setup:
             #######################################################################
             # the center of mass of the diffraction
             # should be in the center of the array!
-            q_along_z_com = (
-                q_along_z[nbz // 2, nby // 2, nbx // 2] + q_offset[2]
-            )  # q_offset in the order xyz
-            q_along_y_com = q_along_y[nbz // 2, nby // 2, nbx // 2] + q_offset[1]
-            q_along_x_com = q_along_x[nbz // 2, nby // 2, nbx // 2] + q_offset[0]
+            q_center = np.matmul(transfer_matrix, center)
+            q_along_z_com = q_center[2] + q_offset[2]  # q_offset in the order xyz
+            q_along_y_com = q_center[1] + q_offset[1]
+            q_along_x_com = q_center[0] + q_offset[0]
             qnorm = np.linalg.norm(
                 np.array([q_along_x_com, q_along_y_com, q_along_z_com])
             )  # in 1/A
@@ -1955,28 +2039,14 @@ class Setup:
             )
             q_offset = offset_crystal[::-1]  # offset_crystal is in the order z, y, x
 
-            # calculate the q coordinates of the data points in the crystal frame
-            q_along_x = (
-                transfer_matrix[0, 0] * myx
-                + transfer_matrix[0, 1] * myy
-                + transfer_matrix[0, 2] * myz
-            )
-            q_along_y = (
-                transfer_matrix[1, 0] * myx
-                + transfer_matrix[1, 1] * myy
-                + transfer_matrix[1, 2] * myz
-            )
-            q_along_z = (
-                transfer_matrix[2, 0] * myx
-                + transfer_matrix[2, 1] * myy
-                + transfer_matrix[2, 2] * myz
-            )
+            # calculate the extent of the q coordinates in the crystal frame
+            q_extent = util.transformed_extent(transfer_matrix, shape=(nbx, nby, nbz))
 
             # these q values are not equally spaced,
             # we just extract the q extent from them
-            nx_output = int(np.rint((q_along_x.max() - q_along_x.min()) / dq_along_x))
-            ny_output = int(np.rint((q_along_y.max() - q_along_y.min()) / dq_along_y))
-            nz_output = int(np.rint((q_along_z.max() - q_along_z.min()) / dq_along_z))
+            nx_output = int(np.rint(q_extent[0] / dq_along_x))
+            ny_output = int(np.rint(q_extent[1] / dq_along_y))
+            nz_output = int(np.rint(q_extent[2] / dq_along_z))
 
             if verbose:
                 print(
@@ -2014,28 +2084,20 @@ class Setup:
         qy = np.arange(-nx_output // 2, nx_output // 2, 1) * dq_along_x
         # along x outboard
 
-        myz, myy, myx = np.meshgrid(qx, qz, qy, indexing="ij")
-
         # transfer_matrix is the transformation matrix from
         # the detector coordinates to the laboratory/crystal frame
-        # in RGI, we want to calculate the coordinates that would have a grid
-        # of the laboratory/crystal frame expressed
+        # for the interpolation, we want to calculate the coordinates that would have
+        # a grid of the laboratory/crystal frame expressed
         # in the detector frame, i.e. one has to inverse the transformation matrix.
         transfer_imatrix = np.linalg.inv(transfer_matrix)
-        new_x = (
-            transfer_imatrix[0, 0] * myx
-            + transfer_imatrix[0, 1] * myy
-            + transfer_imatrix[0, 2] * myz
-        )
-        new_y = (
-            transfer_imatrix[1, 0] * myx
-            + transfer_imatrix[1, 1] * myy
-            + transfer_imatrix[1, 2] * myz
-        )
-        new_z = (
-            transfer_imatrix[2, 0] * myx
-            + transfer_imatrix[2, 1] * myy
-            + transfer_imatrix[2, 2] * myz
+        plan = self._get_interpolation_plan(
+            name="ortho_reciprocal",
+            input_shape=(nbz, nby, nbx),
+            output_axes=(qx, qz, qy),
+            matrix=transfer_imatrix[::-1, ::-1],  # xyz to array axes order
+            plan_file=plan_file,
+            memory_budget=memory_budget,
+            verbose=verbose,
         )
 
         ######################
@@ -2043,32 +2105,17 @@ class Setup:
         ######################
         output_arrays = []
         for idx, array in enumerate(arrays):
-            # convert array type to float,
+            # the interpolation is performed in float,
             # for integers the interpolation can lead to artefacts
-            array = array.astype(float)
-            rgi = RegularGridInterpolator(
-                (
-                    np.arange(-nbz // 2, nbz // 2),
-                    np.arange(-nby // 2, nby // 2),
-                    np.arange(-nbx // 2, nbx // 2),
-                ),
-                array,
-                method="linear",
-                bounds_error=False,
-                fill_value=fill_value[idx],
-            )
-            ortho_array = rgi(
-                np.concatenate(
-                    (
-                        new_z.reshape((1, new_z.size)),
-                        new_y.reshape((1, new_z.size)),
-                        new_x.reshape((1, new_z.size)),
-                    )
-                ).transpose()
-            )
-            ortho_array = ortho_array.reshape((nz_output, ny_output, nx_output)).astype(
-                array.dtype
-            )
+            ortho_array = None
+            if memmap_dir is not None:
+                ortho_array = np.lib.format.open_memmap(
+                    os.path.join(memmap_dir, f"ortho_reciprocal_{idx}.npy"),
+                    mode="w+",
+                    dtype=np.result_type(array.dtype, float),
+                    shape=plan.output_shape,
+                )
+            ortho_array = plan.apply(array, fill_value=fill_value[idx], out=ortho_array)
             output_arrays.append(ortho_array)
 
             if debugging[idx]:
@@ -2366,7 +2413,15 @@ class Setup:
 
         return output_arrays, (qx, qz, qy)
 
-    def transformation_cdi_ewald(self, arrays, direct_beam, cdi_angle, fill_value):
+    def transformation_cdi_ewald(
+        self,
+        arrays,
+        direct_beam,
+        cdi_angle,
+        fill_value,
+        gridder="griddata",
+        fill_holes=False,
+    ):
         """
         Interpolate forward CDI data considering the curvature of the Ewald sphere.
 
@@ -2376,8 +2431,19 @@ class Setup:
         :param cdi_angle: 1D array of measurement angles in degrees
         :param fill_value: tuple of real numbers (np.nan allowed), fill_value parameter
          for the RegularGridInterpolator, same length as the number of arrays
+        :param gridder: "griddata" to interpolate the data with
+         scipy.interpolate.griddata (Delaunay triangulation of all voxels, very slow),
+         "nearest" or "linear" to spread the data frame by frame onto the grid with a
+         ScatterGridder (cost proportional to the number of voxels)
+        :param fill_holes: True to fill the empty voxels of the grid with the average
+         of their neighbours, used only with the "nearest" and "linear" gridders
         :return:
         """
+        if gridder not in {"griddata", "nearest", "linear"}:
+            raise ValueError(
+                f"gridder should be 'griddata', 'nearest' or 'linear', got {gridder}"
+            )
+        valid.valid_item(fill_holes, allowed_types=bool, name="fill_holes")
         nbz, nby, nbx = arrays[0].shape
         _, directbeam_x = direct_beam
         # calculate the number of voxels available to accomodate the gridded data
@@ -2389,25 +2455,67 @@ class Setup:
         numy = nby  # no change of the voxel numbers along the rotation axis
         print("\nData shape after regridding:", numx, numy, numx)
 
-        # calculate exact q values for each voxel of the 3D dataset
-        old_qx, old_qz, old_qy = self._beamline.ewald_curvature_saxs(
-            wavelength=self.wavelength * 1e9,
-            pixelsize_x=self.detector.pixelsize_x * 1e9,
-            pixelsize_y=self.detector.pixelsize_y * 1e9,
-            distance=self.distance * 1e9,
-            array_shape=(nbz, nby, nbx),
-            cdi_angle=cdi_angle,
-            direct_beam=direct_beam,
-        )
+        ewald_params = {
+            "wavelength": self.wavelength * 1e9,
+            "beam_direction": self.beam_direction,
+            "pixelsize_x": self.detector.pixelsize_x * 1e9,
+            "pixelsize_y": self.detector.pixelsize_y * 1e9,
+            "distance": self.distance * 1e9,
+            "direct_beam": direct_beam,
+        }
+        if gridder == "griddata":
+            # calculate exact q values for each voxel of the 3D dataset
+            old_qx, old_qz, old_qy = self._beamline.ewald_curvature_saxs(
+                array_shape=(nbz, nby, nbx), cdi_angle=cdi_angle, **ewald_params
+            )
+            q_min = (old_qx.min(), old_qz.min(), old_qy.min())
+            q_max = (old_qx.max(), old_qz.max(), old_qy.max())
+        else:
+            # calculate the q values by blocks of frames to limit the memory
+            # footprint, a first pass is needed for the extent of the grid. Each
+            # scatter-add uses a temporary array of the size of the grid, the blocks
+            # should not be much smaller than the grid.
+            nb_frames = max(1, min(numx * numy * numx, 2 ** 22) // (nby * nbx))
+            q_min = np.full(3, np.inf)
+            q_max = np.full(3, -np.inf)
+            for start in range(0, nbz, nb_frames):
+                stop = min(start + nb_frames, nbz)
+                q_block = self._beamline.ewald_curvature_saxs(
+                    array_shape=(stop - start, nby, nbx),
+                    cdi_angle=cdi_angle[start:stop],
+                    **ewald_params,
+                )
+                q_min = np.minimum(q_min, [q_values.min() for q_values in q_block])
+                q_max = np.maximum(q_max, [q_values.max() for q_values in q_block])
 
         # create the grid for interpolation
-        qx = np.linspace(
-            old_qx.min(), old_qx.max(), numx, endpoint=False
-        )  # z downstream
-        qz = np.linspace(
-            old_qz.min(), old_qz.max(), numy, endpoint=False
-        )  # y vertical up
-        qy = np.linspace(old_qy.min(), old_qy.max(), numx, endpoint=False)  # x outboard
+        qx = np.linspace(q_min[0], q_max[0], numx, endpoint=False)  # z downstream
+        qz = np.linspace(q_min[1], q_max[1], numy, endpoint=False)  # y vertical up
+        qy = np.linspace(q_min[2], q_max[2], numx, endpoint=False)  # x outboard
+
+        if gridder != "griddata":
+            ##################################################
+            # spread the data onto the grid by blocks of     #
+            # frames (cost proportional to the nb of voxels) #
+            ##################################################
+            print(f"Gridding the data using the {gridder} scatter-add gridder")
+            scatter_gridder = ScatterGridder(
+                axes=(qx, qz, qy), nb_arrays=len(arrays), method=gridder
+            )
+            for start in range(0, nbz, nb_frames):
+                stop = min(start + nb_frames, nbz)
+                q_block = self._beamline.ewald_curvature_saxs(
+                    array_shape=(stop - start, nby, nbx),
+                    cdi_angle=cdi_angle[start:stop],
+                    **ewald_params,
+                )
+                scatter_gridder.add(
+                    points=q_block, values=[array[start:stop] for array in arrays]
+                )
+            output_arrays = scatter_gridder.result(
+                fill_value=fill_value, fill_holes=fill_holes
+            )
+            return list(output_arrays), (qx, qz, qy)
 
         new_qx, new_qz, new_qy = np.meshgrid(qx, qz, qy, indexing="ij")
 
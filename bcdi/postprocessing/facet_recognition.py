@@ -9,11 +9,13 @@
 """Functions related to facet recognition of nanocrystals."""
 
 from scipy.ndimage.measurements import center_of_mass
-from scipy.signal import convolve
+from scipy.signal import convolve, fftconvolve
 from scipy.interpolate import RegularGridInterpolator
 from scipy.interpolate import griddata
 from scipy import stats
 from scipy import ndimage
+from scipy import sparse
+from scipy.spatial import cKDTree
 from skimage.feature import corner_peaks
 from skimage.morphology import watershed
 from numbers import Real
@@ -30,6 +32,127 @@ colormap = gu.Colormap()
 default_cmap = colormap.cmap
 
 
+def binned_kde(points, axes, covariance, weights=None, oversampling=None):
+    """
+    Estimate a gaussian kernel density on a regular 2D grid.
+
+    The weights of the points are distributed onto a grid finer than the output grid
+    by linear binning, and the histogram is convolved with the gaussian kernel by
+    FFT. The cost scales linearly with the number of points, instead of the number
+    of points times the number of grid nodes for scipy.stats.gaussian_kde. The
+    density is normalized as in gaussian_kde: it integrates to 1 over the plane.
+
+    The accuracy depends on the number of binning cells per standard deviation of
+    the kernel. By default the fine grid is chosen along each axis with at least 4
+    cells per step of the output grid and 6 cells per standard deviation, the
+    density is then within about 1% of the peak of the exact kernel density. The
+    fine grid is limited to 2**24 nodes, which lowers the accuracy for kernels much
+    narrower than the output grid step.
+
+    :param points: array of shape (2, nb_points), coordinates of the points along
+     each grid axis
+    :param axes: tuple of two 1D arrays, regularly spaced coordinates of the grid
+     nodes along each axis
+    :param covariance: 2x2 covariance matrix of the gaussian kernel, e.g. the
+     attribute covariance of a scipy.stats.gaussian_kde instance
+    :param weights: 1D array of nb_points weights, None for equal weights
+    :param oversampling: number of binning cells per step of the output grid, None
+     to choose it along each axis from the width of the kernel
+    :return: the density at the grid nodes, array of shape (len(axes[0]),
+     len(axes[1]))
+    """
+    points = np.asarray(points, dtype=float)
+    covariance = np.asarray(covariance, dtype=float)
+    if points.ndim != 2 or points.shape[0] != 2:
+        raise ValueError("points should be an array of shape (2, nb_points)")
+    if covariance.shape != (2, 2):
+        raise ValueError("covariance should be a 2x2 array")
+    valid.valid_item(
+        oversampling,
+        allowed_types=int,
+        min_excluded=0,
+        allow_none=True,
+        name="oversampling",
+    )
+    if weights is None:
+        weights = np.ones(points.shape[1])
+    weights = np.asarray(weights, dtype=float)
+    weights = weights / weights.sum()
+
+    grid_steps = [(axis[-1] - axis[0]) / (len(axis) - 1) for axis in axes]
+    if oversampling is None:
+        # at least 6 binning cells per standard deviation of the kernel
+        oversampling = [
+            max(4, int(np.ceil(6 * step / np.sqrt(covariance[idx, idx]))))
+            for idx, step in enumerate(grid_steps)
+        ]
+        # limit the size of the fine grid for kernels much narrower than the step
+        reduction = np.sqrt(
+            len(axes[0]) * oversampling[0] * len(axes[1]) * oversampling[1] / 2 ** 24
+        )
+        if reduction > 1:
+            oversampling = [max(1, int(factor / reduction)) for factor in oversampling]
+    else:
+        oversampling = [oversampling, oversampling]
+
+    # fine binning grid, extended by the kernel radius (4 sigma) on each side
+    steps = [step / factor for step, factor in zip(grid_steps, oversampling)]
+    margins = [
+        int(np.ceil(4 * np.sqrt(covariance[idx, idx]) / steps[idx])) for idx in range(2)
+    ]
+    shape = [
+        (len(axis) - 1) * factor + 1 + 2 * margin
+        for axis, factor, margin in zip(axes, oversampling, margins)
+    ]
+    # fractional indices of the points in the fine grid
+    positions = [
+        (points[idx] - axes[idx][0]) / steps[idx] + margins[idx] for idx in range(2)
+    ]
+    inside = np.logical_and.reduce(
+        [(pos >= 0) & (pos <= nb - 1) for pos, nb in zip(positions, shape)]
+    )
+    lower = [
+        np.minimum(np.floor(pos[inside]).astype(int), nb - 2)
+        for pos, nb in zip(positions, shape)
+    ]
+    fractions = [pos[inside] - low for pos, low in zip(positions, lower)]
+    weights = weights[inside]
+
+    # linear binning onto the four corners of the cell containing each point
+    histogram = np.zeros(shape[0] * shape[1])
+    for offset_0, weight_0 in ((0, 1 - fractions[0]), (1, fractions[0])):
+        for offset_1, weight_1 in ((0, 1 - fractions[1]), (1, fractions[1])):
+            histogram += np.bincount(
+                (lower[0] + offset_0) * shape[1] + lower[1] + offset_1,
+                weights=weights * weight_0 * weight_1,
+                minlength=histogram.size,
+            )
+
+    # gaussian kernel sampled on the fine grid
+    offsets = np.meshgrid(
+        *(
+            np.arange(-margin, margin + 1) * step
+            for margin, step in zip(margins, steps)
+        ),
+        indexing="ij",
+    )
+    inverse = np.linalg.inv(covariance)
+    kernel = np.exp(
+        -0.5
+        * (
+            inverse[0, 0] * offsets[0] ** 2
+            + 2 * inverse[0, 1] * offsets[0] * offsets[1]
+            + inverse[1, 1] * offsets[1] ** 2
+        )
+    ) / (2 * np.pi * np.sqrt(np.linalg.det(covariance)))
+
+    density = fftconvolve(histogram.reshape(shape), kernel, mode="same")
+    return density[
+        margins[0] : shape[0] - margins[0] : oversampling[0],
+        margins[1] : shape[1] - margins[1] : oversampling[1],
+    ]
+
+
 def calc_stereoproj_facet(projection_axis, vectors, radius_mean, stereo_center):
     """
     Calculate the coordinates of normals in the stereographic projection.
@@ -59,90 +182,20 @@ def calc_stereoproj_facet(projection_axis, vectors, radius_mean, stereo_center):
     # stereo_proj[:, 2] is the euclidian u_north,
     # stereo_proj[:, 3] is the euclidian v_north
 
-    if (
-        projection_axis == 0
-    ):  # q aligned along the 1st axis (Z downstream in CXI convention)
-        for idx in range(vectors.shape[0]):
-            stereo_proj[idx, 0] = (
-                radius_mean
-                * vectors[idx, 1]
-                / (radius_mean + vectors[idx, 0] - stereo_center)
-            )  # u_s
-            stereo_proj[idx, 1] = (
-                radius_mean
-                * vectors[idx, 2]
-                / (radius_mean + vectors[idx, 0] - stereo_center)
-            )  # v_s
-            stereo_proj[idx, 2] = (
-                radius_mean
-                * vectors[idx, 1]
-                / (radius_mean + stereo_center - vectors[idx, 0])
-            )  # u_n
-            stereo_proj[idx, 3] = (
-                radius_mean
-                * vectors[idx, 2]
-                / (radius_mean + stereo_center - vectors[idx, 0])
-            )  # v_n
-        uv_labels = (
-            "axis 1",
-            "axis 2",
-        )  # axes corresponding to u and v respectively, used in plots
-
-    elif (
-        projection_axis == 1
-    ):  # q aligned along the 2nd axis (Y vertical up in CXI convention)
-        for idx in range(vectors.shape[0]):
-            stereo_proj[idx, 0] = (
-                radius_mean
-                * vectors[idx, 0]
-                / (radius_mean + vectors[idx, 1] - stereo_center)
-            )  # u_s
-            stereo_proj[idx, 1] = (
-                radius_mean
-                * vectors[idx, 2]
-                / (radius_mean + vectors[idx, 1] - stereo_center)
-            )  # v_s
-            stereo_proj[idx, 2] = (
-                radius_mean
-                * vectors[idx, 0]
-                / (radius_mean + stereo_center - vectors[idx, 1])
-            )  # u_n
-            stereo_proj[idx, 3] = (
-                radius_mean
-                * vectors[idx, 2]
-                / (radius_mean + stereo_center - vectors[idx, 1])
-            )  # v_n
-        uv_labels = (
-            "axis 0",
-            "axis 2",
-        )  # axes corresponding to u and v respectively, used in plots
-
-    else:  # q aligned along the 3rd axis (X outboard in CXI convention)
-        for idx in range(vectors.shape[0]):
-            stereo_proj[idx, 0] = (
-                radius_mean
-                * vectors[idx, 0]
-                / (radius_mean + vectors[idx, 2] - stereo_center)
-            )  # u_s
-            stereo_proj[idx, 1] = (
-                radius_mean
-                * vectors[idx, 1]
-                / (radius_mean + vectors[idx, 2] - stereo_center)
-            )  # v_s
-            stereo_proj[idx, 2] = (
-                radius_mean
-                * vectors[idx, 0]
-                / (radius_mean + stereo_center - vectors[idx, 2])
-            )  # u_n
-            stereo_proj[idx, 3] = (
-                radius_mean
-                * vectors[idx, 1]
-                / (radius_mean + stereo_center - vectors[idx, 2])
-            )  # v_n
-        uv_labels = (
-            "axis 0",
-            "axis 1",
-        )  # axes corresponding to u and v respectively, used in plots
+    # q aligned along the 1st axis (Z downstream in CXI convention), the 2nd axis
+    # (Y vertical up in CXI convention) or the 3rd axis (X outboard in CXI convention)
+    u_axis, v_axis = [axis for axis in range(3) if axis != projection_axis]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # u_s, v_s
+        denominator = radius_mean + vectors[:, projection_axis] - stereo_center
+        stereo_proj[:, 0] = radius_mean * vectors[:, u_axis] / denominator
+        stereo_proj[:, 1] = radius_mean * vectors[:, v_axis] / denominator
+        # u_n, v_n
+        denominator = radius_mean + stereo_center - vectors[:, projection_axis]
+        stereo_proj[:, 2] = radius_mean * vectors[:, u_axis] / denominator
+        stereo_proj[:, 3] = radius_mean * vectors[:, v_axis] / denominator
+    # axes corresponding to u and v respectively, used in plots
+    uv_labels = (f"axis {u_axis}", f"axis {v_axis}")
 
     stereo_proj = stereo_proj / radius_mean * 90  # rescale from radius_mean to 90
 
@@ -221,6 +274,7 @@ def equirectangular_proj(
     bw_method=0.03,
     min_distance=10,
     background_threshold=-0.35,
+    kde_method="binned",
     debugging=False,
 ):
     """
@@ -236,9 +290,14 @@ def equirectangular_proj(
     :param min_distance: min_distance of corner_peaks()
     :param background_threshold: threshold for background determination
      (depth of the KDE)
+    :param kde_method: 'binned' to estimate the density by linear binning and FFT
+     convolution (see binned_kde), 'exact' to evaluate the gaussian_kde at each grid
+     point
     :param debugging: if True, show plots for debugging
     :return: ndarray of labelled regions
     """
+    if kde_method not in {"binned", "exact"}:
+        raise ValueError("kde_method should be 'binned' or 'exact'")
     # check normals for nan
     list_nan = np.argwhere(np.isnan(normals))
     normals = np.delete(normals, list_nan[::3, 0], axis=0)
@@ -247,11 +306,11 @@ def equirectangular_proj(
     # calculate latitude and longitude from xyz,
     # this is equal to the equirectangular flat square projection
     long_lat = np.zeros((normals.shape[0], 2), dtype=normals.dtype)
-    for i in range(normals.shape[0]):
-        if normals[i, 1] == 0 and normals[i, 0] == 0:
-            continue
-        long_lat[i, 0] = np.arctan2(normals[i, 1], normals[i, 0])  # longitude
-        long_lat[i, 1] = np.arcsin(normals[i, 2])  # latitude
+    valid_rows = (normals[:, 1] != 0) | (normals[:, 0] != 0)
+    long_lat[valid_rows, 0] = np.arctan2(
+        normals[valid_rows, 1], normals[valid_rows, 0]
+    )  # longitude
+    long_lat[valid_rows, 1] = np.arcsin(normals[valid_rows, 2])  # latitude
     fig = plt.figure()
     ax = fig.add_subplot(111)
     ax.scatter(long_lat[:, 0], long_lat[:, 1], c=intensity, cmap=cmap)
@@ -271,12 +330,17 @@ def equirectangular_proj(
     ]  # vertical, horizontal
 
     # Evaluate the KDE on a regular grid...
-    coords = np.vstack([item.ravel() for item in [xi, yi]])
-    # coords is a contiguous flattened array of coordinates of shape (2, size(xi))
-
-    density = -1 * kde(coords).reshape(
-        xi.shape
-    )  # inverse density for later watershed segmentation
+    if kde_method == "binned":
+        density = binned_kde(
+            points=long_lat.T[::-1],
+            axes=(yi[:, 0], xi[0, :]),
+            covariance=kde.covariance[::-1, ::-1],
+        )
+    else:  # "exact"
+        coords = np.vstack([item.ravel() for item in [xi, yi]])
+        # coords is a contiguous flattened array of coordinates of shape (2, size(xi))
+        density = kde(coords).reshape(xi.shape)
+    density = -1 * density  # inverse density for later watershed segmentation
 
     fig = plt.figure()
     ax = fig.add_subplot(111)
@@ -387,6 +451,8 @@ def find_facet(
     if not isinstance(surf_indices, tuple):
         raise ValueError("surf_indices should be a tuple of 3 1D ndarrays")
     surf0, surf1, surf2 = surf_indices
+    # linearized indices of the surface voxels, sorted for fast membership tests
+    surf_linear = np.sort(np.ravel_multi_index(surf_indices, original_shape))
     plane_normal = np.array(
         [plane_coeffs[0], plane_coeffs[1], plane_coeffs[2]]
     )  # normal is [a, b, c] if ax+by+cz+d=0
@@ -397,35 +463,47 @@ def find_facet(
     crossed_surface = 0
     shift_direction = 0
     while found_plane == 0:
-        common_points = 0
-        nb_points = len(surf0)
-
         # shift indices
         plane_newindices0, plane_newindices1, plane_newindices2 = offset_plane(
             indices=refplane_indices,
             offset=nbloop * step_shift,
             plane_normal=plane_normal,
         )
-        nb_newpoints = len(plane_newindices0)
-        for point in range(nb_newpoints):
-            for point2 in range(nb_points):
-                if (
-                    plane_newindices0[point] == surf0[point2]
-                    and plane_newindices1[point] == surf1[point2]
-                    and plane_newindices2[point] == surf2[point2]
-                ):
-                    common_points = common_points + 1
+
+        # count the plane points belonging to the surface, points shifted outside of
+        # the array cannot belong to the surface
+        in_array = np.logical_and.reduce(
+            [
+                np.logical_and(indices >= 0, indices < size)
+                for indices, size in zip(
+                    (plane_newindices0, plane_newindices1, plane_newindices2),
+                    original_shape,
+                )
+            ]
+        )
+        plane_linear = np.ravel_multi_index(
+            (
+                plane_newindices0[in_array],
+                plane_newindices1[in_array],
+                plane_newindices2[in_array],
+            ),
+            original_shape,
+        )
+        common_points = int(
+            (
+                np.searchsorted(surf_linear, plane_linear, side="right")
+                - np.searchsorted(surf_linear, plane_linear, side="left")
+            ).sum()
+        )
 
         if debugging:
             temp_coeff3 = plane_coeffs[3] - nbloop * step_shift
-            dist = np.zeros(nb_points)
-            for point in range(nb_points):
-                dist[point] = (
-                    plane_coeffs[0] * surf0[point]
-                    + plane_coeffs[1] * surf1[point]
-                    + plane_coeffs[2] * surf2[point]
-                    + temp_coeff3
-                ) / np.linalg.norm(plane_normal)
+            dist = (
+                plane_coeffs[0] * surf0
+                + plane_coeffs[1] * surf1
+                + plane_coeffs[2] * surf2
+                + temp_coeff3
+            ) / np.linalg.norm(plane_normal)
             temp_mean_dist = dist.mean()
             plane = np.zeros(original_shape)
             plane[plane_newindices0, plane_newindices1, plane_newindices2] = 1
@@ -713,7 +791,9 @@ def fit_plane(plane, label, debugging=False):
     return params, indices, std_param, no_points
 
 
-def grow_facet(fit, plane, label, support, max_distance=0.90, debugging=True):
+def grow_facet(
+    fit, plane, label, support, max_distance=0.90, normal_field=None, debugging=True
+):
     """
     Find voxels of the object which belong to a facet.
 
@@ -726,6 +806,9 @@ def grow_facet(fit, plane, label, support, max_distance=0.90, debugging=True):
      with shape of the full dataset
     :param max_distance: in pixels, maximum allowed distance to the facet plane
      of a voxel
+    :param normal_field: the output of surface_normal_field(support). Provide it when
+     growing several facets or running several cycles for the same support, so that
+     the support gradient is calculated only once.
     :param debugging: set to True to see plots
     :return: the updated plane, a stop flag
     """
@@ -777,16 +860,13 @@ def grow_facet(fit, plane, label, support, max_distance=0.90, debugging=True):
     # gradients is a list of arrays of 3 vector components
     indices = np.nonzero(plane)
     gradients = surface_gradient(
-        list(zip(indices[0], indices[1], indices[2])), support=support
+        np.transpose(indices), support=support, normal_field=normal_field
     )
 
-    count_grad = 0
-    nb_indices = len(indices[0])
-    for idx in range(nb_indices):
-        if np.dot(plane_normal, gradients[idx]) < 0.75:
-            # 0.85 is too restrictive checked CH4760 S11 plane 1
-            plane[indices[0][idx], indices[1][idx], indices[2][idx]] = 0
-            count_grad += 1
+    # 0.85 is too restrictive checked CH4760 S11 plane 1
+    excluded = np.dot(np.reshape(gradients, (-1, 3)), plane_normal) < 0.75
+    plane[tuple(index[excluded] for index in indices)] = 0
+    count_grad = excluded.sum()
 
     indices = np.nonzero(plane)
     if debugging and len(indices[0]) != 0:
@@ -800,6 +880,121 @@ def grow_facet(fit, plane, label, support, max_distance=0.90, debugging=True):
     return plane, no_points
 
 
+def laplacian_step(vertices, adjacency, factor, fixed_indices=None):
+    """
+    Perform one step of Laplacian smoothing of a mesh using its adjacency matrix.
+
+    Each vertex is moved towards the barycenter of its neighbours, weighted by the
+    inverse of their distances: v_i + factor * (sum_j(w_ij * v_j) / sum_j(w_ij) - v_i).
+    The weights are calculated only for the non-zero elements of the sparse adjacency
+    matrix, and the update is a sparse matrix-vector product.
+
+    :param vertices: n*3 ndarray of n vertices defined by 3 positions
+    :param adjacency: n*n scipy.sparse.csr_matrix, as returned by mesh_adjacency
+    :param factor: smoothing factor, positive for a shrinking step (lambda) and
+     negative for an inflating step (-mu)
+    :param fixed_indices: indices of vertices which should not be moved, e.g. vertices
+     defining non-shared edges
+    :return: the smoothened vertices (ndarray n*3)
+    """
+    rows = np.repeat(np.arange(adjacency.shape[0]), np.diff(adjacency.indptr))
+    weights = 1 / np.linalg.norm(vertices[adjacency.indices] - vertices[rows], axis=1)
+    weighted = sparse.csr_matrix(
+        (weights, adjacency.indices, adjacency.indptr), shape=adjacency.shape
+    )
+    total_weights = np.asarray(weighted.sum(axis=1)).ravel()
+    new_vertices = np.copy(vertices)
+    # isolated vertices have no neighbour and are not moved
+    connected = total_weights != 0
+    new_vertices[connected] += factor * (
+        (weighted @ vertices)[connected] / total_weights[connected, np.newaxis]
+        - vertices[connected]
+    )
+    if fixed_indices is not None and np.size(fixed_indices) != 0:
+        new_vertices[fixed_indices] = vertices[fixed_indices]
+    return new_vertices
+
+
+def mesh_adjacency(faces, nb_vertices):
+    """
+    Build the sparse adjacency matrix of a triangulated mesh.
+
+    The element (i, j) is 1 if the vertices i and j share an edge of a face, 0
+    otherwise. It depends only on the topology of the mesh and can be reused as long
+    as the faces are not modified.
+
+    :param faces: m*3 ndarray of m faces defined by 3 indices of vertices
+    :param nb_vertices: number of vertices of the mesh
+    :return: a scipy.sparse.csr_matrix of shape (nb_vertices, nb_vertices)
+    """
+    faces = np.asarray(faces)
+    rows = np.concatenate([faces[:, idx] for idx in (0, 1, 2, 1, 2, 0)])
+    cols = np.concatenate([faces[:, idx] for idx in (1, 2, 0, 0, 1, 2)])
+    # degenerated faces would link a vertex to itself
+    rows, cols = rows[rows != cols], cols[rows != cols]
+    adjacency = sparse.csr_matrix(
+        (np.ones(rows.size), (rows, cols)), shape=(nb_vertices, nb_vertices)
+    )
+    # edges shared by several faces are summed, reset them to 1
+    adjacency.data[:] = 1
+    adjacency.sort_indices()
+    return adjacency
+
+
+def normals_density(normals, weights, radius, max_pairs=2 ** 22):
+    """
+    Calculate the weighted point density of normals on the unit sphere.
+
+    For each normal, it sums the weight times the distance of all normals closer
+    than radius. The normals are clustered on facets, the number of pairs of
+    neighbours can therefore be large. The number of neighbours of each normal is
+    counted once with the tree of all normals, and the pairs are then calculated by
+    chunks of consecutive normals holding at most about max_pairs pairs.
+
+    :param normals: m*3 ndarray of normals, non-finite normals are ignored
+    :param weights: 1D array of m weights, e.g. the area of mesh triangles
+    :param radius: radius around which the normals are integrated
+    :param max_pairs: maximum number of pairs of neighbours calculated at once
+    :return: a 1D array of m densities, 0 for non-finite normals
+    """
+    valid.valid_ndarray(normals, ndim=2, name="normals")
+    valid.valid_item(max_pairs, allowed_types=int, min_excluded=0, name="max_pairs")
+    intensity = np.zeros(normals.shape[0], dtype=normals.dtype)
+    valid_normals = np.flatnonzero(np.isfinite(normals).all(axis=1))
+    if valid_normals.size == 0:
+        return intensity
+    tree = cKDTree(normals[valid_normals])
+    cumulated_pairs = np.cumsum(
+        tree.query_ball_point(normals[valid_normals], radius, return_length=True)
+    )
+    # chunks of normals holding about max_pairs pairs of neighbours, the trees of the
+    # chunks partition the normals and their total cost grows linearly
+    bounds = np.unique(
+        np.concatenate(
+            (
+                [0],
+                np.searchsorted(
+                    cumulated_pairs,
+                    np.arange(max_pairs, cumulated_pairs[-1], max_pairs),
+                ),
+                [valid_normals.size],
+            )
+        )
+    )
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        indices = valid_normals[start:stop]
+        pairs = cKDTree(normals[indices]).sparse_distance_matrix(
+            tree, radius, output_type="ndarray"
+        )
+        pairs = pairs[pairs["v"] < radius]
+        intensity[indices] = np.bincount(
+            pairs["i"],
+            weights=weights[valid_normals[pairs["j"]]] * pairs["v"],
+            minlength=indices.size,
+        )
+    return intensity
+
+
 def offset_plane(indices, offset, plane_normal):
     """
     Shift plane indices by the offset value in order to scan perpendicular to the plane.
@@ -837,66 +1032,42 @@ def remove_duplicates(vertices, faces, debugging=False):
 
     :param vertices: a ndarray of vertices, shape (N, 3)
     :param faces: a ndarray of vertex indices, shape (M, 3)
-    :param debugging: True to see which vertices are duplicated and how lists are
-     modified
-    :return: the updated vertices and faces with duplicates removed in place
+    :param debugging: True to see which vertices are renumbered
+    :return: the updated vertices and faces with duplicates removed
     """
-    # find indices which are duplicated
-    uniq_vertices, uniq_inverse = np.unique(vertices, axis=0, return_inverse=True)
-    indices, count = np.unique(uniq_inverse, return_counts=True)
-    duplicated_indices = indices[count != 1]  # list of vertices which are not unique
-
-    # for each duplicated vertex, build the list of the corresponding identical vertices
-    list_duplicated = []
-    for idx, value in enumerate(duplicated_indices):
-        same_vertices = np.argwhere(vertices == uniq_vertices[value, :])
-        # same_vertices is a ndarray of the form
-        # [[ind0, 0], [ind0, 1], [ind0, 2], [ind1, 0], [ind1, 1], [ind1, 2],...]
-        list_duplicated.append(list(same_vertices[::3, 0]))
-
-    # remove duplicates in vertices
-    remove_vertices = [value for sublist in list_duplicated for value in sublist[1:]]
-    vertices = np.delete(vertices, remove_vertices, axis=0)
-    print(len(remove_vertices), "duplicated vertices removed")
-
-    # remove duplicated_vertices in faces
-    for idx, temp_array in enumerate(list_duplicated):
-        for idy in range(1, len(temp_array)):
-            duplicated_value = temp_array[idy]
-            faces[faces == duplicated_value] = temp_array[0]
-            # temp_array[0] is the unique value, others are duplicates
-
-            # all indices above duplicated_value have to be decreased by 1
-            # to keep the match with the number of vertices
-            faces[faces > duplicated_value] = faces[faces > duplicated_value] - 1
-
-            # update accordingly all indices above temp_array[idy]
-            if debugging:
-                print("temp_array before", temp_array)
-                print("list_duplicated before", list_duplicated)
-            temp_array = [
-                (value - 1) if value > duplicated_value else value
-                for value in temp_array
-            ]
-            list_duplicated = [
-                [
-                    (value - 1) if value > duplicated_value else value
-                    for value in sublist
-                ]
-                for sublist in list_duplicated
-            ]
-            if debugging:
-                print("temp_array after", temp_array)
-                print("list_duplicated after", list_duplicated)
+    # find the first occurrence of each vertex and the mapping to unique vertices
+    _, first_indices, uniq_inverse = np.unique(
+        vertices, axis=0, return_index=True, return_inverse=True
+    )
+    uniq_inverse = uniq_inverse.ravel()
+
+    # keep the first occurrence of each vertex, in the original order
+    keep_vertices = np.sort(first_indices)
+    nb_removed = vertices.shape[0] - keep_vertices.size
+    vertices = vertices[keep_vertices]
+    print(nb_removed, "duplicated vertices removed")
+
+    # new index of each unique vertex after the removal of duplicates
+    new_indices = np.empty(first_indices.size, dtype=int)
+    new_indices[np.argsort(first_indices)] = np.arange(first_indices.size)
+    old_to_new = new_indices[uniq_inverse]
+    if debugging:
+        duplicated = np.flatnonzero(old_to_new != np.arange(old_to_new.size))
+        print("old vertex indices", duplicated)
+        print("new vertex indices", old_to_new[duplicated])
+    faces = old_to_new[faces]
 
     # look for faces with 2 identical vertices
     # (cannot define later a normal to these faces)
-    remove_faces = []
-    for idx in range(faces.shape[0]):
-        if np.unique(faces[idx, :], axis=0).shape[0] != faces[idx, :].shape[0]:
-            remove_faces.append(idx)
-    faces = np.delete(faces, remove_faces, axis=0)
-    print(len(remove_faces), "faces with identical vertices removed")
+    remove_faces = np.logical_or.reduce(
+        (
+            faces[:, 0] == faces[:, 1],
+            faces[:, 1] == faces[:, 2],
+            faces[:, 0] == faces[:, 2],
+        )
+    )
+    faces = faces[~remove_faces]
+    print(np.count_nonzero(remove_faces), "faces with identical vertices removed")
 
     return vertices, faces
 
@@ -953,6 +1124,7 @@ def stereographic_proj(
     plot_planes=True,
     scale="linear",
     comment_fig="",
+    kde_bandwidth=None,
     debugging=False,
 ):
     """
@@ -985,6 +1157,11 @@ def stereographic_proj(
      planes in the pole figure
     :param scale: 'linear' or 'log', scale for the colorbar of the plot
     :param comment_fig: string, comment for the filename when saving figures
+    :param kde_bandwidth: if None, the density of normals is the linear interpolation
+     of their intensity onto the projection grid. Otherwise, it is the gaussian
+     kernel density of the normals weighted by their intensity, estimated by linear
+     binning and FFT convolution (see binned_kde), with this standard deviation in
+     degrees.
     :param debugging: show plots for debugging
     :return:
      - labels_south and labels_north as 2D arrays for each projection from South and
@@ -1016,6 +1193,13 @@ def stereographic_proj(
         else:
             pass
 
+    valid.valid_item(
+        kde_bandwidth,
+        allowed_types=Real,
+        min_excluded=0,
+        allow_none=True,
+        name="kde_bandwidth",
+    )
     if comment_fig and comment_fig[-1] != "_":
         comment_fig = comment_fig + "_"
     radius_mean = 1  # normals are normalized
@@ -1109,18 +1293,29 @@ def stereographic_proj(
     ]
     # v_grid changes vertically, u_grid horizontally
     nby, nbx = u_grid.shape
-    density_south = griddata(
-        (stereo_proj[:, 0], stereo_proj[:, 1]),
-        intensity,
-        (u_grid, v_grid),
-        method="linear",
-    )  # S
-    density_north = griddata(
-        (stereo_proj[:, 2], stereo_proj[:, 3]),
-        intensity,
-        (u_grid, v_grid),
-        method="linear",
-    )  # N
+    if kde_bandwidth is None:
+        density_south = griddata(
+            (stereo_proj[:, 0], stereo_proj[:, 1]),
+            intensity,
+            (u_grid, v_grid),
+            method="linear",
+        )  # S
+        density_north = griddata(
+            (stereo_proj[:, 2], stereo_proj[:, 3]),
+            intensity,
+            (u_grid, v_grid),
+            method="linear",
+        )  # N
+    else:
+        density_south, density_north = [
+            binned_kde(
+                points=stereo_proj[:, [column + 1, column]].T,
+                axes=(v_grid[:, 0], u_grid[0, :]),
+                covariance=kde_bandwidth ** 2 * np.identity(2),
+                weights=intensity,
+            )
+            for column in (0, 2)
+        ]
 
     # normalize for plotting
     density_south = density_south / density_south[density_south > 0].max() * 10000
@@ -1314,69 +1509,64 @@ def stereographic_proj(
     return labels_south, labels_north, stereo_proj, remove_row
 
 
-def surface_gradient(points, support, width=2):
+def surface_gradient(points, support, width=2, normal_field=None):
     """
     Calculate the support gradient at point.
 
     :param points: tuple or list of tuples of 3 integers (z, y, x), position where
      to calculate the gradient vector
-    :param support: 3D numpy binary array, being 1 in the crystal and 0 outside
+    :param support: 3D numpy binary array, being 1 in the crystal and 0 outside. It
+     can be None if normal_field is provided.
     :param width: half-width of the window where the gradient will be calculated
      (the support gradient is nonzero on a single layer, it avoids missing it)
+    :param normal_field: the output of surface_normal_field(support, width). Provide
+     it when calculating gradients several times for the same support.
     :return: a list of normalized vector(s) (array(s) of 3 numbers) oriented
      towards the exterior of the cristal
     """
-    gradz, grady, gradx = np.gradient(support, 1)  # support
-    vectors = []
-    if not isinstance(points, list):
-        points = [points]
-
-    for _, point in enumerate(points):
-        # round the point to integer numbers
-        point = [int(np.rint(point[idx])) for idx in range(3)]
-
-        # calculate the gradient in a small window around point
-        # (gradient will be nonzero on a single layer)
-        gradz_slice = gradz[
-            point[0] - width : point[0] + width + 1,
-            point[1] - width : point[1] + width + 1,
-            point[2] - width : point[2] + width + 1,
-        ]
-        val = (gradz_slice != 0).sum()
-        if val == 0:
-            vector_z = 0
-        else:
-            vector_z = gradz_slice.sum() / val
+    if normal_field is None:
+        normal_field = surface_normal_field(support, width=width)
+    # round the points to integer numbers
+    points = np.rint(np.asarray(points, dtype=float).reshape((-1, 3))).astype(int)
+    vectors = normal_field[:, points[:, 0], points[:, 1], points[:, 2]].T
+    with np.errstate(invalid="ignore"):
+        vectors = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+    return list(vectors)
 
-        grady_slice = grady[
-            point[0] - width : point[0] + width + 1,
-            point[1] - width : point[1] + width + 1,
-            point[2] - width : point[2] + width + 1,
-        ]
-        val = (grady_slice != 0).sum()
-        if val == 0:
-            vector_y = 0
-        else:
-            vector_y = grady_slice.sum() / val
 
-        gradx_slice = gradx[
-            point[0] - width : point[0] + width + 1,
-            point[1] - width : point[1] + width + 1,
-            point[2] - width : point[2] + width + 1,
-        ]
-        val = (gradx_slice != 0).sum()
-        if val == 0:
-            vector_x = 0
-        else:
-            vector_x = gradx_slice.sum() / val
+def surface_normal_field(support, width=2):
+    """
+    Calculate the mean support gradient in a window around each voxel.
+
+    For each component of the support gradient, the sum of the gradient and the
+    number of its nonzero values in a box of half-width 'width' centered on each
+    voxel are calculated with separable moving sums (see utilities.box_sum), the box
+    being truncated at the edges of the array. Their ratio is the component of the
+    surface normal at that voxel. Normals at any list of points are then obtained by
+    indexing the field, see surface_gradient().
 
+    :param support: 3D numpy binary array, being 1 in the crystal and 0 outside
+    :param width: half-width of the window where the gradient will be calculated
+     (the support gradient is nonzero on a single layer, it avoids missing it)
+    :return: an array of shape (3, nbz, nby, nbx), the non-normalized vector
+     oriented towards the exterior of the crystal at each voxel
+    """
+    valid.valid_ndarray(support, ndim=3, name="support")
+    valid.valid_item(width, allowed_types=int, min_included=0, name="width")
+    support = np.asarray(support, dtype=float)
+    normal_field = np.zeros((3,) + support.shape)
+    for axis in range(3):
+        gradient = np.gradient(support, axis=axis)
+        counts = util.box_sum(gradient != 0, half_width=width)
         # support was 1 inside, 0 outside,
         # the vector needs to be flipped to point towards the outside
-        vectors.append(
-            [-vector_z, -vector_y, -vector_x]
-            / np.linalg.norm([-vector_z, -vector_y, -vector_x])
+        np.divide(
+            -util.box_sum(gradient, half_width=width),
+            counts,
+            out=normal_field[axis],
+            where=counts != 0,
         )
-    return vectors
+    return normal_field
 
 
 def taubin_smooth(
@@ -1414,63 +1604,32 @@ def taubin_smooth(
     print("Original number of vertices:", vertices.shape[0])
     print("Original number of faces:", faces.shape[0])
     new_vertices = np.copy(vertices)
+    # the adjacency matrix depends only on the topology of the mesh, it needs to be
+    # calculated again only if faces are modified when removing duplicated vertices
+    adjacency = None
 
     for k in range(iterations):
-        # check the unicity of vertices otherwise 0 distance would happen
-        if np.unique(new_vertices, axis=0).shape[0] != new_vertices.shape[0]:
-            print("\nTaubin smoothing / lambda: duplicated vertices at iteration", k)
-            new_vertices, faces = remove_duplicates(vertices=new_vertices, faces=faces)
-        vertices = np.copy(new_vertices)
-        neighbours = find_neighbours(
-            vertices, faces
-        )  # get the indices of neighboring vertices for each vertex
-        indices_edges = detect_edges(
-            faces
-        )  # find indices of vertices defining non-shared edges (near hole...)
-
-        for i in range(vertices.shape[0]):
-            indices = neighbours[i]  # list of indices
-            distances = np.sqrt(
-                np.sum((vertices[indices, :] - vertices[i, :]) ** 2, axis=1)
-            )
-            weights = distances ** (-1)
-            vectoren = weights[:, np.newaxis] * vertices[indices, :]
-            totaldist = sum(weights)
-            new_vertices[i, :] = vertices[i, :] + lamda * (
-                np.sum(vectoren, axis=0) / totaldist - vertices[i, :]
-            )
-
-        if indices_edges.size != 0:
-            new_vertices[indices_edges, :] = vertices[indices_edges, :]
-
-        # check the unicity of vertices otherwise 0 distance would happen
-        if np.unique(new_vertices, axis=0).shape[0] != new_vertices.shape[0]:
-            print("\nTaubin smoothing / mu: duplicated vertices at iteration", k)
-            new_vertices, faces = remove_duplicates(vertices=new_vertices, faces=faces)
-        vertices = np.copy(new_vertices)
-        neighbours = find_neighbours(
-            vertices, faces
-        )  # get the indices of neighboring vertices for each vertex
-        indices_edges = detect_edges(
-            faces
-        )  # find indices of vertices defining non-shared edges (near hole...)
-
-        for i in range(vertices.shape[0]):
-
-            indices = neighbours[i]  # list of indices
-            distances = np.sqrt(
-                np.sum((vertices[indices, :] - vertices[i, :]) ** 2, axis=1)
-            )
-            weights = distances ** (-1)
-            vectoren = weights[:, np.newaxis] * vertices[indices, :]
-            totaldist = sum(weights)
-            new_vertices[i, :] = vertices[i, :] - mu * (
-                sum(vectoren) / totaldist - vertices[i, :]
+        for step, factor in (("lambda", lamda), ("mu", -mu)):
+            # check the unicity of vertices otherwise 0 distance would happen
+            if np.unique(new_vertices, axis=0).shape[0] != new_vertices.shape[0]:
+                print(
+                    f"\nTaubin smoothing / {step}: duplicated vertices at iteration", k
+                )
+                new_vertices, faces = remove_duplicates(
+                    vertices=new_vertices, faces=faces
+                )
+                adjacency = None
+            if adjacency is None:
+                adjacency = mesh_adjacency(faces, nb_vertices=new_vertices.shape[0])
+                # find indices of vertices defining non-shared edges (near hole...)
+                indices_edges = detect_edges(faces)
+            new_vertices = laplacian_step(
+                new_vertices,
+                adjacency=adjacency,
+                factor=factor,
+                fixed_indices=indices_edges,
             )
 
-        if indices_edges.size != 0:
-            new_vertices[indices_edges, :] = vertices[indices_edges, :]
-
     # check the unicity of vertices otherwise 0 distance would happen
     if np.unique(new_vertices, axis=0).shape[0] != new_vertices.shape[0]:
         print("\nTaubin smoothing / exiting loop: duplicated vertices")
@@ -1491,7 +1650,7 @@ def taubin_smooth(
     # by taking the cross product of the vectors v1-v0,
     # and v2-v0 in each triangle
     normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[::, 0])
-    areas = np.array([1 / 2 * np.linalg.norm(normal) for normal in normals])
+    areas = 1 / 2 * np.linalg.norm(normals, axis=1)
     normals_length = np.sqrt(
         normals[:, 0] ** 2 + normals[:, 1] ** 2 + normals[:, 2] ** 2
     )
@@ -1500,15 +1659,8 @@ def taubin_smooth(
 
     # calculate the colormap for plotting
     # the weighted point density of normals on a sphere
-    intensity = np.zeros(normals.shape[0], dtype=normals.dtype)
-    for i in range(normals.shape[0]):
-        distances = np.sqrt(
-            np.sum((normals - normals[i, :]) ** 2, axis=1)
-        )  # ndarray of  normals.shape[0]
-        intensity[i] = np.multiply(
-            areas[distances < radius], distances[distances < radius]
-        ).sum()
-        # normals are weighted by the area of mesh triangles
+    # normals are weighted by the area of mesh triangles
+    intensity = normals_density(normals, weights=areas, radius=radius)
 
     intensity = intensity / max(intensity)
     if debugging:
@@ -10,9 +10,11 @@
 
 import gc
 from math import pi
+import multiprocessing as mp
 from numbers import Number, Real
 import numpy as np
 import numpy.ma as ma
+import os
 from numpy.fft import fftn, fftshift, ifftn, ifftshift
 import scipy
 import matplotlib.pyplot as plt
@@ -27,6 +29,9 @@ from ..utils import image_registration as reg
 from ..utils import utilities as util
 from ..utils import validation as valid
 
+# metrics of the reconstructions already sorted, see sort_reconstruction()
+_reconstruction_metrics_cache = {}
+
 
 def align_obj(
     reference_obj,
@@ -266,6 +271,7 @@ def average_obj(
     width_y=None,
     width_x=None,
     method="reciprocal_space",
+    registration=None,
     debugging=False,
     **kwargs,
 ):
@@ -291,6 +297,10 @@ def average_obj(
      the initial array
     :param method: 'real_space' or 'reciprocal_space', in which space the average will
      be performed
+    :param registration: optional RegistrationEngine instantiated with ref_obj, used
+     for the dft registration. Provide it when averaging several reconstructions with
+     the same reference, so that the Fourier transforms of the reference are
+     calculated only once.
     :param debugging: set to True to see plots
     :type debugging: bool
     :param kwargs:
@@ -301,6 +311,10 @@ def average_obj(
     :return: the average complex density
     """
     valid.valid_ndarray(arrays=(obj, avg_obj, ref_obj), ndim=3)
+    if registration is not None and not isinstance(
+        registration, reg.RegistrationEngine
+    ):
+        raise TypeError("registration should be a RegistrationEngine instance")
     # check and load kwargs
     valid.valid_kwargs(
         kwargs=kwargs,
@@ -374,12 +388,10 @@ def average_obj(
             new_obj = new_obj.reshape((nbz, nby, nbx)).astype(obj.dtype)
         else:
             # dft registration and subpixel shift (see Matlab code)
-            shiftz, shifty, shiftx = reg.getimageregistration(
-                abs(ref_obj), abs(obj), precision=1000
-            )
-            new_obj = reg.subpixel_shift(
-                obj, shiftz, shifty, shiftx
-            )  # keep the complex output here
+            if registration is None:
+                registration = reg.RegistrationEngine(ref_obj, precision=1000)
+            # keep the complex output here
+            new_obj, (shiftz, shifty, shiftx) = registration.align(obj)
             print(
                 "Shift calculated from dft registration: (",
                 str("{:.2f}".format(shiftz)),
@@ -1293,45 +1305,46 @@ def get_opticalpath(support, direction, k, voxel_size=None, debugging=False, **k
     #############################################
     # calculate the optical path for each voxel #
     #############################################
-    for idz in range(min_z, max_z, 1):
-        for idy in range(min_y, max_y, 1):
-            for idx in range(min_x, max_x, 1):
-                stop_flag = False
-                counter = support[
-                    idz, idy, idx
-                ]  # include also the pixel if it belongs to the support
-                pixel = np.array(
-                    [idz, idy, idx]
-                )  # pixel for which the optical path is calculated
-                # beware, the support could be 0 at some voxel inside the object also,
-                # but the loop should continue until it reaches the end of the box
-                # (min_z, max_z, min_y, max_y, min_x, max_x)
-                while not stop_flag:
-                    pixel = pixel + k_norm  # add unitary translation in -k_in direction
-                    coords = np.rint(pixel)
-                    stop_flag = True
-                    if (
-                        (min_z <= coords[0] <= max_z)
-                        and (min_y <= coords[1] <= max_y)
-                        and (min_x <= coords[2] <= max_x)
-                    ):
-                        counter = (
-                            counter
-                            + support[int(coords[0]), int(coords[1]), int(coords[2])]
-                        )
-                        stop_flag = False
-
-                # For each voxel, counter is the number of steps along the unitary
-                # k vector where the support is non zero. Now we need to convert this
-                # into nm using the voxel size, different in each dimension
-                endpoint = (
-                    np.array([idz, idy, idx]) + counter * k_norm
-                )  # indices of the final voxel
-                path[idz, idy, idx] = np.sqrt(
-                    ((np.rint(endpoint[0]) - idz) * voxel_size[0]) ** 2
-                    + ((np.rint(endpoint[1]) - idy) * voxel_size[1]) ** 2
-                    + ((np.rint(endpoint[2]) - idx) * voxel_size[2]) ** 2
-                )
+    # The ray starting from each voxel of the box is marched simultaneously for all
+    # voxels: after s unitary steps along k_norm, every voxel is shifted by the same
+    # integer offset rint(s * k_norm). The number of steps where the support is
+    # non-zero is therefore a sum of shifted copies of the support. Since the box is
+    # convex and the offsets are monotonous, a ray never re-enters the box once it
+    # left it, which is equivalent to the stop condition of a per-voxel march.
+    box_support = support[min_z:max_z, min_y:max_y, min_x:max_x].astype(float)
+    box_shape = np.asarray(box_support.shape)
+    # beware, the support could be 0 at some voxel inside the object also,
+    # but the march should continue until it reaches the end of the box
+    nb_steps = int(np.ceil(np.linalg.norm(box_shape))) + 1
+    # offsets of the marched voxels for each step
+    offsets = np.rint(np.outer(np.arange(1, nb_steps + 1), k_norm)).astype(int)
+    offsets = offsets[np.all(abs(offsets) < box_shape, axis=1)]
+    # identical offsets for consecutive steps need to be counted several times
+    offsets, nb_occurences = np.unique(offsets, axis=0, return_counts=True)
+
+    # include also the voxel itself if it belongs to the support
+    counter = np.copy(box_support)
+    for offset, occurence in zip(offsets, nb_occurences):
+        start = np.maximum(-offset, 0)  # first voxel with a marched voxel in the box
+        stop = box_shape - np.maximum(offset, 0)
+        counter[start[0] : stop[0], start[1] : stop[1], start[2] : stop[2]] += (
+            occurence
+            * box_support[
+                start[0] + offset[0] : stop[0] + offset[0],
+                start[1] + offset[1] : stop[1] + offset[1],
+                start[2] + offset[2] : stop[2] + offset[2],
+            ]
+        )
+
+    # For each voxel, counter is the number of steps along the unitary
+    # k vector where the support is non zero. Now we need to convert this
+    # into nm using the voxel size, different in each dimension
+    grid_z, grid_y, grid_x = np.ogrid[min_z:max_z, min_y:max_y, min_x:max_x]
+    path[min_z:max_z, min_y:max_y, min_x:max_x] = np.sqrt(
+        ((np.rint(grid_z + counter * k_norm[0]) - grid_z) * voxel_size[0]) ** 2
+        + ((np.rint(grid_y + counter * k_norm[1]) - grid_y) * voxel_size[1]) ** 2
+        + ((np.rint(grid_x + counter * k_norm[2]) - grid_x) * voxel_size[2]) ** 2
+    )
 
     ##################
     # debugging plot #
@@ -1564,35 +1577,15 @@ def mean_filter(
                 title="Support for averaging",
             )
 
-        nonzero_pixels = np.argwhere(support != 0)
-        new_values = np.zeros((nonzero_pixels.shape[0], 1), dtype=array.dtype)
-        counter = 0
-        for indx in range(nonzero_pixels.shape[0]):
-            piz = nonzero_pixels[indx, 0]
-            piy = nonzero_pixels[indx, 1]
-            pix = nonzero_pixels[indx, 2]
-            tempo_support = support[
-                piz - half_width : piz + half_width + 1,
-                piy - half_width : piy + half_width + 1,
-                pix - half_width : pix + half_width + 1,
-            ]
-            nb_points = tempo_support.sum()
-            temp_phase = array[
-                piz - half_width : piz + half_width + 1,
-                piy - half_width : piy + half_width + 1,
-                pix - half_width : pix + half_width + 1,
-            ]
-            if temp_phase.size != 0:
-                value = temp_phase[np.nonzero(tempo_support)].sum() / nb_points
-                new_values[indx] = value
-            else:
-                counter = counter + 1
-        for indx in range(nonzero_pixels.shape[0]):
-            array[
-                nonzero_pixels[indx, 0],
-                nonzero_pixels[indx, 1],
-                nonzero_pixels[indx, 2],
-            ] = new_values[indx]
+        # normalized convolution: sum(array * support) / sum(support) in the
+        # averaging window, the window being truncated at the edges of the array
+        nonzero_pixels = support != 0
+        nb_points = util.box_sum(nonzero_pixels, half_width=half_width)
+        sum_values = util.box_sum(
+            np.where(nonzero_pixels, array, 0), half_width=half_width
+        )
+        # nb_points is >= 1 in the support, the voxel itself is counted
+        array[nonzero_pixels] = sum_values[nonzero_pixels] / nb_points[nonzero_pixels]
         if debugging:
             gu.multislices_plot(
                 array,
@@ -1604,12 +1597,10 @@ def mean_filter(
                 title=title + " after averaging",
                 plot_colorbar=True,
             )
-        if counter != 0:
-            print("There were", counter, "voxels for which phase could not be averaged")
     return array
 
 
-def ortho_modes(array_stack, nb_mode=None, method="eig", verbose=False):
+def ortho_modes(array_stack, nb_mode=None, method="eig", verbose=False, out=None):
     """
     Decompose an object into a set of orthogonal modes.
 
@@ -1617,39 +1608,77 @@ def ortho_modes(array_stack, nb_mode=None, method="eig", verbose=False):
     arrays. The decomposition is such that the total intensity (i.e. (abs(m)**2).sum(
     )) is conserved. Adapted from PyNX.
 
+    The stack is processed by chunks of voxels, for all arrays at once: the overlap
+    (Gram) matrix of the arrays is accumulated with matrix products and the modes are
+    projected with matrix products into the output array, without temporary arrays
+    of the size of the stack. array_stack and out can therefore be memory-mapped
+    arrays (e.g. np.load(filename, mmap_mode="r") and np.lib.format.open_memmap()),
+    in which case the reconstructions are streamed from the disk and never fully
+    loaded in memory.
+
      :param array_stack: the stack of modes to orthogonalize along the first dimension.
      :param nb_mode: the maximum number of modes to be returned. If None,
       all are returned. This is useful if nb_mode is used, and only a partial list
       of modes is returned.
-     :param method: either 'eig' to use eigenvalue decomposition or 'svd' to use
-      singular value decomposition.
+     :param method: either 'eig' to use the eigenvalue decomposition of the
+      Hermitian overlap matrix or 'svd' to use singular value decomposition (the
+      whole stack is then loaded in memory).
      :param verbose: set it to True to have more printed comments
+     :param out: optional preallocated array of shape (nb_mode,) +
+      array_stack.shape[1:] where to write the modes, e.g. a numpy.memmap
      :return: an array (modes) with the same shape as given in input, but with
       orthogonal modes, i.e. (mo[i]*mo[j].conj()).sum()=0 for i!=j. The modes are
       sorted by decreasing norm. If nb_mode is not None, only modes up
-      to nb_mode will be returned.
+      to nb_mode will be returned. The modes have the type of array_stack (float if
+      it is an integer array).
     """
     valid.valid_ndarray(arrays=array_stack, ndim=4)
+    if method not in {"eig", "svd"}:
+        raise ValueError('Incorrect value for parameter "method"')
 
     # array stack has the shape: (nb_arrays, L, M, N)
     nb_arrays = array_stack.shape[0]
     array_size = array_stack[0].size  # the size of individual arrays is L x M x N
+    if nb_mode is not None:
+        nb_mode = min(nb_arrays, nb_mode)
+    else:
+        nb_mode = nb_arrays
+    dtype = array_stack.dtype
+    if not np.issubdtype(dtype, np.inexact):
+        dtype = np.dtype(float)
+    if out is None:
+        out = np.empty((nb_mode,) + array_stack.shape[1:], dtype=dtype)
+    else:
+        valid.valid_ndarray(
+            arrays=out, shape=(nb_mode,) + array_stack.shape[1:], name="out"
+        )
+
+    # views of shape (nb_arrays, L x M x N), processed by chunks of voxels
+    flat_stack = array_stack.reshape((nb_arrays, array_size))
+    flat_out = out.reshape((nb_mode, array_size))
+    if not np.may_share_memory(flat_out, out):
+        # out is not C-contiguous and reshape returned a copy, the modes are written
+        # into out with unravelled indices instead
+        flat_out = None
+    chunk_size = max(1, 2 ** 22 // nb_arrays)
+    chunks = [
+        slice(start, min(start + chunk_size, array_size))
+        for start in range(0, array_size, chunk_size)
+    ]
 
     if method == "eig":
-        my_matrix = np.array(
-            [
-                [np.vdot(array2, array1) for array1 in array_stack]
-                for array2 in array_stack
-            ]
+        # overlap matrix, element (i, j) being np.vdot(array_stack[i], array_stack[j])
+        my_matrix = np.zeros(
+            (nb_arrays, nb_arrays), dtype=np.result_type(dtype, np.float64)
         )
-        # array of shape (nb_arrays,nb_arrays)
-        eigenvalues, eigenvectors = np.linalg.eig(
-            my_matrix
-        )  # the number of eigenvalues is nb_arrays
-    elif method == "svd":  # Singular value decomposition
-        my_matrix = np.reshape(array_stack, (nb_arrays, array_size))
+        for chunk in chunks:
+            values = np.asarray(flat_stack[:, chunk])
+            my_matrix += np.matmul(values.conj(), values.T)
+        # the overlap matrix is Hermitian, its eigenvalues are real
+        eigenvalues, eigenvectors = np.linalg.eigh(my_matrix)
+    else:  # Singular value decomposition
         eigenvectors, eigenvalues, _ = scipy.linalg.svd(
-            my_matrix, full_matrices=False, compute_uv=True
+            np.asarray(flat_stack), full_matrices=False, compute_uv=True
         )
         # my_matrix = eigenvectors x S x Vh,
         # where S is a suitably shaped matrix of zeros with main diagonal s
@@ -1657,13 +1686,11 @@ def ortho_modes(array_stack, nb_mode=None, method="eig", verbose=False):
         # for the unitary matrix Vh where K = min(M, N)
         # Here, M is the number of reconstructions nb_arrays,
         # N is the size of a reconstruction array_size
-    else:
-        raise ValueError('Incorrect value for parameter "method"')
 
     sort_indices = (
         -eigenvalues
     ).argsort()  # returns the indices that would sort eigenvalues in descending order
-    print("\neigenvalues", eigenvalues)
+    print("\neigenvalues", eigenvalues[sort_indices])
     eigenvectors = eigenvectors[
         :, sort_indices
     ]  # sort eigenvectors using sort_indices, same shape as my_matrix
@@ -1672,19 +1699,20 @@ def ortho_modes(array_stack, nb_mode=None, method="eig", verbose=False):
         if eigenvectors[abs(eigenvectors[:, idx]).argmax(), idx].real < 0:
             eigenvectors[:, idx] *= -1
 
-    modes = np.array(
-        [
-            sum(array_stack[i] * eigenvectors[i, j] for i in range(nb_arrays))
-            for j in range(nb_arrays)
-        ]
-    )
-    # # the double nested comprehension list above is equivalent to the following code:
-    # modes = np.zeros(array_stack.shape, dtype=complex)
-    # for j in range(nb_arrays):
-    #     temp = np.zeros(array_stack[0].shape, dtype=complex)
-    #     for i in range(nb_arrays):
-    #         temp += array_stack[i] * eigenvectors[i, j]
-    #     modes[j] = temp
+    # mode j is sum_i(array_stack[i] * eigenvectors[i, j]), all modes are calculated
+    # for the weights but only nb_mode modes are kept
+    coefficients = eigenvectors.T.astype(np.result_type(dtype, eigenvectors.dtype))
+    intensities = np.zeros(nb_arrays)
+    for chunk in chunks:
+        modes = np.matmul(coefficients, flat_stack[:, chunk])
+        intensities += (abs(modes) ** 2).sum(axis=1)
+        if flat_out is not None:
+            flat_out[:, chunk] = modes[:nb_mode]
+        else:
+            indices = np.unravel_index(
+                np.arange(chunk.start, chunk.stop), out.shape[1:]
+            )
+            out[(slice(None),) + indices] = modes[:nb_mode]
 
     if verbose:
         print("Orthonormal decomposition coefficients (rows)")
@@ -1698,17 +1726,43 @@ def ortho_modes(array_stack, nb_mode=None, method="eig", verbose=False):
             )
         )
 
-    if nb_mode is not None:
-        nb_mode = min(nb_arrays, nb_mode)
-    else:
-        nb_mode = nb_arrays
+    weights = intensities / intensities.sum()
+
+    return out, eigenvectors, weights
+
+
+def reconstruction_metrics(file_path, data_range, amplitude_threshold):
+    """
+    Calculate the quality metrics of a reconstruction, used for sorting.
+
+    Only the centered region of the reconstruction defined by data_range is read from
+    the file (.npy, .cxi and .h5 files). The support is defined by the voxels where
+    the normalized amplitude is larger than amplitude_threshold.
 
-    weights = (
-        np.array([(abs(modes[i]) ** 2).sum() for i in range(nb_arrays)])
-        / (abs(modes) ** 2).sum()
+    :param file_path: path of the reconstruction
+    :param data_range: tuple of three integers, half-size of the region used along
+     each axis
+    :param amplitude_threshold: threshold used to define a support from the amplitude
+    :return: a 1D array of four metrics: 1/mean(amplitude), variance(amplitude),
+     variance(amplitude)/mean(amplitude) and 1/volume(support), the amplitude being
+     considered inside of the support
+    """
+    print("Opening ", file_path)
+    obj, _ = util.load_file(
+        file_path, crop_shape=[2 * half_size for half_size in data_range]
     )
+    amp = abs(obj)
+    amp = amp / amp.max()
+    # padding the object to the range of interest would add zeros outside
+    # of the support, the metrics are calculated from the cropped object
+    amp = amp[amp > amplitude_threshold]
 
-    return modes[:nb_mode], eigenvectors, weights
+    metrics = np.empty(4)
+    metrics[0] = 1 / amp.mean()  # 1/mean(amp)
+    metrics[1] = np.var(amp)  # var(amp)
+    metrics[2] = metrics[0] * metrics[1]  # var(amp)/mean(amp) index of dispersion
+    metrics[3] = 1 / amp.size  # 1/volume(support)
+    return metrics
 
 
 def regrid(array, old_voxelsize, new_voxelsize):
@@ -2314,93 +2368,77 @@ def remove_ramp_2d(
 
 
 def sort_reconstruction(
-    file_path, data_range, amplitude_threshold, sort_method="variance/mean"
+    file_path,
+    data_range,
+    amplitude_threshold,
+    sort_method="variance/mean",
+    nb_workers=1,
+    use_cache=True,
 ):
     """
     Sort out reconstructions based on the metric 'sort_method'.
 
+    The metrics of each file are calculated with reconstruction_metrics(), in a pool
+    of processes if nb_workers > 1. They are cached in memory, keyed by the file
+    path, its modification time and the parameters data_range and
+    amplitude_threshold, so that sorting again the same files with another
+    sort_method does not reload them.
+
     :param file_path: path of the reconstructions to sort out
     :param data_range: data will be cropped or padded to this range
     :param amplitude_threshold: threshold used to define a support from the amplitude
     :param sort_method: method for sorting the reconstructions: 'variance/mean',
      'mean_amplitude', 'variance' or 'volume'
+    :param nb_workers: number of processes used for loading the files
+    :param use_cache: True to reuse the metrics of files already loaded
     :return: a list of sorted indices in 'file_path', from the best object to the worst.
     """
+    valid.valid_item(nb_workers, allowed_types=int, min_excluded=0, name="nb_workers")
+    valid.valid_item(use_cache, allowed_types=bool, name="use_cache")
     nbfiles = len(file_path)
-    zrange, yrange, xrange = data_range
-
-    quality_array = np.ones(
-        (nbfiles, 4)
-    )  # 1/mean_amp, variance(amp), variance(amp)/mean_amp, 1/volume
-    for ii in range(nbfiles):
-        obj, _ = util.load_file(file_path[ii])
-        print("Opening ", file_path[ii])
-
-        # use the range of interest defined above
-        obj = util.crop_pad(obj, [2 * zrange, 2 * yrange, 2 * xrange], debugging=False)
-        obj = abs(obj) / abs(obj).max()
-
-        temp_support = np.zeros(obj.shape)
-        temp_support[obj > amplitude_threshold] = 1  # only for plotting
-        quality_array[ii, 0] = 1 / obj[obj > amplitude_threshold].mean()  # 1/mean(amp)
-        quality_array[ii, 1] = np.var(obj[obj > amplitude_threshold])  # var(amp)
-        quality_array[ii, 2] = (
-            quality_array[ii, 0] * quality_array[ii, 1]
-        )  # var(amp)/mean(amp) index of dispersion
-        quality_array[ii, 3] = 1 / temp_support.sum()  # 1/volume(support)
-        del temp_support
-        gc.collect()
-
-        # order reconstructions by minimizing the quality factor
-    if sort_method == "mean_amplitude":  # sort by quality_array[:, 0] first
-        sorted_obj = np.lexsort(
-            (
-                quality_array[:, 3],
-                quality_array[:, 2],
-                quality_array[:, 1],
-                quality_array[:, 0],
-            )
-        )
-
-    elif sort_method == "variance":  # sort by quality_array[:, 1] first
-        sorted_obj = np.lexsort(
-            (
-                quality_array[:, 0],
-                quality_array[:, 3],
-                quality_array[:, 2],
-                quality_array[:, 1],
-            )
-        )
-
-    elif sort_method == "variance/mean":  # sort by quality_array[:, 2] first
-        sorted_obj = np.lexsort(
-            (
-                quality_array[:, 1],
-                quality_array[:, 0],
-                quality_array[:, 3],
-                quality_array[:, 2],
-            )
-        )
-
-    elif sort_method == "volume":  # sort by quality_array[:, 3] first
-        sorted_obj = np.lexsort(
-            (
-                quality_array[:, 2],
-                quality_array[:, 1],
-                quality_array[:, 0],
-                quality_array[:, 3],
-            )
-        )
-
-    else:  # default case, use the index of dispersion
-        sorted_obj = np.lexsort(
-            (
-                quality_array[:, 1],
-                quality_array[:, 0],
-                quality_array[:, 3],
-                quality_array[:, 2],
-            )
+    keys = [
+        (
+            os.path.abspath(filename),
+            os.stat(filename).st_mtime_ns,
+            tuple(data_range),
+            amplitude_threshold,
         )
+        for filename in file_path
+    ]
+    to_load = {}  # index of the first file of each key whose metrics are needed
+    for idx, key in enumerate(keys):
+        if key not in to_load and not (
+            use_cache and key in _reconstruction_metrics_cache
+        ):
+            to_load[key] = idx
+
+    args = [
+        (file_path[idx], data_range, amplitude_threshold) for idx in to_load.values()
+    ]
+    if nb_workers > 1 and len(args) > 1:
+        with mp.Pool(processes=min(nb_workers, len(args))) as pool:
+            metrics = pool.starmap(reconstruction_metrics, args)
+    else:
+        metrics = [reconstruction_metrics(*arg) for arg in args]
+    loaded = dict(zip(to_load.keys(), metrics))
+    if use_cache:
+        _reconstruction_metrics_cache.update(loaded)
+        loaded = _reconstruction_metrics_cache
+
+    # 1/mean_amp, variance(amp), variance(amp)/mean_amp, 1/volume
+    quality_array = np.array([loaded[key] for key in keys]).reshape((nbfiles, 4))
+
+    # order reconstructions by minimizing the quality factor, the last column of
+    # each sort key is used first
+    sort_keys = {
+        "mean_amplitude": (3, 2, 1, 0),
+        "variance": (0, 3, 2, 1),
+        "variance/mean": (1, 0, 3, 2),
+        "volume": (2, 1, 0, 3),
+    }
+    # default case, use the index of dispersion
+    sort_key = sort_keys.get(sort_method, sort_keys["variance/mean"])
+    sorted_obj = np.lexsort(tuple(quality_array[:, column] for column in sort_key))
 
     print("quality_array")
     print(quality_array)
@@ -48,12 +48,27 @@ class DataSet:
     The object will also contains some basic methods for data reuction such as ROI
     extraction, attenuation correction and plotting. Meant to be used on the data
     produced after the 11/03/2019 data of the upgrade of the datarecorder.
+
+    In lazy mode, the file is kept open and nothing is read from scan_data when
+    opening it. Counters are read from the file on their first access. Stacks of 2D
+    detector images are returned as PyTables arrays, which are read only for the
+    frames or the region of interest being sliced, e.g. dataset.merlin[idx, :, :].
+    The file should be closed with DataSet.close() when it is not needed anymore,
+    counters remain available afterwards. Accessing a stack after closing the file
+    reopens it, the caller is then responsible for closing it again with
+    DataSet.close() or by using the dataset as a context manager.
     """
 
-    def __init__(self, filename, directory="", nxs2spec=False, alias_dict=None):
+    def __init__(
+        self, filename, directory="", nxs2spec=False, alias_dict=None, lazy=False
+    ):
 
         self.directory = directory
         self.filename = filename
+        self.lazy = lazy
+        self._file = None
+        self._lazy_nodes = {}  # leaves of scan_data not read yet in lazy mode
+        self._stack_paths = {}  # paths of the stacks of images after close()
         self.end_time = 2
         self.start_time = 1
         self.attlist = []
@@ -115,8 +130,7 @@ class DataSet:
             # generating the attributes with the recorded scanned data
             for leaf in f.scan_data:
                 list.append(attlist, leaf.name)
-                self.__dict__[leaf.name] = leaf[:]
-                time.sleep(0.1)
+                self._set_leaf(leaf.name, leaf)
             self.attlist = attlist
 
         ###############
@@ -129,9 +143,9 @@ class DataSet:
                         alias = self._alias_dict[leaf.attrs.long_name.decode("UTF-8")]
                         if alias not in aliases:
                             aliases.append(alias)
-                            self.__dict__[alias] = leaf[:]
+                            self._set_leaf(alias, leaf)
                     except KeyError:
-                        self.__dict__[leaf.attrs.long_name.decode("UTF-8")] = leaf[:]
+                        self._set_leaf(leaf.attrs.long_name.decode("UTF-8"), leaf)
                         aliases.append(leaf.attrs.long_name.decode("UTF-8"))
                 self.attlist = aliases
 
@@ -146,13 +160,13 @@ class DataSet:
                             attr.split("/")[-1] == "sensorsTimestamps"
                         ):  # rename the sensortimestamps as epoch
                             list.append(attlist, "epoch")
-                            self.__dict__["epoch"] = leaf[:]
+                            self._set_leaf("epoch", leaf)
                         else:
                             list.append(attlist, attr.split("/")[-1])
-                            self.__dict__[attr.split("/")[-1]] = leaf[:]
+                            self._set_leaf(attr.split("/")[-1], leaf)
                     else:  # Dealing with for double naming
                         list.append(attlist, "_".join(attrlong))
-                        self.__dict__["_".join(attrlong)] = leaf[:]
+                        self._set_leaf("_".join(attrlong), leaf)
                 self.attlist = attlist
 
         ##########################
@@ -176,7 +190,11 @@ class DataSet:
             if detsize in bl2d:
                 detname = bl2d[detsize]  # the detector name from the size
                 if not hasattr(self, detname):
-                    self.__setattr__(detname, detarray)  # adding the new attrinute name
+                    # adding the new attribute name
+                    if el in self._lazy_nodes:
+                        self._lazy_nodes[detname] = self._lazy_nodes[el]
+                    else:
+                        self.__setattr__(detname, detarray)
                     self.attlist.append(detname)
             else:
                 print("Detected a not standard detector: check ReadNxs3")
@@ -599,11 +617,74 @@ class DataSet:
         except tables.NoSuchNodeError:
             print("No Xpad Publisher defined")
         print("### End of ReadNxs3 ###\n")
-        ff.close()
+        if self.lazy:
+            self._file = ff
+        else:
+            ff.close()
+
+    def __getattr__(self, name):
+        """
+        Read a leaf of scan_data on its first access in lazy mode.
+
+        Accessing a stack of images after close() reopens the file, which has to be
+        closed again by the caller.
+        """
+        # __getattr__ is called only if the attribute was not found
+        lazy_nodes = self.__dict__.get("_lazy_nodes", {})
+        if name not in lazy_nodes and name in self.__dict__.get("_stack_paths", {}):
+            self._reopen()
+            lazy_nodes = self._lazy_nodes
+        if name not in lazy_nodes:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            )
+        node = lazy_nodes[name]
+        if node.ndim == 3:
+            # stack of 2D detector images, read only when sliced
+            return node
+        self.__dict__[name] = node[:]
+        return self.__dict__[name]
+
+    def __enter__(self):
+        """Use the dataset as a context manager closing the file."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the file when leaving the context."""
+        self.close()
 
     ############################################
     # down here useful function in the NxsRead #
     ############################################
+    def close(self):
+        """
+        Close the file kept open in lazy mode.
+
+        The counters not accessed yet are read before closing the file. Accessing a
+        stack of 2D detector images afterwards reopens the file, it should then be
+        closed again.
+        """
+        if self._file is not None:
+            for name, node in self._lazy_nodes.items():
+                if node.ndim == 3:
+                    self._stack_paths[name] = node._v_pathname
+                elif name not in self.__dict__:
+                    self.__dict__[name] = node[:]
+            self._file.close()
+            self._file = None
+            self._lazy_nodes = {}
+
+    def _reopen(self):
+        """
+        Reopen the file closed with close() to access the stacks of images.
+
+        The file stays open until the next call to close().
+        """
+        self._file = tables.open_file(os.path.join(self.directory, self.filename), "r")
+        self._lazy_nodes = {
+            name: self._file.get_node(path) for name, path in self._stack_paths.items()
+        }
+
     def get_stack(self, det2d_name):
         """
         Check in the attribute-list for a given 2D detector.
@@ -612,7 +693,7 @@ class DataSet:
         :return: the stack of images
         """
         try:
-            stack = self.__getattribute__(det2d_name)
+            stack = getattr(self, det2d_name)
             return stack
         except AttributeError:
             print("There is no such attribute")
@@ -687,7 +768,7 @@ class DataSet:
         scans the ROI is expected as eg: [257, 126,  40,  40]
         """
         if hasattr(self, maskname):
-            mask = self.__getattribute__(maskname)
+            mask = getattr(self, maskname)
             integrals = self.roi_sum_mask(stack, roiextent, mask)
         if not hasattr(self, maskname):
             integrals = self.roi_sum(stack, roiextent)
@@ -809,23 +890,23 @@ class DataSet:
                 if not hasattr(
                     self, "_npts"
                 ):  # check if the process was alredy runned once on this object
-                    self._npts = len(self.__getattribute__(list2d[0]))
+                    self._npts = len(getattr(self, list2d[0]))
                     for el in list2d:
-                        if self.__getattribute__("_ifmask_" + el):
+                        if getattr(self, "_ifmask_" + el):
                             maskname = "_mask_" + el
-                        if not self.__getattribute__("_ifmask_" + el):
+                        if not getattr(self, "_ifmask_" + el):
                             maskname = "NO_mask_"  # not existent attribute filtered
                             # away from the roi_sum function
                         for pos, roi in enumerate(
-                            self.__getattribute__("_roi_limits_" + el), start=0
+                            getattr(self, "_roi_limits_" + el), start=0
                         ):
                             roi_name = (
-                                self.__getattribute__("_roi_names_" + el)[pos]
+                                getattr(self, "_roi_names_" + el)[pos]
                                 + "_"
                                 + el
                                 + "c_new"
                             )
-                            stack = self.__getattribute__(el)
+                            stack = getattr(self, el)
                             attenuators = self.att_sbs_xpad[:]
                             self.calc_roi(
                                 stack,
@@ -851,23 +932,23 @@ class DataSet:
                 if not hasattr(
                     self, "_npts"
                 ):  # check if the process was alredy runned once on this object
-                    self._npts = len(self.__getattribute__(self._list2d[0]))
+                    self._npts = len(getattr(self, self._list2d[0]))
                     for el in self._list2d:
-                        if self.__getattribute__("_ifmask_" + el):
+                        if getattr(self, "_ifmask_" + el):
                             maskname = "_mask_" + el
-                        if not self.__getattribute__("_ifmask_" + el):
+                        if not getattr(self, "_ifmask_" + el):
                             maskname = "NO_mask_"  # not existent attribute filtered
                             # away from the roi_sum function
                         for pos, roi in enumerate(
-                            self.__getattribute__("_roi_limits_" + el), start=0
+                            getattr(self, "_roi_limits_" + el), start=0
                         ):
                             roi_name = (
-                                self.__getattribute__("_roi_names_" + el)[pos]
+                                getattr(self, "_roi_names_" + el)[pos]
                                 + "_"
                                 + el
                                 + "c_new"
                             )
-                            stack = self.__getattribute__(el)
+                            stack = getattr(self, el)
                             attenuators = self.attenuation[
                                 :
                             ]  # filters and motors are shifted of one points
@@ -894,7 +975,7 @@ class DataSet:
         :return: a matrix of size: 'side detector pixels' x 'number of images'
         """
         if hasattr(self, "mask"):
-            mask = self.__getattribute__("mask")
+            mask = getattr(self, "mask")
         else:
             mask = 1
         if np.shape(mask_extra):
@@ -902,7 +983,7 @@ class DataSet:
             if np.shape(mask) == (240, 560):
                 self.make_mask_frame_xpad()
         for el in self.attlist:
-            bla = self.__getattribute__(el)
+            bla = getattr(self, el)
             # get the attributes from list one by one
             if len(bla.shape) == 3:  # check for image stacks
                 # Does Not work if you have more than one 2D detectors
@@ -926,7 +1007,16 @@ class DataSet:
         """Return the name of the 2D detector."""
         list2d = []
         for el in self.attlist:
-            bla = self.__getattribute__(el)
+            if el in self._stack_paths and el not in self._lazy_nodes:
+                # stack of images of a closed file
+                list2d.append(el)
+                continue
+            if el in self._lazy_nodes and el not in self.__dict__:
+                # check the shape without reading the leaf
+                if self._lazy_nodes[el].ndim == 3:
+                    list2d.append(el)
+                continue
+            bla = getattr(self, el)
             # get the attributes from list one by one
             if (
                 isinstance(bla, (np.ndarray, np.generic)) and len(bla.shape) == 3
@@ -936,3 +1026,20 @@ class DataSet:
             self._list2d = list2d
             return list2d
         return False
+
+    def _set_leaf(self, name, leaf):
+        """
+        Set a leaf of scan_data as attribute.
+
+        The leaf is read immediately, or on its first access in lazy mode.
+
+        :param name: name of the attribute
+        :param leaf: the PyTables leaf
+        """
+        if self.lazy:
+            self._lazy_nodes[name] = leaf
+        else:
+            self.__dict__[name] = leaf[:]
+            # kept from the original implementation for FLY scans
+            if self.scantype == "FLY":
+                time.sleep(0.1)
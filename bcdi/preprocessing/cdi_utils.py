@@ -421,11 +421,20 @@ def grid_cdi(
      - 'fill_value': tuple of two real numbers, fill values to use for pixels outside
        of the interpolation range. The first value is for the data, the second for the
        mask. Default is (0, 0)
+     - 'gridder': method used when correct_curvature is True, "griddata" to
+       interpolate the data with scipy.interpolate.griddata (very slow), "nearest" or
+       "linear" to spread the data onto the grid with a scatter-add. Default is
+       "griddata".
+     - 'fill_holes': bool, True to fill the empty voxels of the grid with the average
+       of their neighbours, used only with the "nearest" and "linear" gridders.
+       Default is False.
 
     :return: the data and mask interpolated in the laboratory frame, q values
      (downstream, vertical up, outboard)
     """
     fill_value = kwargs.get("fill_value", (0, 0))
+    gridder = kwargs.get("gridder", "griddata")
+    fill_holes = kwargs.get("fill_holes", False)
     valid.valid_ndarray(arrays=(data, mask), ndim=3)
     if setup.beamline == "P10_SAXS":
         if setup.rocking_angle == "inplane":
@@ -461,6 +470,8 @@ def grid_cdi(
         fill_value=fill_value,
         correct_curvature=correct_curvature,
         debugging=debugging,
+        gridder=gridder,
+        fill_holes=fill_holes,
     )
     qx, qz, qy = q_values
 
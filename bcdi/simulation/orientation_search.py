@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+"""OrientationSearch class."""
+from itertools import product
+import multiprocessing as mp
+from numbers import Real
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from bcdi.utils import utilities as util
+from bcdi.utils import validation as valid
+
+# engine shared with the worker processes of OrientationSearch.search, set by
+# _init_search_worker
+_shared_search = {}
+
+
+class OrientationSearch:
+    """
+    Class searching the orientation and unit cell parameters of a crystalline lattice.
+
+    The score of a lattice is the correlation between experimental Bragg peaks and
+    the simulated diffraction pattern, where the 3D peak shape is assigned to each
+    lattice point as in simulation_utils.assign_peakshape(). Instead of calculating
+    the full 3D pattern, the peak shape is sampled only at the experimental nonzero
+    voxels. The Miller indices and the positions of the non-rotated lattice points
+    are calculated once per unit cell parameter, and they are rotated for batches of
+    orientations with one matrix product. The lattice points are defined as in
+    simulation_utils.lattice(), the scores are identical to the correlations
+    calculated with the outputs of simulation_utils.lattice() and assign_peakshape().
+
+    :param q_values: tuple of three 1D arrays (qx, qz, qy), the q values of the
+     data in 1/nm, as returned by simulation_utils.lattice()
+    :param pivot: tuple of three int, position in pixels of the origin of
+     reciprocal space, as returned by simulation_utils.lattice()
+    :param unitcell: 'cubic', 'bcc', 'fcc' or 'bct'
+    :param peak_shape: 3D kernel assigned to each lattice point, of shape (n, n, n)
+     with n odd
+    :param voxels: tuple of three 1D arrays, indices of the experimental nonzero
+     voxels (e.g. the output of np.nonzero)
+    :param weights: 1D array, experimental values at these voxels. If None, the
+     weight of each voxel is 1.
+    """
+
+    chunk_size = 2 ** 22  # maximum number of rotated lattice points per batch
+    valid_unitcells = {"bcc", "bct", "cubic", "fcc"}
+
+    def __init__(self, q_values, pivot, unitcell, peak_shape, voxels, weights=None):
+        if len(q_values) != 3:
+            raise ValueError("q_values should be a tuple of three 1D arrays")
+        self.q_values = tuple(np.asarray(val, dtype=float) for val in q_values)
+        self.shape = tuple(len(val) for val in self.q_values)
+        valid.valid_container(
+            pivot, container_types=(tuple, list), length=3, item_types=int, name="pivot"
+        )
+        self.pivot = tuple(pivot)
+        if unitcell not in self.valid_unitcells:
+            raise ValueError(f"Unit cell '{unitcell}' not yet implemented")
+        self.unitcell = unitcell
+        valid.valid_ndarray(peak_shape, ndim=3, name="peak_shape")
+        if len(set(peak_shape.shape)) != 1 or peak_shape.shape[0] % 2 == 0:
+            raise ValueError("peak_shape should be a cube of odd length")
+        self.peak_shape = peak_shape
+
+        voxels = np.asarray(voxels, dtype=int).reshape((3, -1)).T
+        if weights is None:
+            weights = np.ones(len(voxels))
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape != (len(voxels),):
+            raise ValueError("weights should be a 1D array of one value per voxel")
+        # the peak shape is always zero near the origin of reciprocal space
+        half_width = self.half_width
+        outside_pivot = np.any(
+            abs(voxels - np.asarray(self.pivot)) > half_width, axis=1
+        )
+        self.voxels = voxels[outside_pivot]
+        self.weights = weights[outside_pivot]
+
+        # index of the experimental voxels in the data, -1 elsewhere
+        self._voxel_index = np.full(self.shape, -1, dtype=np.int32)
+        self._voxel_index[tuple(self.voxels.T)] = np.arange(len(self.voxels))
+        # voxels of the data whose kernel box contains an experimental voxel
+        self._near = util.box_sum(self._voxel_index >= 0, half_width=half_width) > 0
+        kernel_range = np.arange(-half_width, half_width + 1)
+        self._kernel_offsets = np.stack(
+            np.meshgrid(kernel_range, kernel_range, kernel_range, indexing="ij"),
+            axis=-1,
+        ).reshape((-1, 3))
+
+    @property
+    def half_width(self):
+        """Half-width of the peak shape in pixels."""
+        return self.peak_shape.shape[0] // 2
+
+    def _kernel_pairs(self, centers):
+        """
+        Find the experimental voxels in the kernel box of each lattice point.
+
+        Depending on which one is the smallest, the lattice points are compared
+        either to all experimental voxels or to all voxels of their kernel box.
+
+        :param centers: array of shape (nb_points, 3), positions of the lattice points
+        :return: the indices of the lattice points, the indices of the voxels and
+         the positions of the voxels relatively to the lattice points
+        """
+        half_width = self.half_width
+        compare_voxels = len(self.voxels) <= len(self._kernel_offsets)
+        step = max(
+            1,
+            self.chunk_size
+            // (len(self.voxels) if compare_voxels else len(self._kernel_offsets)),
+        )
+        points, voxels, differences = [], [], []
+        for start in range(0, len(centers), step):
+            chunk = centers[start : start + step]
+            if compare_voxels:
+                chunk_differences = self.voxels[np.newaxis, :, :] - chunk[:, np.newaxis]
+                indices, chunk_voxels = np.nonzero(
+                    np.all(abs(chunk_differences) <= half_width, axis=-1)
+                )
+                chunk_differences = chunk_differences[indices, chunk_voxels]
+            else:
+                neighbours = chunk[:, np.newaxis] + self._kernel_offsets[np.newaxis]
+                indices, offsets = np.nonzero(
+                    np.all((neighbours >= 0) & (neighbours < self.shape), axis=-1)
+                )
+                chunk_voxels = self._voxel_index[tuple(neighbours[indices, offsets].T)]
+                is_voxel = chunk_voxels >= 0
+                indices, chunk_voxels = indices[is_voxel], chunk_voxels[is_voxel]
+                chunk_differences = self._kernel_offsets[offsets[is_voxel]]
+            points.append(indices + start)
+            voxels.append(chunk_voxels)
+            differences.append(chunk_differences)
+        if not points:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros((0, 3))
+        return (
+            np.concatenate(points),
+            np.concatenate(voxels),
+            np.concatenate(differences),
+        )
+
+    def _check_unitcell_param(self, unitcell_param):
+        """Check the unit cell parameter(s) and return them as a tuple."""
+        if self.unitcell == "bct":
+            valid.valid_container(
+                unitcell_param,
+                container_types=(tuple, list, np.ndarray),
+                length=2,
+                item_types=Real,
+                min_excluded=0,
+                name="unitcell_param",
+            )
+            return tuple(unitcell_param)
+        valid.valid_item(
+            unitcell_param, allowed_types=Real, min_excluded=0, name="unitcell_param"
+        )
+        return (unitcell_param,)
+
+    def lattice_offsets(self, unitcell_param):
+        """
+        Calculate the position of the non-rotated lattice points.
+
+        The lattice points are in the same order as in the lattice functions of
+        simulation_utils, their position is the index of the nearest q value in
+        q values padded on both sides.
+
+        :param unitcell_param: number or tuple of two numbers for 'bct' unit cells,
+         unit cell parameter(s) in nm
+        :return: an array of shape (nb_points, 3), the position of the lattice points
+         in pixels relatively to the pivot, in the order of Rotation() (qx, qy, qz)
+        """
+        params = self._check_unitcell_param(unitcell_param)
+        q_max = np.sqrt(sum(abs(val).max() ** 2 for val in self.q_values))
+        # the maximum Miller index is defined using the long axis parameter for bct
+        h_max = int(np.floor(q_max * params[-1] / (2 * np.pi)))
+        hkl = np.arange(start=-h_max, stop=h_max + 1, step=1)
+        # h downstream along qx, k outboard along qy, l vertical up along qz
+        h, k, ll = (
+            index.ravel() for index in np.meshgrid(hkl, hkl, hkl, indexing="ij")
+        )
+        if self.unitcell in {"bcc", "bct"}:
+            # two point basis (0,0,0), (0.5,0.5,0.5)
+            allowed = (h + k + ll) % 2 == 0
+        elif self.unitcell == "fcc":
+            # four point basis (0,0,0), (0.5,0.5,0), (0,0.5,0.5), (0.5,0,0.5)
+            allowed = ((h + k) % 2 == 0) & ((h + ll) % 2 == 0)
+        else:  # "cubic", one atom basis (0,0,0), all peaks are allowed
+            allowed = np.ones(h.shape, dtype=bool)
+        h, k, ll = h[allowed], k[allowed], ll[allowed]
+
+        recipr_a = 2 * np.pi / params[0]
+        recipr_c = 2 * np.pi / params[-1]
+        offsets = []
+        # qx with h, qy with k, qz with l
+        for axis, index, recipr_param in (
+            (0, h, recipr_a),
+            (2, k, recipr_a),
+            (1, ll, recipr_c),
+        ):
+            q_axis = self.q_values[axis]
+            nb_points = len(q_axis)
+            step = q_axis[1] - q_axis[0]
+            padded = q_axis[0] - nb_points * step + np.arange(3 * nb_points) * step
+            pixel = util.find_nearest(
+                reference_array=padded, test_values=index * recipr_param
+            )
+            offsets.append(pixel - (self.pivot[axis] + nb_points))
+        return np.stack(offsets, axis=1).astype(float)
+
+    def refine(
+        self,
+        euler_angles,
+        unitcell_param,
+        angular_step,
+        unitcell_step=0,
+        nb_levels=3,
+        zoom=4,
+        nb_workers=1,
+    ):
+        """
+        Refine the orientation and the unit cell parameters from coarse to fine.
+
+        At each level, a grid of 2*zoom+1 values spanning +/- the current step around
+        the best values is searched for each angle and unit cell parameter, then the
+        steps are divided by zoom.
+
+        :param euler_angles: tuple of three angles in degrees, initial rotation of the
+         unit cell around (qx, qz, qy)
+        :param unitcell_param: initial unit cell parameter(s) in nm
+        :param angular_step: initial angular step in degrees
+        :param unitcell_step: initial step for the unit cell parameters in nm, 0 to
+         keep them fixed
+        :param nb_levels: number of refinement levels
+        :param zoom: factor between the steps of two successive levels
+        :param nb_workers: number of processes used for the search
+        :return: the refined Euler angles, unit cell parameter(s) and the score
+        """
+        valid.valid_item(nb_levels, allowed_types=int, min_excluded=0, name="nb_levels")
+        valid.valid_item(zoom, allowed_types=int, min_excluded=0, name="zoom")
+        valid.valid_item(
+            angular_step, allowed_types=Real, min_included=0, name="angular_step"
+        )
+        valid.valid_item(
+            unitcell_step, allowed_types=Real, min_included=0, name="unitcell_step"
+        )
+        angles = [float(angle) for angle in euler_angles]
+        params = self._check_unitcell_param(unitcell_param)
+        grid = np.arange(-zoom, zoom + 1) / zoom
+        score = None
+        for _ in range(nb_levels):
+            angle_axes = [angle + angular_step * grid for angle in angles]
+            param_axes = [
+                param + unitcell_step * grid if unitcell_step > 0 else [param]
+                for param in params
+            ]
+            candidates = list(product(*param_axes))
+            if self.unitcell != "bct":
+                candidates = [param[0] for param in candidates]
+            corr = self.search(
+                angles=angle_axes, unitcell_params=candidates, nb_workers=nb_workers
+            )
+            best = np.unravel_index(corr.argmax(), corr.shape)
+            angles = [axis[index] for axis, index in zip(angle_axes, best[:3])]
+            params = self._check_unitcell_param(candidates[best[3]])
+            score = corr[best]
+            angular_step = angular_step / zoom
+            unitcell_step = unitcell_step / zoom
+        best_param = params if self.unitcell == "bct" else params[0]
+        return tuple(angles), best_param, score
+
+    def scores(self, unitcell_param, euler_angles):
+        """
+        Calculate the correlation with the experimental data for several orientations.
+
+        :param unitcell_param: number or tuple of two numbers for 'bct' unit cells,
+         unit cell parameter(s) in nm
+        :param euler_angles: array of shape (nb_orientations, 3), angles in degrees
+         for rotating the unit cell around (qx, qz, qy)
+        :return: a 1D array of nb_orientations scores
+        """
+        offsets = self.lattice_offsets(unitcell_param)
+        euler_angles = np.asarray(euler_angles, dtype=float).reshape((-1, 3))
+        result = np.zeros(len(euler_angles))
+        if len(self.voxels) == 0 or len(offsets) == 0:
+            return result
+
+        half_width = self.half_width
+        pivot = np.asarray(self.pivot)
+        leftpad = np.asarray(self.shape)  # the q values are padded on both sides
+        batch_size = max(1, self.chunk_size // len(offsets))
+        for start in range(0, len(euler_angles), batch_size):
+            batch = euler_angles[start : start + batch_size]
+            # extrinsic rotations, the frame is: x colinear to qx downstream,
+            # y colinear to qy outboard, z colinear to qz vertical up
+            matrices = Rotation.from_euler("xzy", batch, degrees=True).as_matrix()
+            rotated = np.matmul(offsets, np.transpose(matrices, (0, 2, 1)))
+            # shift back the origin, use here CXI convention (downstream, vertical up,
+            # outboard) and calculate indices in the original q values
+            positions = (
+                np.rint(rotated[..., [0, 2, 1]] + pivot + leftpad).astype(int) - leftpad
+            )
+            in_range = np.all((positions >= 0) & (positions < self.shape), axis=-1)
+            orientations, points = np.nonzero(in_range)
+            # keep only lattice points whose kernel box contains experimental voxels
+            near = self._near[tuple(positions[orientations, points].T)]
+            orientations, points = orientations[near], points[near]
+            candidates, voxels, differences = self._kernel_pairs(
+                positions[orientations, points]
+            )
+            orientations, points = orientations[candidates], points[candidates]
+            # the peak shape of the last lattice point overwrites the previous ones
+            order = np.lexsort((points, voxels, orientations))
+            orientations, voxels = orientations[order], voxels[order]
+            differences = differences[order]
+            keys = orientations * len(self.voxels) + voxels
+            last = np.append(keys[1:] != keys[:-1], True)
+            values = self.peak_shape[tuple((differences[last] + half_width).T)]
+            result[start : start + len(batch)] = np.bincount(
+                orientations[last],
+                weights=values * self.weights[voxels[last]],
+                minlength=len(batch),
+            )
+        return result
+
+    def search(self, angles, unitcell_params, nb_workers=1):
+        """
+        Calculate the correlation with the experimental data on a grid.
+
+        :param angles: tuple of three 1D arrays, angles in degrees for rotating the
+         unit cell around qx, qz and qy
+        :param unitcell_params: sequence of unit cell parameters to test, numbers or
+         tuples of two numbers for 'bct' unit cells
+        :param nb_workers: number of processes used for the calculation
+        :return: an array of shape (len(angles[0]), len(angles[1]), len(angles[2]),
+         len(unitcell_params)), the correlation for each set of parameters
+        """
+        valid.valid_item(
+            nb_workers, allowed_types=int, min_excluded=0, name="nb_workers"
+        )
+        angles = [np.atleast_1d(np.asarray(axis, dtype=float)) for axis in angles]
+        if len(angles) != 3:
+            raise ValueError("angles should be a tuple of three 1D arrays")
+        grid_shape = tuple(len(axis) for axis in angles)
+        orientations = np.stack(np.meshgrid(*angles, indexing="ij"), axis=-1).reshape(
+            (-1, 3)
+        )
+        # split the orientations to spread the calculation over the processes
+        nb_chunks = min(len(orientations), nb_workers)
+        tasks = [
+            (param, chunk)
+            for param in unitcell_params
+            for chunk in np.array_split(orientations, nb_chunks)
+        ]
+        if nb_workers > 1 and len(tasks) > 1:
+            # the engine is sent once to each process, not with every task
+            with mp.Pool(
+                processes=min(nb_workers, len(tasks)),
+                initializer=_init_search_worker,
+                initargs=(self,),
+            ) as pool:
+                results = pool.starmap(_search_worker, tasks)
+        else:
+            results = [self.scores(*task) for task in tasks]
+        corr = np.concatenate(results).reshape((len(unitcell_params),) + grid_shape)
+        return np.moveaxis(corr, 0, -1)
+
+
+def _init_search_worker(engine):
+    """
+    Initialize a worker process of OrientationSearch.search.
+
+    :param engine: the instance of OrientationSearch used by the worker
+    """
+    _shared_search["engine"] = engine
+
+
+def _search_worker(unitcell_param, euler_angles):
+    """
+    Calculate the scores of a chunk of orientations in a worker process.
+
+    :param unitcell_param: the unit cell parameter
+    :param euler_angles: 2D array of shape (N, 3), angles in degrees
+    :return: a 1D array of length N, the scores
+    """
+    return _shared_search["engine"].scores(unitcell_param, euler_angles)
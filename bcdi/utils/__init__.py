@@ -11,7 +11,10 @@ BCDI utils.
 
 This package contains utilities functions related to:
  - utilities: data loading, JSON encoding, fitting, data manipulation (rotation)
+ - correlation_monitor: live cross-correlation of detector frames
  - image_registration: DFT registration
+ - interpolation_plan: reusable trilinear interpolation between regular 3D grids
+ - scatter_gridder: gridding of scattered points onto a regular 3D grid
  - validation: the validation of input parameters
 
 """
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+"""CorrelationMonitor class."""
+from multiprocessing.pool import ThreadPool
+import os
+import fabio
+import numpy as np
+
+from bcdi.utils import utilities as util
+from bcdi.utils import validation as valid
+
+
+def read_fabio(file_path):
+    """
+    Read a detector frame with fabio.
+
+    :param file_path: path of the image file
+    :return: the 2D frame
+    """
+    return fabio.open(file_path).data
+
+
+class CorrelationMonitor:
+    """
+    Class monitoring the cross-correlation of detector frames during a measurement.
+
+    Frame files are numbered consecutively from the first index. At each update,
+    only the files which were written since the previous update are loaded. Each
+    frame is cropped to the region of interest and binned, its norm is stored with
+    the frame, and the correlation matrix is extended with the correlations of the
+    new frames with all loaded frames, calculated with one matrix product. Arrays
+    are preallocated and their capacity is doubled when needed.
+
+    :param template_file: template for the file names, e.g. "data_mpx4_%05d.edf.gz"
+    :param start_index: number of the first frame
+    :param read_frame: callable taking the path of a file and returning the 2D frame.
+     By default the file is read with fabio.
+    :param roi: region of interest [y_start, y_stop, x_start, x_stop] of the frames,
+     None to use the full frames
+    :param binning: tuple of two int, the number of pixels to sum in each direction
+    :param nb_workers: number of threads used for loading frames
+    :param capacity: number of frames for which memory is initially allocated
+    """
+
+    def __init__(
+        self,
+        template_file,
+        start_index=0,
+        read_frame=read_fabio,
+        roi=None,
+        binning=(1, 1),
+        nb_workers=1,
+        capacity=256,
+    ):
+        valid.valid_item(template_file, allowed_types=str, name="template_file")
+        valid.valid_item(
+            start_index, allowed_types=int, min_included=0, name="start_index"
+        )
+        if not callable(read_frame):
+            raise TypeError("read_frame should be a callable")
+        if roi is not None:
+            valid.valid_container(
+                roi,
+                container_types=(tuple, list),
+                length=4,
+                item_types=int,
+                min_included=0,
+                name="roi",
+            )
+        valid.valid_container(
+            binning,
+            container_types=(tuple, list),
+            length=2,
+            item_types=int,
+            min_excluded=0,
+            name="binning",
+        )
+        valid.valid_item(
+            nb_workers, allowed_types=int, min_excluded=0, name="nb_workers"
+        )
+        valid.valid_item(capacity, allowed_types=int, min_excluded=0, name="capacity")
+        self.template_file = template_file
+        self.start_index = start_index
+        self.read_frame = read_frame
+        self.roi = roi
+        self.binning = tuple(binning)
+        self.nb_workers = nb_workers
+        self.capacity = capacity
+        self.nb_frames = 0
+        self._frames = None  # flattened binned frames, one per row
+        self._norms = np.zeros(capacity)
+        self._correlation = np.zeros((capacity, capacity))
+
+    @property
+    def correlation(self):
+        """Correlation matrix of the frames loaded so far."""
+        return self._correlation[: self.nb_frames, : self.nb_frames]
+
+    @property
+    def norms(self):
+        """Norm of each frame loaded so far."""
+        return self._norms[: self.nb_frames]
+
+    def _grow(self, nb_frames):
+        """Increase the capacity of the arrays to store at least nb_frames frames."""
+        if nb_frames <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < nb_frames:
+            capacity *= 2
+        frames = np.zeros((capacity, self._frames.shape[1]))
+        frames[: self.nb_frames] = self._frames[: self.nb_frames]
+        norms = np.zeros(capacity)
+        norms[: self.nb_frames] = self.norms
+        correlation = np.zeros((capacity, capacity))
+        correlation[: self.nb_frames, : self.nb_frames] = self.correlation
+        self._frames, self._norms, self._correlation = frames, norms, correlation
+        self.capacity = capacity
+
+    def load(self, index):
+        """
+        Load a frame, crop it to the region of interest and bin it.
+
+        :param index: number of the frame
+        :return: the binned frame as a 2D array
+        """
+        frame = np.asarray(self.read_frame(self.template_file % index), dtype=float)
+        if self.roi is not None:
+            frame = frame[self.roi[0] : self.roi[1], self.roi[2] : self.roi[3]]
+        if self.binning != (1, 1):
+            frame = util.bin_data(frame, binning=self.binning)
+        return frame
+
+    def new_frames(self, max_frames=None):
+        """
+        Find the frames written since the last update.
+
+        :param max_frames: maximum number of frames to return, None for no limit
+        :return: the list of numbers of the new frames
+        """
+        indices = []
+        index = self.start_index + self.nb_frames
+        while (max_frames is None or len(indices) < max_frames) and os.path.isfile(
+            self.template_file % index
+        ):
+            indices.append(index)
+            index += 1
+        return indices
+
+    def update(self, max_frames=None):
+        """
+        Load the new frames and extend the correlation matrix.
+
+        :param max_frames: maximum number of frames to load, None for no limit. It can
+         be used to refresh a display regularly when many frames are pending.
+        :return: the number of new frames
+        """
+        indices = self.new_frames(max_frames=max_frames)
+        if not indices:
+            return 0
+        if self.nb_workers > 1 and len(indices) > 1:
+            with ThreadPool(processes=min(self.nb_workers, len(indices))) as pool:
+                frames = pool.map(self.load, indices)
+        else:
+            frames = [self.load(index) for index in indices]
+        block = np.stack([frame.ravel() for frame in frames])
+        if self._frames is None:
+            self._frames = np.zeros((self.capacity, block.shape[1]))
+        elif block.shape[1] != self._frames.shape[1]:
+            raise ValueError("the new frames do not have the shape of previous frames")
+
+        start, stop = self.nb_frames, self.nb_frames + len(block)
+        self._grow(stop)
+        self._frames[start:stop] = block
+        self._norms[start:stop] = np.sqrt(np.square(block).sum(axis=1))
+        # correlation of the new frames with all frames, including themselves
+        with np.errstate(divide="ignore", invalid="ignore"):
+            new_rows = np.matmul(block, self._frames[:stop].T) / np.outer(
+                self._norms[start:stop], self._norms[:stop]
+            )
+        self._correlation[start:stop, :stop] = new_rows
+        self._correlation[:start, start:stop] = new_rows[:, :start].T
+        self.nb_frames = stop
+        return len(block)
@@ -5,15 +5,239 @@
 # Changed variable names to make it clearer and put it in CXI convention (z y x)
 # J.Carnis 27/04/2018
 """Functions related to DFT registration."""
+from itertools import islice
 import numpy as np
 from numpy.fft import fftn, fftshift, ifftn, ifftshift
-import gc
+
+from bcdi.utils import validation as valid
+
+
+class RegistrationEngine:
+    """
+    Class registering arrays against a fixed reference by DFT registration.
+
+    The shifts are the same as the ones of getimageregistration(reference, array,
+    precision). The Fourier transforms of the reference (of its projections along
+    each axis for 3D arrays) are calculated once when instantiating the engine. The
+    arrays to register are processed by batches: the Fourier transforms of their
+    projections and the cross-correlations with the reference are calculated for the
+    whole batch at once, and the upsampled DFT around the cross-correlation peak is
+    calculated by batched matrix products.
+
+    :param reference: 2D or 3D reference array
+    :param precision: subpixel precision of the registration. Arrays will be
+     registered to within 1/precision of a pixel.
+    :param batch_size: maximum number of arrays registered at once
+    """
+
+    def __init__(self, reference, precision=10, batch_size=16):
+        valid.valid_ndarray(reference, ndim=(2, 3), name="reference")
+        valid.valid_item(precision, allowed_types=int, min_included=1, name="precision")
+        valid.valid_item(
+            batch_size, allowed_types=int, min_included=1, name="batch_size"
+        )
+        self.shape = reference.shape
+        self.precision = precision
+        self.batch_size = batch_size
+        self._reference_ft = [
+            ft[0] for ft in self._transforms(reference[np.newaxis, ...])
+        ]
+
+    @property
+    def ndim(self):
+        """Number of dimensions of the arrays to register."""
+        return len(self.shape)
+
+    def _transforms(self, arrays):
+        """
+        Calculate the Fourier transforms used for the registration.
+
+        :param arrays: stack of 2D or 3D arrays of shape self.shape, the first axis
+         being the index of the array in the stack
+        :return: a list of stacks of 2D Fourier transforms, the projections along
+         axes 0, 1 and 2 for 3D arrays or the arrays themselves for 2D arrays
+        """
+        if self.ndim == 2:
+            return [fftn(arrays, axes=(1, 2))]
+        amplitudes = np.abs(arrays)
+        # need fftshift for wrap around
+        return [
+            fftn(fftshift(amplitudes.sum(axis=axis + 1), axes=(1, 2)), axes=(1, 2))
+            for axis in range(3)
+        ]
+
+    def align(self, array):
+        """
+        Register an array and shift it onto the reference.
+
+        :param array: 2D or 3D array of shape self.shape
+        :return: the shifted (complex) array and the tuple of shifts
+        """
+        shifts = self.get_shift(array)
+        return subpixel_shift(array, *shifts), shifts
+
+    def get_shift(self, array):
+        """
+        Calculate the shift between the reference and an array.
+
+        :param array: 2D or 3D array of shape self.shape
+        :return: the tuple of shifts along each axis
+        """
+        return tuple(self.get_shifts([array])[0])
+
+    def get_shifts(self, arrays):
+        """
+        Calculate the shifts between the reference and several arrays.
+
+        :param arrays: sequence or iterable of 2D or 3D arrays of shape self.shape
+        :return: an array of shape (number of arrays, self.ndim), the shifts along
+         each axis for each array
+        """
+        arrays = iter(arrays)
+        shifts = []
+        while True:
+            batch = list(islice(arrays, self.batch_size))
+            if not batch:
+                break
+            valid.valid_ndarray(tuple(batch), shape=self.shape, name="arrays")
+            batch_ft = self._transforms(np.asarray(batch))
+            # shifts along the two axes of each Fourier transform
+            estimates = [
+                _dft_shifts(ref_ft, moving_ft, ups_factor=self.precision)
+                for ref_ft, moving_ft in zip(self._reference_ft, batch_ft)
+            ]
+            if self.ndim == 2:
+                shifts.append(np.stack(estimates[0], axis=1))
+            else:
+                # two estimates of the shift along each axis, average them
+                (row_0, col_0), (row_1, col_1), (row_2, col_2) = estimates
+                shifts.append(
+                    np.stack(
+                        ((row_2 + row_1) / 2, (col_2 + row_0) / 2, (col_1 + col_0) / 2),
+                        axis=1,
+                    )
+                )
+        if not shifts:
+            return np.empty((0, self.ndim))
+        return np.concatenate(shifts)
+
+
+def _dft_shifts(buf1ft, buf2ft, ups_factor):
+    """
+    Calculate the shifts of a stack of 2D arrays by cross-correlation.
+
+    This is the vectorized counterpart of the shift calculation in dft_registration.
+
+    :param buf1ft: Fourier transform of the reference 2D array, DC in (1,1)
+    :param buf2ft: stack of Fourier transforms of 2D arrays to register, the first
+     axis being the index of the array in the stack
+    :param ups_factor: upsampling factor (integer >= 1)
+    :return: a tuple of two 1D arrays, row and column shifts for each array
+    """
+    nb_arrays, row_nb, column_nb = buf2ft.shape
+
+    # Whole-pixel shift
+    if ups_factor == 1:
+        crosscorr = ifftn(buf1ft * np.conj(buf2ft), axes=(1, 2))
+        row_max, column_max = _stack_index_max(crosscorr)
+        row_shift = np.where(row_max > np.fix(row_nb / 2), row_max - row_nb, row_max)
+        col_shift = np.where(
+            column_max > np.fix(column_nb / 2), column_max - column_nb, column_max
+        )
+        return row_shift.astype(float), col_shift.astype(float)
+
+    # Partial-pixel shift, first upsample by a factor of 2 to obtain initial estimate
+    crosscorr = np.zeros((nb_arrays, 2 * row_nb, 2 * column_nb), dtype=np.complex128)
+    crosscorr[
+        :,
+        int(row_nb - np.fix(row_nb / 2)) : int(row_nb + 1 + np.fix((row_nb - 1) / 2)),
+        int(column_nb - np.fix(column_nb / 2)) : int(
+            column_nb + 1 + np.fix((column_nb - 1) / 2)
+        ),
+    ] = fftshift(buf1ft) * np.conj(fftshift(buf2ft, axes=(1, 2)))
+    crosscorr = ifftn(ifftshift(crosscorr, axes=(1, 2)), axes=(1, 2))
+    row_max, column_max = _stack_index_max(crosscorr)
+    row_shift = np.where(row_max > row_nb, row_max - 2 * row_nb, row_max) / 2
+    col_shift = np.where(column_max > column_nb, column_max - 2 * column_nb, column_max)
+    col_shift = col_shift / 2
+
+    # If upsampling > 2, then refine estimate with matrix multiply DFT
+    if ups_factor > 2:
+        row_shift = np.round(row_shift * ups_factor) / ups_factor
+        col_shift = np.round(col_shift * ups_factor) / ups_factor
+        output_nb = np.ceil(ups_factor * 1.5)
+        dftshift = np.fix(output_nb / 2)  # Center of output array at dftshift+1
+        # Matrix multiply DFT around the current shift estimates
+        crosscorr = _stack_dftups(
+            buf2ft * np.conj(buf1ft),
+            output_nb=int(output_nb),
+            ups_factor=ups_factor,
+            row_offsets=dftshift - row_shift * ups_factor,
+            column_offsets=dftshift - col_shift * ups_factor,
+        )
+        row_max, column_max = _stack_index_max(crosscorr)
+        row_shift = row_shift + (row_max - dftshift) / ups_factor
+        col_shift = col_shift + (column_max - dftshift) / ups_factor
+
+    # If its only one row or column the shift along that dimension has no effect
+    if row_nb == 1:
+        row_shift = np.zeros(nb_arrays)
+    if column_nb == 1:
+        col_shift = np.zeros(nb_arrays)
+    return row_shift, col_shift
+
+
+def _stack_dftups(array, output_nb, ups_factor, row_offsets, column_offsets):
+    """
+    Upsampled DFT by matrix multiplies of a stack of 2D arrays.
+
+    See dftups for the details, each 2D array has its own offsets.
+
+    :param array: stack of 2D arrays, the first axis being the index of the array
+    :param output_nb: number of pixels in the output upsampled DFT along each axis
+    :param ups_factor: upsampling factor
+    :param row_offsets: 1D array, row offset for each array of the stack
+    :param column_offsets: 1D array, column offset for each array of the stack
+    :return: the stack of upsampled DFTs
+    """
+    _, input_row_nb, input_column_nb = array.shape
+    output = np.arange(output_nb)
+    frequencies = ifftshift(np.arange(input_column_nb)) - np.floor(input_column_nb / 2)
+    kernel_column = np.exp(
+        (-1j * 2 * np.pi / (input_column_nb * ups_factor))
+        * frequencies[np.newaxis, :, np.newaxis]
+        * (
+            output[np.newaxis, np.newaxis, :]
+            - column_offsets[:, np.newaxis, np.newaxis]
+        )
+    )
+    frequencies = ifftshift(np.arange(input_row_nb)) - np.floor(input_row_nb / 2)
+    kernel_row = np.exp(
+        (-1j * 2 * np.pi / (input_row_nb * ups_factor))
+        * (output[np.newaxis, :, np.newaxis] - row_offsets[:, np.newaxis, np.newaxis])
+        * frequencies[np.newaxis, np.newaxis, :]
+    )
+    return kernel_row @ array @ kernel_column
+
+
+def _stack_index_max(array):
+    """
+    Look for the location of the maximum modulus in each 2D array of a stack.
+
+    :param array: stack of 2D arrays, the first axis being the index of the array
+    :return: a tuple of two 1D arrays, row and column indices of the maxima
+    """
+    nb_arrays = array.shape[0]
+    indices = np.abs(array).reshape((nb_arrays, -1)).argmax(axis=1)
+    return np.unravel_index(indices, array.shape[1:])
 
 
 def getimageregistration(array1, array2, precision=10):
     """
     Calculate the registration (shift) between two arrays.
 
+    Use a RegistrationEngine to register several arrays against the same reference.
+
     :param array1: the reference array
     :param array2: the array to register
     :param precision: subpixel precision of the registration. Images will be
@@ -22,52 +246,9 @@ def getimageregistration(array1, array2, precision=10):
     """
     if array1.shape != array2.shape:
         raise ValueError("Arrays should have the same shape")
-    # 3D arrays
-    if len(array1.shape) == 3:
-        abs_array1 = np.abs(array1)
-        abs_array2 = np.abs(array2)
-        # compress array (sum) in each dimension, i.e. a bunch of 2D arrays
-        ft_array1_0 = fftn(
-            fftshift(np.sum(abs_array1, 0))
-        )  # need fftshift for wrap around
-        ft_array2_0 = fftn(fftshift(np.sum(abs_array2, 0)))
-        ft_array1_1 = fftn(fftshift(np.sum(abs_array1, 1)))
-        ft_array2_1 = fftn(fftshift(np.sum(abs_array2, 1)))
-        ft_array1_2 = fftn(fftshift(np.sum(abs_array1, 2)))
-        ft_array2_2 = fftn(fftshift(np.sum(abs_array2, 2)))
-
-        # calculate shift in each dimension, i.e. 2 estimates of shift
-        result = dft_registration(ft_array1_2, ft_array2_2, ups_factor=precision)
-        (
-            shiftx1,
-            shifty1,
-        ) = result[2:4]
-        result = dft_registration(ft_array1_1, ft_array2_1, ups_factor=precision)
-        (
-            shiftx2,
-            shiftz1,
-        ) = result[2:4]
-        result = dft_registration(ft_array1_0, ft_array2_0, ups_factor=precision)
-        (
-            shifty2,
-            shiftz2,
-        ) = result[2:4]
-
-        # average them
-        xshift = (shiftx1 + shiftx2) / 2
-        yshift = (shifty1 + shifty2) / 2
-        zshift = (shiftz1 + shiftz2) / 2
-        shift_list = xshift, yshift, zshift
-
-    # 2D arrays
-    elif len(array1.shape) == 2:
-        ft_array1 = fftn(array1)
-        ft_array2 = fftn(array2)
-        result = dft_registration(ft_array1, ft_array2, ups_factor=precision)
-        shift_list = tuple(result[2:])
-    else:
-        shift_list = None
-    return shift_list
+    if array1.ndim not in {2, 3}:
+        return None
+    return RegistrationEngine(array1, precision=precision).get_shift(array2)
 
 
 def index_max(mydata):
@@ -328,53 +509,31 @@ def subpixel_shift(array, z_shift, y_shift, x_shift=0):
     """
     Shift array by the shift values.
 
-    Adapted from the Matlab code of Jesse Clark.
+    Adapted from the Matlab code of Jesse Clark. The phase ramp is separable, it is
+    applied as one 1D ramp per axis broadcasted onto the Fourier transform of the
+    array.
 
     :param array: array to be shifted
     :param z_shift: shift in the first dimension
     :param y_shift: shift in the second dimension
-    :param x_shift: shift in the third dimension
+    :param x_shift: shift in the third dimension, not used for 2D arrays
     :return: the shifted array
     """
-    if len(array.shape) == 3:
-        numz, numy, numx = array.shape
-        buf2ft = fftn(array)
-        del array
-        gc.collect()
-        temp_z = ifftshift(
-            np.arange(-np.fix(numz / 2), np.ceil(numz / 2))
-        )  # python does not include the end point
-        temp_y = ifftshift(
-            np.arange(-np.fix(numy / 2), np.ceil(numy / 2))
-        )  # python does not include the end point
-        temp_x = ifftshift(
-            np.arange(-np.fix(numx / 2), np.ceil(numx / 2))
-        )  # python does not include the end point
-        myz, myy, myx = np.meshgrid(temp_z, temp_y, temp_x, indexing="ij")
-        greg = buf2ft * np.exp(
-            -1j
-            * 2
-            * np.pi
-            * (z_shift * myz / numz + y_shift * myy / numy + x_shift * myx / numx)
+    buf2ft = fftn(array)
+    for axis, shift in enumerate((z_shift, y_shift, x_shift)[: array.ndim]):
+        if shift == 0:
+            continue
+        nb_points = array.shape[axis]
+        # python does not include the end point
+        frequencies = ifftshift(
+            np.arange(-np.fix(nb_points / 2), np.ceil(nb_points / 2))
         )
-        del buf2ft, myz, myy, myx
-        gc.collect()
-        shifted_array = ifftn(greg)
-    else:
-        buf2ft = fftn(array)
-        numz, numy = array.shape
-        temp_z = ifftshift(
-            np.arange(-np.fix(numz / 2), np.ceil(numz / 2))
-        )  # python does not include the end point
-        temp_y = ifftshift(
-            np.arange(-np.fix(numy / 2), np.ceil(numy / 2))
-        )  # python does not include the end point
-        myz, myy = np.meshgrid(temp_z, temp_y, indexing="ij")
-        greg = buf2ft * np.exp(
-            -1j * 2 * np.pi * (z_shift * myz / numz + y_shift * myy / numy)
+        ramp_shape = [1] * array.ndim
+        ramp_shape[axis] = nb_points
+        buf2ft *= np.exp(-1j * 2 * np.pi * shift * frequencies / nb_points).reshape(
+            ramp_shape
         )
-        shifted_array = ifftn(greg)
-    return shifted_array
+    return ifftn(buf2ft)
 
 
 # uncomment below to test the code
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+"""InterpolationPlan class."""
+from itertools import product
+from numbers import Real
+import numpy as np
+
+from bcdi.utils import validation as valid
+
+
+class InterpolationPlan:
+    """
+    Class precomputing a trilinear interpolation between two regular 3D grids.
+
+    The source grid is the grid of voxels of the input arrays, centered as in the
+    orthogonalization methods of the package: the coordinate of the voxel i along an
+    axis of length n is i + (-n // 2). The target points are the nodes of the output
+    grid defined by three 1D axes, expressed in source coordinates through a 3x3
+    matrix. For each target point, the flat index of the lower corner of the enclosing
+    source cell and the three fractional distances to this corner are calculated once.
+    They can then be applied to any number of arrays of the input shape, with the same
+    result as RegularGridInterpolator(method="linear", bounds_error=False).
+
+    For large arrays, the plan can be used without precomputation: the indices and
+    weights are then calculated on the fly for slabs of the output grid along axis 0,
+    the size of the slabs being bounded by the memory budget.
+
+    :param input_shape: shape of the 3D arrays to be interpolated
+    :param output_axes: tuple of three 1D arrays, coordinates of the nodes of the
+     output grid along each array axis
+    :param matrix: 3x3 array transforming output coordinates into source coordinates,
+     the source coordinate along the axis i being sum_j matrix[i, j] * output_axes[j].
+     Axes are in the order of the array axes (0, 1, 2).
+    :param precompute: True to calculate slab by slab and keep in memory the indices
+     and weights for the whole output grid (about 33 bytes per output voxel), False to
+     calculate them for each slab when applying the plan.
+    :param memory_budget: maximum memory in bytes used by the temporary arrays of the
+     interpolation of one slab. The slabs contain at least one plane of the output
+     grid. The memory needed for the input and output arrays is not included. If None,
+     slabs of about chunk_size voxels are used.
+    """
+
+    bytes_per_voxel = 160  # estimated peak memory of temporary arrays per voxel
+    chunk_size = 2 ** 20  # default number of target points interpolated at once
+
+    def __init__(
+        self, input_shape, output_axes, matrix, precompute=True, memory_budget=None
+    ):
+        self._init_grids(
+            input_shape=input_shape, output_axes=output_axes, matrix=matrix
+        )
+        self.memory_budget = memory_budget
+        self._indices, self._fractions, self._inside = None, None, None
+        if precompute:
+            self._precompute()
+
+    @property
+    def input_shape(self):
+        """Shape of the 3D arrays to be interpolated."""
+        return self._input_shape
+
+    @property
+    def is_precomputed(self):
+        """True if the indices and weights are kept in memory."""
+        return self._indices is not None
+
+    @property
+    def matrix(self):
+        """Matrix transforming output coordinates into source coordinates."""
+        return self._matrix
+
+    @property
+    def memory_budget(self):
+        """Maximum memory in bytes used by the temporary arrays of one slab."""
+        return self._memory_budget
+
+    @memory_budget.setter
+    def memory_budget(self, value):
+        valid.valid_item(
+            value,
+            allowed_types=Real,
+            min_excluded=0,
+            allow_none=True,
+            name="memory_budget",
+        )
+        self._memory_budget = value
+
+    @property
+    def nb_planes(self):
+        """Number of planes of the output grid along axis 0 in each slab."""
+        plane_size = self.output_shape[1] * self.output_shape[2]
+        if self.memory_budget is None:
+            return max(1, self.chunk_size // plane_size)
+        return max(1, int(self.memory_budget // (self.bytes_per_voxel * plane_size)))
+
+    @property
+    def output_axes(self):
+        """Coordinates of the nodes of the output grid along each array axis."""
+        return self._output_axes
+
+    @property
+    def output_shape(self):
+        """Shape of the interpolated arrays."""
+        return tuple(len(axis) for axis in self.output_axes)
+
+    def apply(self, array, fill_value=0, out=None):
+        """
+        Interpolate an array on the output grid.
+
+        :param array: 3D array of shape input_shape, real or complex
+        :param fill_value: value used for target points outside of the source grid
+        :param out: optional preallocated array of shape output_shape where to write
+         the result, e.g. a numpy.memmap for arrays not fitting in memory
+        :return: the interpolated array of shape output_shape. Its type is float or
+         complex depending on the type of the input array, if out is not provided.
+        """
+        valid.valid_ndarray(array, shape=self.input_shape, name="array")
+        if out is None:
+            out = np.empty(self.output_shape, dtype=np.result_type(array.dtype, float))
+        else:
+            valid.valid_ndarray(out, shape=self.output_shape, name="out")
+        flat_array = array.ravel()
+        plane_size = self.output_shape[1] * self.output_shape[2]
+        for start in range(0, self.output_shape[0], self.nb_planes):
+            stop = min(start + self.nb_planes, self.output_shape[0])
+            if self.is_precomputed:
+                points = slice(start * plane_size, stop * plane_size)
+                indices, fractions, inside = (
+                    self._indices[points],
+                    self._fractions[points],
+                    self._inside[points],
+                )
+            else:
+                indices, fractions, inside = self._calc_slab(start=start, stop=stop)
+            out[start:stop] = self._interpolate(
+                flat_array=flat_array,
+                indices=indices,
+                fractions=fractions,
+                inside=inside,
+                fill_value=fill_value,
+            ).reshape((stop - start,) + self.output_shape[1:])
+        return out
+
+    def discard_precomputed(self):
+        """
+        Release the precomputed indices and weights.
+
+        They are then calculated for each slab when applying the plan, which keeps the
+        memory usage within the memory budget.
+        """
+        self._indices, self._fractions, self._inside = None, None, None
+
+    def is_compatible(self, input_shape, output_axes, matrix):
+        """
+        Check if the plan corresponds to the provided grids and transformation.
+
+        :param input_shape: shape of the 3D arrays to be interpolated
+        :param output_axes: tuple of three 1D arrays, coordinates of the nodes of the
+         output grid along each array axis
+        :param matrix: 3x3 array transforming output coordinates into source
+         coordinates
+        :return: True if the plan can be used for this interpolation
+        """
+        return (
+            tuple(input_shape) == self.input_shape
+            and len(output_axes) == 3
+            and all(
+                np.array_equal(axis, plan_axis)
+                for axis, plan_axis in zip(output_axes, self.output_axes)
+            )
+            and np.array_equal(matrix, self.matrix)
+        )
+
+    @classmethod
+    def load(cls, filename, memory_budget=None, precompute=True):
+        """
+        Load a plan saved with InterpolationPlan.save().
+
+        :param filename: path of the npz file
+        :param memory_budget: maximum memory in bytes used by the temporary arrays of
+         the interpolation of one slab
+        :param precompute: False to skip loading the precomputed indices and weights
+         saved in the file, they are then calculated for each slab when applying the
+         plan
+        :return: an instance of InterpolationPlan
+        """
+        with np.load(filename) as npzfile:
+            plan = cls.__new__(cls)
+            plan.memory_budget = memory_budget
+            plan._init_grids(
+                input_shape=tuple(int(val) for val in npzfile["input_shape"]),
+                output_axes=(
+                    npzfile["output_axis0"],
+                    npzfile["output_axis1"],
+                    npzfile["output_axis2"],
+                ),
+                matrix=npzfile["matrix"],
+            )
+            if precompute and "indices" in npzfile:
+                plan._indices = npzfile["indices"]
+                plan._fractions = npzfile["fractions"]
+                plan._inside = npzfile["inside"]
+            else:
+                plan._indices, plan._fractions, plan._inside = None, None, None
+        return plan
+
+    def save(self, filename):
+        """
+        Save the plan to disk, in order to reuse it in a later run.
+
+        The indices and weights are saved only if the plan is precomputed.
+
+        :param filename: path of the npz file
+        """
+        plan_arrays = {}
+        if self.is_precomputed:
+            plan_arrays = {
+                "indices": self._indices,
+                "fractions": self._fractions,
+                "inside": self._inside,
+            }
+        np.savez(
+            filename,
+            input_shape=self.input_shape,
+            output_axis0=self.output_axes[0],
+            output_axis1=self.output_axes[1],
+            output_axis2=self.output_axes[2],
+            matrix=self.matrix,
+            **plan_arrays,
+        )
+
+    def _calc_slab(self, start, stop):
+        """
+        Calculate the interpolation indices and weights for a slab of the output grid.
+
+        :param start: index of the first output plane of the slab along axis 0
+        :param stop: index of the last output plane of the slab along axis 0, excluded
+        :return: for each target point of the slab (flattened), the flat index of the
+         lower corner of the source cell, the three fractional distances to this
+         corner and a boolean indicating if the point is inside the source grid
+        """
+        axis0 = self.output_axes[0][start:stop, np.newaxis, np.newaxis]
+        axis1 = self.output_axes[1][np.newaxis, :, np.newaxis]
+        axis2 = self.output_axes[2][np.newaxis, np.newaxis, :]
+        slab_shape = (stop - start,) + self.output_shape[1:]
+        strides = (self.input_shape[1] * self.input_shape[2], self.input_shape[2], 1)
+
+        indices = np.zeros(slab_shape, dtype=np.int64)
+        fractions = np.empty(slab_shape + (3,))
+        inside = np.ones(slab_shape, dtype=bool)
+        for axis, nb_points in enumerate(self.input_shape):
+            coordinates = (
+                self.matrix[axis, 0] * axis0
+                + self.matrix[axis, 1] * axis1
+                + self.matrix[axis, 2] * axis2
+            )
+            grid_start = -nb_points // 2
+            # same convention as RegularGridInterpolator for the bounds and the cells
+            inside &= np.logical_and(
+                coordinates >= grid_start, coordinates <= grid_start + nb_points - 1
+            )
+            lower = np.clip(np.ceil(coordinates - grid_start) - 1, 0, nb_points - 2)
+            lower[~inside] = 0
+            fractions[..., axis] = coordinates - (grid_start + lower)
+            indices += lower.astype(np.int64) * strides[axis]
+        fractions[~inside] = 0
+        return indices.ravel(), fractions.reshape((-1, 3)), inside.ravel()
+
+    def _precompute(self):
+        """
+        Calculate the interpolation indices and weights for the whole output grid.
+
+        The arrays are preallocated and filled slab by slab, with the same slabs as
+        when applying a plan which is not precomputed, so that the temporary arrays
+        stay within the memory budget.
+        """
+        nb_points = int(np.prod(self.output_shape))
+        plane_size = self.output_shape[1] * self.output_shape[2]
+        indices = np.empty(nb_points, dtype=np.int64)
+        fractions = np.empty((nb_points, 3))
+        inside = np.empty(nb_points, dtype=bool)
+        for start in range(0, self.output_shape[0], self.nb_planes):
+            stop = min(start + self.nb_planes, self.output_shape[0])
+            points = slice(start * plane_size, stop * plane_size)
+            indices[points], fractions[points], inside[points] = self._calc_slab(
+                start=start, stop=stop
+            )
+        self._indices, self._fractions, self._inside = indices, fractions, inside
+
+    def _init_grids(self, input_shape, output_axes, matrix):
+        """
+        Check and set the grids and the transformation matrix.
+
+        :param input_shape: shape of the 3D arrays to be interpolated
+        :param output_axes: tuple of three 1D arrays, coordinates of the nodes of the
+         output grid along each array axis
+        :param matrix: 3x3 array transforming output coordinates into source
+         coordinates
+        """
+        valid.valid_container(
+            input_shape,
+            container_types=(tuple, list),
+            length=3,
+            item_types=int,
+            min_excluded=1,
+            name="input_shape",
+        )
+        valid.valid_container(
+            output_axes,
+            container_types=(tuple, list),
+            length=3,
+            name="output_axes",
+        )
+        matrix = np.asarray(matrix, dtype=float)
+        if matrix.shape != (3, 3):
+            raise ValueError(f"matrix should be of shape (3, 3), got {matrix.shape}")
+        self._input_shape = tuple(input_shape)
+        self._output_axes = tuple(np.asarray(axis, dtype=float) for axis in output_axes)
+        self._matrix = matrix
+
+    def _interpolate(self, flat_array, indices, fractions, inside, fill_value):
+        """
+        Gather the values at the corners of the source cells and sum their weights.
+
+        :param flat_array: the flattened array to be interpolated
+        :param indices: flat indices of the lower corners of the source cells
+        :param fractions: fractional distances of the target points to the lower
+         corners, array of shape (len(indices), 3)
+        :param inside: boolean array, False for target points outside of the grid
+        :param fill_value: value used for target points outside of the source grid
+        :return: the interpolated values
+        """
+        strides = (self.input_shape[1] * self.input_shape[2], self.input_shape[2], 1)
+        values = np.zeros(len(indices), dtype=np.result_type(flat_array.dtype, float))
+        for corner in product((0, 1), repeat=3):
+            weight = 1
+            for axis, upper in enumerate(corner):
+                weight = weight * (
+                    fractions[:, axis] if upper else 1 - fractions[:, axis]
+                )
+            values += flat_array[indices + int(np.dot(corner, strides))] * weight
+        values[~inside] = fill_value
+        return values
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+"""ScatterGridder class."""
+from itertools import product
+from numbers import Real
+import numpy as np
+
+from bcdi.utils import utilities as util
+from bcdi.utils import validation as valid
+
+
+class ScatterGridder:
+    """
+    Class accumulating values defined at scattered points onto a regular 3D grid.
+
+    Each point spreads its values onto the nearest grid node (method "nearest") or
+    onto the eight nodes of the enclosing grid cell with trilinear weights (method
+    "linear"). The weighted values and the weights are summed in the grid with a
+    scatter-add, and the gridded arrays are the ratio of the two. The cost is
+    proportional to the number of points, and the points can be added in several
+    blocks (e.g. frame by frame) to limit the memory footprint.
+
+    :param axes: tuple of three 1D arrays, uniformly spaced coordinates of the grid
+     nodes along each array axis
+    :param nb_arrays: number of arrays gridded simultaneously, they share the same
+     points and weights
+    :param method: "nearest" or "linear", the way points are spread onto the grid
+    """
+
+    def __init__(self, axes, nb_arrays=1, method="linear"):
+        valid.valid_container(
+            axes, container_types=(tuple, list), length=3, name="axes"
+        )
+        axes = tuple(np.asarray(axis, dtype=float) for axis in axes)
+        for axis in axes:
+            valid.valid_ndarray(axis, ndim=1, name="axes")
+            if axis.size < 2:
+                raise ValueError("each axis should have at least two nodes")
+            step = axis[1] - axis[0]
+            if step == 0 or not np.allclose(
+                np.diff(axis), step, rtol=0, atol=abs(step) * 1e-6
+            ):
+                raise ValueError("axes should be uniformly spaced")
+        valid.valid_item(nb_arrays, allowed_types=int, min_excluded=0, name="nb_arrays")
+        if method not in {"nearest", "linear"}:
+            raise ValueError(f"method should be 'nearest' or 'linear', got {method}")
+        self._axes = axes
+        self._method = method
+        self._sums = [np.zeros(self.shape) for _ in range(nb_arrays)]
+        self._weights = np.zeros(self.shape)
+
+    @property
+    def axes(self):
+        """Coordinates of the grid nodes along each array axis."""
+        return self._axes
+
+    @property
+    def method(self):
+        """Method used to spread the points onto the grid."""
+        return self._method
+
+    @property
+    def nb_arrays(self):
+        """Number of arrays gridded simultaneously."""
+        return len(self._sums)
+
+    @property
+    def shape(self):
+        """Shape of the grid."""
+        return tuple(axis.size for axis in self.axes)
+
+    @property
+    def weights(self):
+        """Sum of the weights of the points spread onto each grid node."""
+        return self._weights
+
+    def add(self, points, values):
+        """
+        Spread the values of a block of points onto the grid.
+
+        Points outside of the grid are ignored. A temporary array of the size of the
+        grid is allocated for each scatter-add, blocks of points should therefore not
+        be too small compared to the grid.
+
+        :param points: tuple of three arrays of the same shape, the coordinates of the
+         points along each grid axis
+        :param values: tuple of nb_arrays real arrays of the same shape as the
+         coordinates, the values at the points
+        """
+        valid.valid_container(
+            points, container_types=(tuple, list), length=3, name="points"
+        )
+        valid.valid_container(
+            values,
+            container_types=(tuple, list),
+            length=self.nb_arrays,
+            name="values",
+        )
+        points = [np.asarray(coordinates, dtype=float) for coordinates in points]
+        values = [np.asarray(array, dtype=float) for array in values]
+        valid.valid_ndarray(points + values, shape=points[0].shape, name="points")
+        values = [array.ravel() for array in values]
+
+        # fractional indices of the points in the grid
+        positions = [
+            (np.ravel(coordinates) - axis[0]) / (axis[1] - axis[0])
+            for coordinates, axis in zip(points, self.axes)
+        ]
+        if self.method == "nearest":
+            lower = [np.rint(position).astype(np.int64) for position in positions]
+            fractions = None
+            corners = [(0, 0, 0)]
+        else:
+            lower = [np.floor(position).astype(np.int64) for position in positions]
+            fractions = [
+                position - indices for position, indices in zip(positions, lower)
+            ]
+            corners = product((0, 1), repeat=3)
+
+        for corner in corners:
+            flat_indices = np.zeros(lower[0].size, dtype=np.int64)
+            weights = np.ones(lower[0].size)
+            inside = np.ones(lower[0].size, dtype=bool)
+            for axis, offset in enumerate(corner):
+                indices = lower[axis] + offset
+                inside &= np.logical_and(indices >= 0, indices < self.shape[axis])
+                flat_indices = flat_indices * self.shape[axis] + indices
+                if fractions is not None:
+                    weights *= fractions[axis] if offset else 1 - fractions[axis]
+            inside &= weights != 0
+            self._scatter_add(
+                flat_indices=flat_indices[inside],
+                weights=weights[inside],
+                values=[array[inside] for array in values],
+            )
+
+    def result(self, fill_value=0, fill_holes=False):
+        """
+        Normalize the accumulated values by the weights.
+
+        :param fill_value: real number or tuple of nb_arrays real numbers (np.nan
+         allowed), value of the grid nodes where no point was spread
+        :param fill_holes: True to fill empty grid nodes with the weighted average of
+         their first neighbours, e.g. holes in the gridded data due to a coarse
+         sampling of the points
+        :return: a tuple of nb_arrays gridded arrays
+        """
+        if isinstance(fill_value, Real):
+            fill_value = (fill_value,) * self.nb_arrays
+        valid.valid_container(
+            fill_value,
+            container_types=(tuple, list, np.ndarray),
+            length=self.nb_arrays,
+            item_types=Real,
+            name="fill_value",
+        )
+        valid.valid_item(fill_holes, allowed_types=bool, name="fill_holes")
+
+        weights = self.weights
+        sums = self._sums
+        if fill_holes:
+            holes = weights == 0
+            weights = np.where(holes, util.box_sum(weights, half_width=1), weights)
+            sums = [
+                np.where(holes, util.box_sum(array, half_width=1), array)
+                for array in sums
+            ]
+
+        empty = weights == 0
+        output = []
+        for array, value in zip(sums, fill_value):
+            gridded = np.divide(
+                array, weights, out=np.zeros(self.shape), where=np.logical_not(empty)
+            )
+            gridded[empty] = value
+            output.append(gridded)
+        return tuple(output)
+
+    def _scatter_add(self, flat_indices, weights, values):
+        """
+        Add weights and weighted values to the grid nodes of given flat indices.
+
+        The sums are calculated with numpy.bincount on the range of flat indices
+        actually reached by the points.
+
+        :param flat_indices: 1D array of flat indices of grid nodes
+        :param weights: 1D array of weights, same length as flat_indices
+        :param values: list of nb_arrays 1D arrays of values, same length as
+         flat_indices
+        """
+        if flat_indices.size == 0:
+            return
+        start, stop = flat_indices.min(), flat_indices.max() + 1
+        flat_indices = flat_indices - start
+        self._weights.ravel()[start:stop] += np.bincount(
+            flat_indices, weights=weights, minlength=stop - start
+        )
+        for array, value in zip(self._sums, values):
+            array.ravel()[start:stop] += np.bincount(
+                flat_indices, weights=weights * value, minlength=stop - start
+            )
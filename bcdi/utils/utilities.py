@@ -18,12 +18,13 @@ from matplotlib import pyplot as plt
 from numbers import Real, Integral
 import numpy as np
 import os
-from scipy.interpolate import interp1d, RegularGridInterpolator
+from scipy.interpolate import interp1d
 from scipy.optimize import curve_fit
 from scipy.special import erf
 from scipy.stats import multivariate_normal
 
 from ..graph import graph_utils as gu
+from ..utils.interpolation_plan import InterpolationPlan
 from ..utils import validation as valid
 
 
@@ -218,6 +219,50 @@ def bin_parameters(binning, nb_frames, params, debugging=True):
     return params
 
 
+def box_sum(array, half_width):
+    """
+    Sum the values of an array in a moving box window centered on each voxel.
+
+    The box extends half_width voxels on each side of the reference voxel and is
+    truncated at the edges of the array. It is calculated as a sequence of 1D moving
+    sums along each axis (the box filter is separable), using cumulative sums. The
+    cost is therefore proportional to the number of voxels, independently of the
+    window size.
+
+    :param array: 1D, 2D or 3D array, real or complex. Boolean arrays are summed as
+     integers.
+    :param half_width: int or tuple of int (one value per axis), half width of the
+     box, 0 means no summation along that axis, 1 is one pixel away...
+    :return: an array of the same shape as the input array
+    """
+    valid.valid_ndarray(arrays=array, ndim=(1, 2, 3))
+    if isinstance(half_width, Integral):
+        half_width = (half_width,) * array.ndim
+    valid.valid_container(
+        half_width,
+        container_types=(tuple, list),
+        length=array.ndim,
+        item_types=Integral,
+        min_included=0,
+        name="half_width",
+    )
+    if array.dtype == bool:
+        array = array.astype(int)
+
+    for axis, width in enumerate(half_width):
+        if width == 0:
+            continue
+        nb_points = array.shape[axis]
+        pad_width = [(0, 0)] * array.ndim
+        pad_width[axis] = (1, 0)
+        cumulative = np.pad(np.cumsum(array, axis=axis), pad_width)
+        indices = np.arange(nb_points)
+        array = np.take(
+            cumulative, np.minimum(indices + width + 1, nb_points), axis=axis
+        ) - np.take(cumulative, np.maximum(indices - width, 0), axis=axis)
+    return array
+
+
 def catch_error(exception):
     """
     Process exception in asynchronous multiprocessing.
@@ -483,6 +528,12 @@ def find_nearest(reference_array, test_values, width=None):
     """
     Find the indices where original_array is nearest to array_values.
 
+    The index is calculated directly if the reference array is uniformly spaced,
+    otherwise it is found by a binary search in the sorted reference array. In case
+    of equal distances, the smallest index is returned as in numpy.argmin. NaN
+    distances are also handled as in numpy.argmin: the index is 0 for a NaN test
+    value, and the index of the first NaN for a reference array containing NaNs.
+
     :param reference_array: a 1D array where to look for the nearest values
     :param test_values: a number or a 1D array of numbers to be tested
     :param width: if not None, it will look for the nearest element within the range
@@ -502,17 +553,56 @@ def find_nearest(reference_array, test_values, width=None):
         nearest_index = (np.abs(original_array - test_values)).argmin()
         return nearest_index
 
-    nb_values = len(test_values)
-    nearest_index = np.zeros(nb_values, dtype=int)
-    for idx in range(nb_values):
-        nearest_index[idx] = (np.abs(original_array - test_values[idx])).argmin()
+    if test_values.size == 0:
+        return np.zeros(0, dtype=int)
+    nan_indices = np.flatnonzero(np.isnan(original_array))
+    if nan_indices.size != 0:
+        nearest_index = np.full(test_values.size, nan_indices[0])
+        nearest_index[np.isnan(test_values)] = 0
+        return nearest_index
+
+    nb_points = original_array.size
+    step = (original_array[-1] - original_array[0]) / max(1, nb_points - 1)
+    if (
+        nb_points > 1
+        and step != 0
+        and np.allclose(np.diff(original_array), step, rtol=0, atol=abs(step) * 1e-6)
+    ):
+        # uniformly spaced reference array, e.g. a linspace or an arange: calculate
+        # directly the index and check its neighbours to correct rounding errors
+        guess = np.rint((test_values - original_array[0]) / step)
+        guess = np.clip(np.nan_to_num(guess), 0, nb_points - 1).astype(int)
+        candidates = np.clip(
+            guess[:, np.newaxis] + np.array([-1, 0, 1]), 0, nb_points - 1
+        )
+    else:
+        # look for the two values surrounding each test value in the sorted array
+        sorter = np.argsort(original_array, kind="stable")
+        sorted_array = original_array[sorter]
+        position = np.searchsorted(sorted_array, test_values)
+        candidates = np.clip(
+            position[:, np.newaxis] + np.array([-1, 0]), 0, nb_points - 1
+        )
+        # use the first occurrence of each value in the reference array
+        candidates = sorter[
+            np.searchsorted(sorted_array, sorted_array[candidates], side="left")
+        ]
+        candidates.sort(axis=1)
+
+    # in case of equal distances, keep the smallest index like numpy.argmin
+    distances = np.abs(original_array[candidates] - test_values[:, np.newaxis])
+    nearest_index = candidates[np.arange(len(test_values)), distances.argmin(axis=1)]
+    nearest_index[np.isnan(test_values)] = 0
+
     if width is not None:
-        for idx in range(nb_values):
-            if (
-                reference_array[nearest_index[idx]] >= test_values[idx] + width / 2
-            ) or (reference_array[nearest_index[idx]] < test_values[idx] - width / 2):
-                # no neighbour in the range defined by width
-                nearest_index[idx] = -1
+        nearest_values = original_array[nearest_index]
+        # no neighbour in the range defined by width
+        nearest_index[
+            np.logical_or(
+                nearest_values >= test_values + width / 2,
+                nearest_values < test_values - width / 2,
+            )
+        ] = -1
     return nearest_index
 
 
@@ -1076,7 +1166,7 @@ def load_background(background_file):
     return background
 
 
-def load_file(file_path, fieldname=None):
+def load_file(file_path, fieldname=None, crop_shape=None):
     """
     Load a file.
 
@@ -1086,38 +1176,70 @@ def load_file(file_path, fieldname=None):
     :param file_path: the path of the reconstruction to load.
      Format supported: .npy .npz .cxi .h5
     :param fieldname: the name of the field to be loaded
+    :param crop_shape: optional shape of the region to load, centered as in crop_pad.
+     Axes shorter than crop_shape are not padded. For .npy, .cxi and .h5 files, only
+     this region is read from the file.
     :return: the loaded data and the extension of the file
     """
     _, extension = os.path.splitext(file_path)
+
+    def crop(dataset, prefix=()):
+        """Select the centered region of shape crop_shape in the dataset."""
+        if crop_shape is None:
+            return dataset[prefix + (Ellipsis,)]
+        shape = dataset.shape[len(prefix) :]
+        valid.valid_container(
+            crop_shape,
+            container_types=(tuple, list, np.ndarray),
+            length=len(shape),
+            item_types=int,
+            min_excluded=0,
+            name="crop_shape",
+        )
+        return dataset[
+            prefix
+            + tuple(
+                slice(None)
+                if new_size >= size
+                else slice(
+                    size // 2 - new_size // 2, size // 2 + new_size // 2 + new_size % 2
+                )
+                for size, new_size in zip(shape, crop_shape)
+            )
+        ]
+
     if extension == ".npz":  # could be anything
         if fieldname is None:  # output of PyNX phasing
             npzfile = np.load(file_path)
-            dataset = npzfile[list(npzfile.files)[0]]
+            dataset = crop(npzfile[list(npzfile.files)[0]])
         else:  # could be anything
             try:
-                dataset = np.load(file_path)[fieldname]
+                dataset = crop(np.load(file_path)[fieldname])
                 return dataset, extension
             except KeyError:
                 npzfile = np.load(file_path)
-                dataset = npzfile[list(npzfile.files)[0]]
+                dataset = crop(npzfile[list(npzfile.files)[0]])
     elif extension == ".npy":  # could be anything
-        dataset = np.load(file_path)
+        if crop_shape is None:
+            dataset = np.load(file_path)
+        else:
+            dataset = np.array(crop(np.load(file_path, mmap_mode="r")))
     elif extension == ".cxi":  # output of PyNX phasing
         h5file = h5py.File(file_path, "r")
         # group_key = list(h5file.keys())[1]
         # subgroup_key = list(h5file[group_key])
         # dataset = h5file['/'+group_key+'/'+subgroup_key[0]+'/data'].value
-        dataset = h5file["/entry_1/data_1/data"][()]
+        dataset = crop(h5file["/entry_1/data_1/data"])
     elif extension == ".h5":  # modes.h5
         h5file = h5py.File(file_path, "r")
         group_key = list(h5file.keys())[0]
         if group_key == "mask":  # mask object for Nanomax data
-            dataset = h5file["/" + group_key][:]
+            dataset = crop(h5file["/" + group_key])
         else:  # modes.h5 file output of PyNX phase retrieval
             subgroup_key = list(h5file[group_key])
-            dataset = h5file["/" + group_key + "/" + subgroup_key[0] + "/data"][
-                0
-            ]  # select only first mode
+            dataset = crop(
+                h5file["/" + group_key + "/" + subgroup_key[0] + "/data"], prefix=(0,)
+            )  # select only first mode
     else:
         raise ValueError(
             "File format not supported: "
@@ -1249,10 +1371,9 @@ def mean_filter(
 
     # find all voxels to be processed
     if target_val is np.nan:
-        target_pixels = np.argwhere(np.isnan(data))
+        target_pixels = np.isnan(data)
     else:
-        target_pixels = np.argwhere(data == target_val)
-    nb_pixels = 0
+        target_pixels = data == target_val
 
     if debugging:
         gu.combined_plots(
@@ -1269,44 +1390,26 @@ def mean_filter(
             reciprocal_space=True,
         )
 
-    if data.ndim == 2:
-        for indx in range(target_pixels.shape[0]):
-            pixrow = target_pixels[indx, 0]
-            pixcol = target_pixels[indx, 1]
-            temp = data[
-                pixrow - extent : pixrow + extent + 1,
-                pixcol - extent : pixcol + extent + 1,
-            ]
-            temp = temp[np.logical_and(~np.isnan(temp), temp != target_val)]
-            if (
-                temp.size >= nb_neighbours and (temp > min_count).all()
-            ):  # nb_neighbours is >= 1
-                nb_pixels += 1
-                if interpolate == "interp_isolated":
-                    data[pixrow, pixcol] = temp.mean()
-                    mask[pixrow, pixcol] = 0
-                else:
-                    mask[pixrow, pixcol] = 1
-    else:  # 3D
-        for indx in range(target_pixels.shape[0]):
-            pix_z = target_pixels[indx, 0]
-            pix_y = target_pixels[indx, 1]
-            pix_x = target_pixels[indx, 2]
-            temp = data[
-                pix_z - extent : pix_z + extent + 1,
-                pix_y - extent : pix_y + extent + 1,
-                pix_x - extent : pix_x + extent + 1,
-            ]
-            temp = temp[np.logical_and(~np.isnan(temp), temp != target_val)]
-            if (
-                temp.size >= nb_neighbours and (temp > min_count).all()
-            ):  # nb_neighbours is >= 1
-                nb_pixels += 1
-                if interpolate == "interp_isolated":
-                    data[pix_z, pix_y, pix_x] = temp.mean()
-                    mask[pix_z, pix_y, pix_x] = 0
-                else:
-                    mask[pix_z, pix_y, pix_x] = 1
+    # count the valid neighbours and sum their intensity in the window around each
+    # pixel, the window being truncated at the edges of the array
+    valid_pixels = np.logical_and(~np.isnan(data), data != target_val)
+    nb_valid = box_sum(valid_pixels, half_width=extent)
+    nb_low = box_sum(
+        np.logical_and(valid_pixels, np.where(valid_pixels, data, 0) <= min_count),
+        half_width=extent,
+    )
+    # nb_neighbours is >= 1
+    process = np.logical_and(
+        target_pixels, np.logical_and(nb_valid >= nb_neighbours, nb_low == 0)
+    )
+    nb_pixels = int(process.sum())
+
+    if interpolate == "interp_isolated":
+        sum_valid = box_sum(np.where(valid_pixels, data, 0), half_width=extent)
+        data[process] = sum_valid[process] / nb_valid[process]
+        mask[process] = 0
+    else:
+        mask[process] = 1
 
     if debugging:
         gu.combined_plots(
@@ -1648,6 +1751,87 @@ def pseudovoigt(x_axis, amp, cen, sig, ratio):
     )
 
 
+def radial_profile(array, distances, nb_bins, mask=None, max_distance=None):
+    """
+    Calculate statistics of an array over spherical shells.
+
+    The distances are digitized once into nb_bins shells of equal width between 0 and
+    max_distance. The shell i contains the voxels at a distance d such that
+    edges[i] <= d < edges[i+1]. NaN values and masked voxels are ignored. The
+    statistics of all shells are calculated together with np.bincount, the values
+    being grouped by shell with a single sort for calculating the medians.
+
+    :param array: 2D or 3D array of values
+    :param distances: distance of each voxel to the origin, either as an array
+     broadcastable to the shape of array (e.g. calculated from the q values of a
+     non-orthogonal grid), or as a tuple of 1D arrays giving the coordinates relative
+     to the origin along each axis of array, the steps being possibly different
+    :param nb_bins: number of shells
+    :param mask: array of the same shape as array, voxels where the mask is nonzero
+     are ignored
+    :param max_distance: outer edge of the last shell, by default the largest
+     distance
+    :return: a tuple of five 1D arrays:
+
+     - the edges of the shells, of length nb_bins + 1
+     - the mean of the values in each shell
+     - the median of the values in each shell
+     - the standard deviation of the values in each shell
+     - the number of values in each shell
+
+     The statistics of empty shells are NaN.
+    """
+    valid.valid_ndarray(array, ndim=(2, 3))
+    valid.valid_item(nb_bins, allowed_types=int, min_excluded=0, name="nb_bins")
+    if mask is not None:
+        valid.valid_ndarray(mask, shape=array.shape)
+    if isinstance(distances, (tuple, list)):
+        if len(distances) != array.ndim:
+            raise ValueError(
+                "distances should be a tuple of one 1D array per axis of array"
+            )
+        squared = 0
+        for axis, coordinates in enumerate(distances):
+            shape = [1] * array.ndim
+            shape[axis] = -1
+            squared = squared + np.asarray(coordinates, dtype=float).reshape(shape) ** 2
+        distances = np.sqrt(squared)
+    distances = np.broadcast_to(distances, array.shape)
+    if max_distance is None:
+        max_distance = distances.max()
+    edges = np.linspace(0, max_distance, endpoint=True, num=nb_bins + 1)
+
+    # the distances beyond the last edge are assigned to the index nb_bins
+    shells = np.digitize(distances.ravel(), edges) - 1
+    values = array.ravel()
+    in_shell = (shells >= 0) & (shells < nb_bins) & ~np.isnan(values)
+    if mask is not None:
+        in_shell &= mask.ravel() == 0
+    shells, values = shells[in_shell], values[in_shell]
+
+    counts = np.bincount(shells, minlength=nb_bins)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.bincount(shells, weights=values, minlength=nb_bins) / counts
+        std = np.sqrt(
+            np.bincount(shells, weights=(values - mean[shells]) ** 2, minlength=nb_bins)
+            / counts
+        )
+    # group the values by shell, small integers allow numpy to use a radix sort
+    values = values[
+        np.argsort(
+            shells.astype(np.int16 if nb_bins < np.iinfo(np.int16).max else np.int32),
+            kind="stable",
+        )
+    ]
+    offsets = np.cumsum(counts) - counts
+    median = np.full(nb_bins, np.nan)
+    for index in np.flatnonzero(counts):
+        median[index] = np.median(
+            values[offsets[index] : offsets[index] + counts[index]]
+        )
+    return edges, mean, median, std, counts
+
+
 def ref_count(address):
     """
     Get the reference count using ctypes module.
@@ -1973,59 +2157,32 @@ def rotate_crystal(
     if rotation_matrix is None:
         rotation_matrix = rotation_matrix_3d(axis_to_align, reference_axis)
 
-    ##################################################
-    # calculate the new indices after transformation #
-    ##################################################
-    old_z = np.arange(-nbz // 2, nbz // 2, 1) * voxel_size[0]
-    old_y = np.arange(-nby // 2, nby // 2, 1) * voxel_size[1]
-    old_x = np.arange(-nbx // 2, nbx // 2, 1) * voxel_size[2]
-
-    myz, myy, myx = np.meshgrid(old_z, old_y, old_x, indexing="ij")
-
-    new_x = (
-        rotation_matrix[0, 0] * myx
-        + rotation_matrix[0, 1] * myy
-        + rotation_matrix[0, 2] * myz
-    )
-    new_y = (
-        rotation_matrix[1, 0] * myx
-        + rotation_matrix[1, 1] * myy
-        + rotation_matrix[1, 2] * myz
+    ##############################################################
+    # calculate the interpolation plan, the output grid is the   #
+    # input grid and the same plan is used for all input arrays  #
+    ##############################################################
+    # the output voxel at the position r (in the order x y z) takes the value of the
+    # input array at the position rotation_matrix * r, expressed here in voxels of
+    # the input array and in the order of the array axes
+    plan = InterpolationPlan(
+        input_shape=(nbz, nby, nbx),
+        output_axes=(
+            np.arange(-nbz // 2, nbz // 2, 1) * voxel_size[0],
+            np.arange(-nby // 2, nby // 2, 1) * voxel_size[1],
+            np.arange(-nbx // 2, nbx // 2, 1) * voxel_size[2],
+        ),
+        matrix=rotation_matrix[::-1, ::-1] / np.asarray(voxel_size)[:, np.newaxis],
+        precompute=nb_arrays > 1,
     )
-    new_z = (
-        rotation_matrix[2, 0] * myx
-        + rotation_matrix[2, 1] * myy
-        + rotation_matrix[2, 2] * myz
-    )
-    del myx, myy, myz
-    gc.collect()
 
     ######################
     # interpolate arrays #
     ######################
     output_arrays = []
     for idx, array in enumerate(arrays):
-        # convert array to float, for integers the interpolation can lead to artefacts
-        array = array.astype(float)
-
-        # interpolate array onto the new positions
-        rgi = RegularGridInterpolator(
-            (old_z, old_y, old_x),
-            array,
-            method="linear",
-            bounds_error=False,
-            fill_value=fill_value[idx],
-        )
-        rotated_array = rgi(
-            np.concatenate(
-                (
-                    new_z.reshape((1, new_z.size)),
-                    new_y.reshape((1, new_z.size)),
-                    new_x.reshape((1, new_z.size)),
-                )
-            ).transpose()
-        )
-        rotated_array = rotated_array.reshape((nbz, nby, nbx)).astype(array.dtype)
+        # the interpolation is done in float, for integers the interpolation
+        # could otherwise lead to artefacts
+        rotated_array = plan.apply(array, fill_value=fill_value[idx])
         output_arrays.append(rotated_array)
 
         if debugging[idx]:
@@ -2268,6 +2425,41 @@ def sum_roi(array, roi, debugging=False):
     return sum_array
 
 
+def transformed_extent(matrix, shape):
+    """
+    Calculate the extent of a grid of voxels after a linear transformation.
+
+    The voxel coordinates along an axis of length n are i + (-n // 2), as in the
+    orthogonalization methods of the package. The transformation being linear, the
+    extremal transformed coordinates are reached at the corners of the grid and the
+    transformed coordinates of the other voxels are not calculated.
+
+    :param matrix: 3x3 array transforming voxel coordinates, the transformed
+     coordinate i being sum_j matrix[i, j] * coordinate_j
+    :param shape: number of voxels along each coordinate, in the order of the
+     columns of the matrix
+    :return: a 1D array of three values, the extent (maximum - minimum) of each
+     transformed coordinate
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    if matrix.shape != (3, 3):
+        raise ValueError(f"matrix should be of shape (3, 3), got {matrix.shape}")
+    valid.valid_container(
+        shape,
+        container_types=(tuple, list),
+        length=3,
+        item_types=int,
+        min_excluded=0,
+        name="shape",
+    )
+    # the first and last voxel coordinates along each axis
+    bounds = np.array([[-nb // 2, -nb // 2 + nb - 1] for nb in shape], dtype=float)
+    # for each transformed coordinate, the maximum (minimum) over the corners is
+    # reached by choosing independently the bound of each coordinate
+    products = matrix[:, :, np.newaxis] * bounds[np.newaxis, :, :]
+    return products.max(axis=2).sum(axis=1) - products.min(axis=2).sum(axis=1)
+
+
 def try_smaller_primes(number, maxprime=13, required_dividers=(4,)):
     """
     Check if a number meets some condition.
@@ -12,11 +12,17 @@ Functions related to reciprocal space averaging and XCCA.
 XCCA stands for X-ray cross-correlation analysis.
 """
 
+import multiprocessing as mp
 import numpy as np
 from ..graph import graph_utils as gu
 from ..utils import utilities as util
 from ..utils import validation as valid
 
+# arrays shared with the worker processes of calc_ccf, set by _init_ccf_worker
+_shared_ccf = {}
+# radial bins of the last geometry used in radial_bins, reused by later calls
+_radial_bins_cache = {}
+
 
 def angular_avg(
     data, q_values, mask=None, origin=None, nb_bins=np.nan, debugging=False
@@ -54,14 +60,15 @@ def angular_avg(
 
     if np.isnan(nb_bins):
         nb_bins = 250
+    nb_bins = int(nb_bins)
 
-    # calculate the matrix of distances from the origin of reciprocal space
-    distances = np.sqrt(
-        (qx[:, np.newaxis, np.newaxis] - qx[origin[0]]) ** 2
-        + (qz[np.newaxis, :, np.newaxis] - qz[origin[1]]) ** 2
-        + (qy[np.newaxis, np.newaxis, :] - qy[origin[2]]) ** 2
-    )
     if debugging:
+        # calculate the matrix of distances from the origin of reciprocal space
+        distances = np.sqrt(
+            (qx[:, np.newaxis, np.newaxis] - qx[origin[0]]) ** 2
+            + (qz[np.newaxis, :, np.newaxis] - qz[origin[1]]) ** 2
+            + (qy[np.newaxis, np.newaxis, :] - qy[origin[2]]) ** 2
+        )
         gu.multislices_plot(
             distances,
             sum_frames=False,
@@ -73,42 +80,51 @@ def angular_avg(
             reciprocal_space=True,
             is_orthogonal=True,
         )
+        del distances
 
-    # average over spherical shells
-    print(
-        "Distance max:",
-        distances.max(),
-        " (1/nm) at voxel:",
-        np.unravel_index(abs(distances).argmax(), distances.shape),
+    # the largest distance is reached for the largest distance along each axis
+    voxel_max = (
+        int(abs(qx - qx[origin[0]]).argmax()),
+        int(abs(qz - qz[origin[1]]).argmax()),
+        int(abs(qy - qy[origin[2]]).argmax()),
     )
     print(
-        "Distance:",
-        distances[origin[0], origin[1], origin[2]],
+        "Distance max:",
+        np.sqrt(
+            (qx[voxel_max[0]] - qx[origin[0]]) ** 2
+            + (qz[voxel_max[1]] - qz[origin[1]]) ** 2
+            + (qy[voxel_max[2]] - qy[origin[2]]) ** 2
+        ),
         " (1/nm) at voxel:",
-        origin,
+        voxel_max,
     )
-    ang_avg = np.zeros(nb_bins)  # angular average using the mean value
-    ang_median = np.zeros(nb_bins)  # angular average using the median value
-    q_axis = np.linspace(
-        0, distances.max(), endpoint=True, num=nb_bins + 1
-    )  # in pixels or 1/nm
 
-    for index in range(nb_bins):
-        indices = np.logical_and(
-            (distances < q_axis[index + 1]), (distances >= q_axis[index])
-        )
-        temp_data = data[indices]
-        temp_mask = mask[indices]
+    # get the voxels sorted by spherical shells
+    q_axis, sorted_indices, offsets = radial_bins(
+        q_values=q_values, origin=origin, nb_bins=nb_bins
+    )
+    shell_indices = np.repeat(np.arange(nb_bins), np.diff(offsets))
 
-        ang_avg[index] = temp_data[
-            np.logical_and((~np.isnan(temp_data)), (temp_mask != 1))
-        ].mean()
+    # average over spherical shells, discarding nan values and masked voxels
+    sorted_data = data.ravel()[sorted_indices]
+    valid_voxels = np.logical_and(
+        ~np.isnan(sorted_data), mask.ravel()[sorted_indices] != 1
+    )
+    sorted_data = sorted_data[valid_voxels]
+    shell_indices = shell_indices[valid_voxels]
+    nb_valid = np.bincount(shell_indices, minlength=nb_bins)
+    sum_valid = np.bincount(shell_indices, weights=sorted_data, minlength=nb_bins)
+    ang_avg = np.full(nb_bins, np.nan)  # angular average using the mean value
+    ang_avg[nb_valid != 0] = sum_valid[nb_valid != 0] / nb_valid[nb_valid != 0]
+
+    # the valid voxels of each shell are contiguous in sorted_data
+    valid_offsets = np.concatenate(([0], np.cumsum(nb_valid)))
+    ang_median = np.full(nb_bins, np.nan)  # angular average using the median value
+    for index in np.flatnonzero(nb_valid):
         ang_median[index] = np.median(
-            temp_data[np.logical_and((~np.isnan(temp_data)), (temp_mask != 1))]
+            sorted_data[valid_offsets[index] : valid_offsets[index + 1]]
         )
 
-    q_axis = q_axis[:-1] + (q_axis[1] - q_axis[0]) / 2
-
     # prepare for masking arrays - 'conventional' arrays won't do it
     y_mean = np.ma.array(ang_avg)
     y_median = np.ma.array(ang_median)
@@ -119,6 +135,120 @@ def angular_avg(
     return q_axis, y_mean_masked, y_median_masked
 
 
+def calc_ccf(
+    points_q1, points_q2, bin_values, coordinates="rect", block_size=None, nb_workers=1
+):
+    """
+    Cross-correlate intensities at two q values for all reference points.
+
+    The reference points at the first q value are processed by blocks. For each block,
+    the angles with all points at the second q value are calculated with a single
+    matrix product, and the products of intensities are accumulated in the angular
+    bins using np.bincount. With nb_workers > 1, the blocks are distributed over a
+    pool of processes, the points being shared with the workers through shared memory
+    instead of being pickled for each task.
+
+    :param points_q1: 2D array of points at the first q value. For coordinates='rect',
+     each row contains four values (three q components and the intensity). For
+     coordinates='polar', each row contains three values (polar angle, azimuthal angle
+     in radians and the intensity).
+    :param points_q2: 2D array of points at the second q value, same convention as
+     points_q1
+    :param bin_values: in radians, 1D array of angular bin values where to calculate the
+     cross-correlation
+    :param coordinates: 'rect' or 'polar', the coordinate system of the points
+    :param block_size: number of reference points processed at once. If None, it is
+     set to keep the size of the temporary arrays around 2**21 elements.
+    :param nb_workers: number of processes used for the calculation
+    :return: two 1D arrays of length len(bin_values): the cross-correlation summed
+     over all pairs of points (not normalized) and the number of pairs of points
+     contributing to each angular bin
+    """
+    #########################
+    # check some parameters #
+    #########################
+    if coordinates not in {"rect", "polar"}:
+        raise ValueError(
+            f"invalid value '{coordinates}' for coordinates,"
+            f" allowed are 'rect' and 'polar'"
+        )
+    nb_columns = 4 if coordinates == "rect" else 3
+    valid.valid_ndarray(
+        arrays=(points_q1, points_q2), ndim=2, fix_shape=False, name="points"
+    )
+    if points_q1.shape[1] != nb_columns or points_q2.shape[1] != nb_columns:
+        raise ValueError(
+            f"points should have {nb_columns} columns for coordinates='{coordinates}'"
+        )
+    bin_values = np.asarray(bin_values)
+    valid.valid_1d_array(bin_values, min_length=2, name="bin_values")
+    valid.valid_item(
+        block_size,
+        allowed_types=int,
+        min_excluded=0,
+        allow_none=True,
+        name="block_size",
+    )
+    valid.valid_item(nb_workers, allowed_types=int, min_excluded=0, name="nb_workers")
+
+    ###########################################################################
+    # convert the points to unit vectors, the last column being the intensity #
+    ###########################################################################
+    points_q1 = np.column_stack(
+        (_unit_vectors(points_q1, coordinates=coordinates), points_q1[:, -1])
+    )
+    points_q2 = np.column_stack(
+        (_unit_vectors(points_q2, coordinates=coordinates), points_q2[:, -1])
+    )
+    nb_points = points_q1.shape[0]
+    if block_size is None:
+        block_size = max(1, 2 ** 21 // points_q2.shape[0])
+    if nb_workers > 1:
+        # make sure that there are enough blocks to balance the load of the workers
+        block_size = max(1, min(block_size, -(-nb_points // (4 * nb_workers))))
+    blocks = [
+        (start, min(start + block_size, nb_points))
+        for start in range(0, nb_points, block_size)
+    ]
+
+    #############################################
+    # calculate the cross-correlation by blocks #
+    #############################################
+    if nb_workers == 1:
+        results = [
+            _ccf_block(
+                block_q1=points_q1[start:stop, :],
+                points_q2=points_q2,
+                bin_values=bin_values,
+            )
+            for start, stop in blocks
+        ]
+    else:
+        shared_q1 = mp.RawArray("d", points_q1.size)
+        np.frombuffer(shared_q1).reshape(points_q1.shape)[:] = points_q1
+        shared_q2 = mp.RawArray("d", points_q2.size)
+        np.frombuffer(shared_q2).reshape(points_q2.shape)[:] = points_q2
+        with mp.Pool(
+            processes=nb_workers,
+            initializer=_init_ccf_worker,
+            initargs=(
+                shared_q1,
+                points_q1.shape,
+                shared_q2,
+                points_q2.shape,
+                bin_values,
+            ),
+        ) as pool:
+            results = pool.starmap(_ccf_worker, blocks)
+
+    ccf = np.zeros(len(bin_values))
+    counter = np.zeros(len(bin_values), dtype=int)
+    for block_ccf, block_counter in results:
+        ccf += block_ccf
+        counter += block_counter
+    return ccf, counter
+
+
 def calc_ccf_polar(point, q1_name, q2_name, bin_values, polar_azi_int):
     """
     Cross-correlate intensities at two q values, in polar coordinates.
@@ -136,47 +266,13 @@ def calc_ccf_polar(point, q1_name, q2_name, bin_values, polar_azi_int):
     :return: the sorted cross-correlation values, angular bins indices and number of
      points contributing to the angular bins
     """
-    # calculate the angle between the current point and all points from the second
-    # q value (delta in [0 pi])
-    delta_val = np.arccos(
-        np.sin(polar_azi_int[q1_name][point, 0])
-        * np.sin(polar_azi_int[q2_name][:, 0])
-        * np.cos(polar_azi_int[q2_name][:, 1] - polar_azi_int[q1_name][point, 1])
-        + np.cos(polar_azi_int[q1_name][point, 0])
-        * np.cos(polar_azi_int[q2_name][:, 0])
-    )
-
-    # It can happen that the value in the arccos is outside [-1, 1] because of
-    # the limited floating precision of Python, which result in delta_val = nan.
-    # These points would contribute to the 0 and 180 degrees CCF, and can be neglected.
-
-    # find the nearest angular bin value for each value of the array delta
-    nearest_indices = util.find_nearest(
-        test_values=delta_val,
-        reference_array=bin_values,
-        width=bin_values[1] - bin_values[0],
+    return _ccf_point(
+        reference=polar_azi_int[q1_name][point : point + 1, :],
+        points=polar_azi_int[q2_name],
+        bin_values=bin_values,
+        coordinates="polar",
     )
 
-    # update the counter of bin indices
-    counter_indices, counter_val = np.unique(
-        nearest_indices, return_counts=True
-    )  # counter_indices are sorted
-
-    # filter out -1 indices which correspond to no neighbour in the range defined by
-    # width in find_nearest()
-    counter_val = np.delete(counter_val, np.argwhere(counter_indices == -1))
-    counter_indices = np.delete(counter_indices, np.argwhere(counter_indices == -1))
-
-    # calculate the contribution to the cross-correlation for bins in counter_indices
-    ccf_uniq_val = np.zeros(len(counter_indices))
-    for idx, item in enumerate(counter_indices):
-        ccf_uniq_val[idx] = (
-            polar_azi_int[q1_name][point, 2]
-            * polar_azi_int[q2_name][nearest_indices == item, 2]
-        ).sum()
-
-    return ccf_uniq_val, counter_val, counter_indices
-
 
 def calc_ccf_rect(point, q1_name, q2_name, bin_values, q_int):
     """
@@ -195,41 +291,209 @@ def calc_ccf_rect(point, q1_name, q2_name, bin_values, q_int):
     :return: the sorted cross-correlation values, angular bins indices and number of
      points contributing to the angular bins
     """
-    # calculate the angle between the current point and all points from the second
-    # q value (delta in [0 pi])
-    delta_val = np.arccos(
-        np.divide(
-            np.dot(q_int[q2_name][:, 0:3], q_int[q1_name][point, 0:3]),
-            np.linalg.norm(q_int[q2_name][:, 0:3], axis=1)
-            * np.linalg.norm(q_int[q1_name][point, 0:3]),
+    return _ccf_point(
+        reference=q_int[q1_name][point : point + 1, :],
+        points=q_int[q2_name],
+        bin_values=bin_values,
+        coordinates="rect",
+    )
+
+
+def radial_bins(q_values, origin, nb_bins):
+    """
+    Sort the voxels of a 3D reciprocal space grid by spherical shells.
+
+    The distances to the origin are digitized once into nb_bins shells of equal width
+    between 0 and the largest distance, and the flat indices of the voxels are sorted
+    by shell. The shell i contains the voxels at a distance d such that
+    q_axis_edges[i] <= d < q_axis_edges[i+1]. The result of the last geometry is kept
+    in memory, so that repeated calls for a series of datasets with the same q values
+    and origin reuse it.
+
+    :param q_values: tuple of 3 1-D arrays: (qx downstream, qz vertical up, qy
+     outboard), the shape of the grid is (len(qx), len(qz), len(qy))
+    :param origin: position in pixels of the origin of the reciprocal space
+    :param nb_bins: number of spherical shells
+    :return: a tuple of three 1D arrays:
+
+     - the q values at the center of the shells
+     - the flat indices of the voxels belonging to a shell, sorted by shell
+     - the offsets of the shells in the sorted indices, of length nb_bins + 1: the
+       voxels of the shell i are sorted_indices[offsets[i]:offsets[i+1]]
+
+    """
+    qx, qz, qy = (np.asarray(val, dtype=float) for val in q_values)
+    origin = tuple(int(val) for val in origin)
+    key = (origin, nb_bins, qx.tobytes(), qz.tobytes(), qy.tobytes())
+    if key in _radial_bins_cache:
+        return _radial_bins_cache[key]
+
+    # calculate the distances slab by slab to avoid a full size float64 array
+    dist_x = (qx - qx[origin[0]]) ** 2
+    dist_z = (qz - qz[origin[1]]) ** 2
+    dist_y = (qy - qy[origin[2]]) ** 2
+    q_axis = np.linspace(
+        0,
+        np.sqrt(dist_x.max() + dist_z.max() + dist_y.max()),
+        endpoint=True,
+        num=nb_bins + 1,
+    )  # in pixels or 1/nm
+    # small integers allow numpy to use a radix sort
+    shell_indices = np.empty(
+        (len(qx), len(qz), len(qy)),
+        dtype=np.int16 if nb_bins < np.iinfo(np.int16).max else np.int32,
+    )
+    for index, value in enumerate(dist_x):
+        # the largest distance is assigned to the index nb_bins by np.digitize, it
+        # does not belong to the last shell because of the condition
+        # d < q_axis_edges[nb_bins]
+        shell_indices[index] = (
+            np.digitize(
+                np.sqrt(value + dist_z[:, np.newaxis] + dist_y[np.newaxis, :]),
+                q_axis,
+            )
+            - 1
         )
+    shell_indices = shell_indices.ravel()
+    offsets = np.concatenate(
+        ([0], np.cumsum(np.bincount(shell_indices, minlength=nb_bins + 1)[:nb_bins]))
+    )
+    # discard the voxels at the largest distance, which do not belong to any shell
+    sorted_indices = np.argsort(shell_indices, kind="stable")[: offsets[-1]]
+
+    result = q_axis[:-1] + (q_axis[1] - q_axis[0]) / 2, sorted_indices, offsets
+    _radial_bins_cache.clear()
+    _radial_bins_cache[key] = result
+    return result
+
+
+def _angular_bin_indices(angles, bin_values):
+    """
+    Find the nearest angular bin for each angle.
+
+    The bin i contains the angles in the range ]bin_values[i] - width/2,
+    bin_values[i] + width/2], width being the spacing of the bins. This is the same
+    convention as utilities.find_nearest. Angles outside of the range of bins are
+    assigned to the index len(bin_values), which can be discarded afterwards.
+
+    :param angles: 1D array of angles in radians
+    :param bin_values: 1D array of equally spaced angular bins in radians
+    :return: 1D array of bin indices of the same length as angles
+    """
+    width = bin_values[1] - bin_values[0]
+    if not np.allclose(np.diff(bin_values), width):
+        indices = util.find_nearest(
+            reference_array=bin_values, test_values=angles, width=width
+        )
+        indices[indices == -1] = len(bin_values)
+        return indices
+    indices = np.ceil((angles - bin_values[0]) / width - 0.5)
+    indices[np.logical_or(indices < 0, indices >= len(bin_values))] = len(bin_values)
+    return indices.astype(int)
+
+
+def _ccf_block(block_q1, points_q2, bin_values):
+    """
+    Cross-correlate a block of reference points with all points at the second q.
+
+    :param block_q1: 2D array of reference points, each row containing the
+     three components of the unit vector and the intensity
+    :param points_q2: 2D array of points at the second q value, same convention as
+     block_q1
+    :param bin_values: in radians, 1D array of angular bin values
+    :return: the cross-correlation summed in each angular bin and the number of pairs
+     of points contributing to each bin
+    """
+    nb_bins = len(bin_values)
+    # The dot product can be outside [-1, 1] because of the limited floating
+    # precision, clip it so that these points contribute to the 0 and 180 degrees CCF
+    angles = np.clip(np.matmul(block_q1[:, 0:3], points_q2[:, 0:3].T), -1, 1)
+    angles = np.arccos(angles, out=angles).ravel()
+    indices = _angular_bin_indices(angles=angles, bin_values=bin_values)
+    # the last bin gathers the angles which are out of range
+    ccf = np.bincount(
+        indices,
+        weights=np.outer(block_q1[:, 3], points_q2[:, 3]).ravel(),
+        minlength=nb_bins + 1,
     )
-    # It can happen that the value in the arccos is outside [-1, 1] because of
-    # the limited floating precision of Python, which result in delta_val = nan.
-    # These points would contribute to the 0 and 180 degrees CCF, and can be neglected.
-
-    # find the nearest angular bin value for each value of the array delta
-    nearest_indices = util.find_nearest(
-        test_values=delta_val,
-        reference_array=bin_values,
-        width=bin_values[1] - bin_values[0],
+    counter = np.bincount(indices, minlength=nb_bins + 1)
+    return ccf[:nb_bins], counter[:nb_bins]
+
+
+def _ccf_point(reference, points, bin_values, coordinates):
+    """
+    Cross-correlate a single reference point with all points at the second q.
+
+    :param reference: 2D array with a single row, the reference point
+    :param points: 2D array of points at the second q value
+    :param bin_values: in radians, 1D array of angular bin values
+    :param coordinates: 'rect' or 'polar', the coordinate system of the points
+    :return: the cross-correlation values, number of points contributing to the
+     angular bins and the sorted angular bins indices, for bins with at least one
+     contributing point
+    """
+    ccf, counter = _ccf_block(
+        block_q1=np.column_stack(
+            (_unit_vectors(reference, coordinates=coordinates), reference[:, -1])
+        ),
+        points_q2=np.column_stack(
+            (_unit_vectors(points, coordinates=coordinates), points[:, -1])
+        ),
+        bin_values=bin_values,
     )
+    counter_indices = np.nonzero(counter)[0]
+    return ccf[counter_indices], counter[counter_indices], counter_indices
+
 
-    # update the counter of bin indices
-    counter_indices, counter_val = np.unique(
-        nearest_indices, return_counts=True
-    )  # counter_indices are sorted
+def _ccf_worker(start, stop):
+    """
+    Cross-correlate a block of reference points using the shared arrays.
 
-    # filter out -1 indices which correspond to no neighbour in the range defined by
-    # width in find_nearest()
-    counter_val = np.delete(counter_val, np.argwhere(counter_indices == -1))
-    counter_indices = np.delete(counter_indices, np.argwhere(counter_indices == -1))
+    :param start: index of the first reference point of the block
+    :param stop: index of the last reference point of the block (excluded)
+    :return: the cross-correlation summed in each angular bin and the number of pairs
+     of points contributing to each bin
+    """
+    return _ccf_block(
+        block_q1=_shared_ccf["q1"][start:stop, :],
+        points_q2=_shared_ccf["q2"],
+        bin_values=_shared_ccf["bin_values"],
+    )
 
-    # calculate the contribution to the cross-correlation for bins in counter_indices
-    ccf_uniq_val = np.zeros(len(counter_indices))
-    for idx, item in enumerate(counter_indices):
-        ccf_uniq_val[idx] = (
-            q_int[q1_name][point, 3] * q_int[q2_name][nearest_indices == item, 3]
-        ).sum()
 
-    return ccf_uniq_val, counter_val, counter_indices
+def _init_ccf_worker(shared_q1, shape_q1, shared_q2, shape_q2, bin_values):
+    """
+    Initialize a worker process of calc_ccf with views on the shared arrays.
+
+    :param shared_q1: multiprocessing.RawArray, points at the first q value
+    :param shape_q1: shape of the array of points at the first q value
+    :param shared_q2: multiprocessing.RawArray, points at the second q value
+    :param shape_q2: shape of the array of points at the second q value
+    :param bin_values: in radians, 1D array of angular bin values
+    """
+    _shared_ccf["q1"] = np.frombuffer(shared_q1).reshape(shape_q1)
+    _shared_ccf["q2"] = np.frombuffer(shared_q2).reshape(shape_q2)
+    _shared_ccf["bin_values"] = bin_values
+
+
+def _unit_vectors(points, coordinates):
+    """
+    Calculate the unit vectors corresponding to points in reciprocal space.
+
+    :param points: 2D array of points. For coordinates='rect', the first three columns
+     are the q components. For coordinates='polar', the first two columns are the polar
+     and azimuthal angles in radians.
+    :param coordinates: 'rect' or 'polar', the coordinate system of the points
+    :return: a 2D array of shape (len(points), 3)
+    """
+    if coordinates == "polar":
+        polar, azimuth = points[:, 0], points[:, 1]
+        return np.column_stack(
+            (
+                np.sin(polar) * np.cos(azimuth),
+                np.sin(polar) * np.sin(azimuth),
+                np.cos(polar),
+            )
+        )
+    vectors = points[:, 0:3]
+    return vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
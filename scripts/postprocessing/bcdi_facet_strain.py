@@ -75,10 +75,16 @@ max_angle = 95  # maximum angle in degree of the stereographic projection
 # (should be larger than 90)
 stereo_scale = "linear"
 # 'linear' or 'log', scale of the colorbar in the stereographic plot
+stereo_kde_bandwidth = None
+# if None, the density of normals is interpolated with griddata, otherwise standard
+# deviation in degrees of the gaussian kernel density estimation
 ##########################################################
 # parameters only used in the equirectangular projection #
 ##########################################################
 bw_method = 0.03  # bandwidth in the gaussian kernel density estimation
+kde_method = "binned"
+# 'binned' for a fast estimation by binning and FFT convolution, 'exact' to use
+# scipy.stats.gaussian_kde at each grid point
 kde_threshold = -0.2
 # threshold for defining the background in the density estimation of normals
 ##################################################
@@ -258,6 +264,7 @@ if projection_method == "stereographic":
         voxel_size=voxel_size,
         projection_axis=projection_axis,
         scale=stereo_scale,
+        kde_bandwidth=stereo_kde_bandwidth,
         debugging=debug,
     )
     # labels_south and labels_north are 2D arrays for projections from South and North
@@ -419,6 +426,7 @@ elif projection_method == "equirectangular":
         bw_method=bw_method,
         background_threshold=kde_threshold,
         min_distance=peak_min_distance,
+        kde_method=kde_method,
         debugging=debug,
     )
     if longitude_latitude.shape[0] != nb_normals:
@@ -526,6 +534,8 @@ for label in unique_labels:
 ############################################
 support = np.zeros(amp.shape)
 support[abs(amp) > support_threshold * abs(amp).max()] = 1
+# mean support gradient around each voxel, used for the orientation of facets
+normal_field = fu.surface_normal_field(support)
 zcom_support, ycom_support, xcom_support = center_of_mass(support)
 print(
     "\nCOM at (z, y, x): (",
@@ -731,7 +741,9 @@ with open(
         # the support gradient at the center of mass of the facet
         zcom_facet, ycom_facet, xcom_facet = center_of_mass(plane)
         mean_gradient = fu.surface_gradient(
-            (zcom_facet, ycom_facet, xcom_facet), support=support
+            (zcom_facet, ycom_facet, xcom_facet),
+            support=support,
+            normal_field=normal_field,
         )[0]
         plane_normal = np.array(
             [coeffs[0], coeffs[1], coeffs[2]]
@@ -891,6 +903,7 @@ with open(
                 label=label,
                 support=support,
                 max_distance=1.5 * max_distance_plane,
+                normal_field=normal_field,
                 debugging=debug,
             )
             # here the distance threshold is larger in order to reach
@@ -1031,7 +1044,9 @@ with open(
         # at the center of mass of the facet
         zcom_facet, ycom_facet, xcom_facet = center_of_mass(plane)
         mean_gradient = fu.surface_gradient(
-            (zcom_facet, ycom_facet, xcom_facet), support=support
+            (zcom_facet, ycom_facet, xcom_facet),
+            support=support,
+            normal_field=normal_field,
         )[0]
         plane_normal = np.array(
             [coeffs[0], coeffs[1], coeffs[2]]
@@ -1057,6 +1072,7 @@ with open(
                 label=label,
                 support=support,
                 max_distance=1.5 * max_distance_plane,
+                normal_field=normal_field,
                 debugging=debug,
             )
             plane = (
@@ -1182,7 +1198,7 @@ with open(
             "plane_indices": plane_indices,
         }
 
-    del support, all_planes
+    del support, all_planes, normal_field
     gc.collect()
 
     #################################################
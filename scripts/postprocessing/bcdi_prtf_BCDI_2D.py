@@ -540,16 +540,9 @@ print(
     f"at: {np.unravel_index(abs(distances_q).argmax(), distances_q.shape)}"
 )
 nb_bins = numy // 3
-prtf_avg = np.zeros(nb_bins)
-dq = distances_q.max() / nb_bins  # in 1/A
-q_axis = np.linspace(0, distances_q.max(), endpoint=True, num=nb_bins + 1)  # in 1/A
-
-for index in range(nb_bins):
-    logical_array = np.logical_and(
-        (distances_q < q_axis[index + 1]), (distances_q >= q_axis[index])
-    )
-    temp = prtf_matrix[logical_array]
-    prtf_avg[index] = temp[~np.isnan(temp)].mean()
+q_axis, prtf_avg, _, _, _ = util.radial_profile(
+    array=prtf_matrix, distances=distances_q, nb_bins=nb_bins
+)  # q_axis in 1/A
 q_axis = q_axis[:-1]
 
 if normalize_prtf:
@@ -399,18 +399,9 @@ print(
     np.unravel_index(abs(distances_q).argmax(), distances_q.shape),
 )
 nb_bins = nz // 5
-prtf_avg = np.zeros(nb_bins)
-nb_points = np.zeros(nb_bins)
-dq = distances_q.max() / nb_bins  # in 1/nm
-q_axis = np.linspace(0, distances_q.max(), endpoint=True, num=nb_bins + 1)  # in 1/nm
-
-for index in range(nb_bins):
-    logical_array = np.logical_and(
-        (distances_q < q_axis[index + 1]), (distances_q >= q_axis[index])
-    )
-    temp = prtf_matrix[logical_array]
-    nb_points[index] = logical_array.sum()
-    prtf_avg[index] = temp[~np.isnan(temp)].mean()
+q_axis, prtf_avg, _, _, nb_points = util.radial_profile(
+    array=prtf_matrix, distances=distances_q, nb_bins=nb_bins
+)  # q_axis in 1/nm
 q_axis = q_axis[:-1]
 
 plt.figure()
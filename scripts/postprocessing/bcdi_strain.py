@@ -29,6 +29,7 @@ from bcdi.experiment.detector import create_detector
 from bcdi.experiment.setup import Setup
 import bcdi.postprocessing.postprocessing_utils as pu
 import bcdi.simulation.simulation_utils as simu
+import bcdi.utils.image_registration as reg
 import bcdi.utils.utilities as util
 import bcdi.utils.validation as valid
 
@@ -66,6 +67,7 @@ comment = ""  # comment in filenames, should start with _
 #########################################################
 sort_method = "variance/mean"
 # 'mean_amplitude' or 'variance' or 'variance/mean' or 'volume', metric for averaging
+nb_workers = 1  # number of processes used for loading the reconstructions to sort
 correlation_threshold = 0.90
 #########################################################
 # parameters relative to the FFT window and voxel sizes #
@@ -521,7 +523,8 @@ if nbfiles > 1:
         file_path=file_path,
         amplitude_threshold=isosurface_strain,
         data_range=(zrange, yrange, xrange),
-        sort_method="variance/mean",
+        sort_method=sort_method,
+        nb_workers=nb_workers,
     )
 else:
     sorted_obj = [0]
@@ -561,6 +564,7 @@ for counter, value in enumerate(sorted_obj):
     if counter == 0:  # the fist array loaded will serve as reference object
         print("This reconstruction will be used as reference.")
         ref_obj = obj
+        registration = reg.RegistrationEngine(ref_obj, precision=1000)
 
     avg_obj, flag_avg = pu.average_obj(
         avg_obj=avg_obj,
@@ -570,6 +574,7 @@ for counter, value in enumerate(sorted_obj):
         correlation_threshold=avg_threshold,
         aligning_option="dft",
         method=avg_method,
+        registration=registration,
         reciprocal_space=False,
         is_orthogonal=is_orthogonal,
         debugging=debug,
@@ -579,7 +584,7 @@ for counter, value in enumerate(sorted_obj):
 avg_obj = avg_obj / avg_counter
 if avg_counter > 1:
     print("\nAverage performed over ", avg_counter, "reconstructions\n")
-del obj, ref_obj
+del obj, ref_obj, registration
 gc.collect()
 
 ################
@@ -172,6 +172,10 @@ fill_value_mask = 1  # 0 (not masked) or 1 (masked).
 # imposed). The data is by default set to 0 outside of the defined range.
 correct_curvature = False
 # True to correcture q values for the curvature of Ewald sphere
+gridder = "griddata"  # method used if correct_curvature is True: "griddata" (very
+# slow, memory intensive), "nearest" or "linear" (scatter-add onto the grid)
+fill_holes = False  # True to fill the empty voxels of the grid with the average of
+# their neighbours, used only if gridder is "nearest" or "linear"
 fit_datarange = True  # if True, crop the final array within data range,
 # avoiding areas at the corners of the window viewed from the top, data is circular,
 # but the interpolation window is rectangular, with nan values outside of data
@@ -743,6 +747,8 @@ for scan_idx, scan_nb in enumerate(scans, start=1):
                 frames_logical=frames_logical,
                 correct_curvature=correct_curvature,
                 fill_value=(0, fill_value_mask),
+                gridder=gridder,
+                fill_holes=fill_holes,
                 debugging=debug,
             )
 
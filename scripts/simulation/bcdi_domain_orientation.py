@@ -7,6 +7,7 @@
 #       authors:
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
+from itertools import product
 import numpy as np
 from matplotlib import pyplot as plt
 from skimage.feature import peak_local_max
@@ -20,6 +21,7 @@ import bcdi.graph.graph_utils as gu
 from bcdi.experiment.detector import create_detector
 import bcdi.utils.utilities as util
 import bcdi.postprocessing.postprocessing_utils as pu
+from bcdi.simulation.orientation_search import OrientationSearch
 import bcdi.simulation.simulation_utils as simu
 
 helptext = """
@@ -59,6 +61,8 @@ angles_ranges = [
 # ranges to span for the rotation around qx downstream, qz vertical up and
 # qy outboard respectively (stop is included)
 angular_step = 5  # in degrees
+refinement_levels = 0  # number of coarse-to-fine refinement levels around the best
+# grid values, leave 0 to keep the result of the grid search
 #######################
 # beamline parameters #
 #######################
@@ -91,6 +95,7 @@ kernel_length = 11  # width of the 3D gaussian window
 debug = True  # True to see more plots
 correct_background = False  # True to create a 3D background
 bckg_method = "normalize"  # 'subtract' or 'normalize'
+nb_workers = 1  # number of processes used for the search
 
 ##################################
 # end of user-defined parameters #
@@ -367,18 +372,24 @@ angles_qy = np.linspace(
 nb_angles = len(angles_qx) * len(angles_qz) * len(angles_qy)
 print("Number of angles to test: ", nb_angles)
 
-####################################################
-# loop over rotation angles and lattice parameters #
-####################################################
+######################################################
+# search over rotation angles and lattice parameters #
+######################################################
+engine = OrientationSearch(
+    q_values=q_values,
+    pivot=pivot,
+    unitcell=unitcell,
+    peak_shape=peak_shape,
+    voxels=nonzero_indices,
+    weights=bragg_peaks,
+)
 start = time.time()
+a_values = np.linspace(
+    start=unitcell_ranges[0],
+    stop=unitcell_ranges[1],
+    num=max(1, np.rint((unitcell_ranges[1] - unitcell_ranges[0]) / unitcell_step) + 1),
+)
 if unitcell == "bct":
-    a_values = np.linspace(
-        start=unitcell_ranges[0],
-        stop=unitcell_ranges[1],
-        num=max(
-            1, np.rint((unitcell_ranges[1] - unitcell_ranges[0]) / unitcell_step) + 1
-        ),
-    )
     c_values = np.linspace(
         start=unitcell_ranges[2],
         stop=unitcell_ranges[3],
@@ -386,89 +397,24 @@ if unitcell == "bct":
             1, np.rint((unitcell_ranges[3] - unitcell_ranges[2]) / unitcell_step) + 1
         ),
     )
-    nb_lattices = len(a_values) * len(c_values)
-    print("Number of lattice parameters to test: ", nb_lattices)
-    print("Total number of iterations: ", nb_angles * nb_lattices)
-    corr = np.zeros(
-        (len(angles_qx), len(angles_qz), len(angles_qy), len(a_values), len(c_values))
-    )
-    for idz, alpha in enumerate(angles_qx):
-        for idy, beta in enumerate(angles_qz):
-            for idx, gamma in enumerate(angles_qy):
-                for idw, a in enumerate(a_values):
-                    for idv, c in enumerate(c_values):
-                        _, _, _, rot_lattice, _ = simu.lattice(
-                            energy=energy,
-                            sdd=sdd,
-                            direct_beam=direct_beam,
-                            detector=detector,
-                            unitcell=unitcell,
-                            unitcell_param=(a, c),
-                            euler_angles=(alpha, beta, gamma),
-                            offset_indices=False,
-                        )
-                        # peaks in the format [[h, l, k], ...]:
-                        # CXI convention downstream , vertical up, outboard
-
-                        # assign the peak shape to each lattice point
-                        struct_array = simu.assign_peakshape(
-                            array_shape=(nbz, nby, nbx),
-                            lattice_list=rot_lattice,
-                            peak_shape=peak_shape,
-                            pivot=pivot,
-                        )
-
-                        # calculate the correlation between experimental data
-                        # and simulated data
-                        corr[idz, idy, idx, idw, idv] = np.multiply(
-                            bragg_peaks, struct_array[nonzero_indices]
-                        ).sum()
+    unitcell_params = list(product(a_values, c_values))
 else:
-    a_values = np.linspace(
-        start=unitcell_ranges[0],
-        stop=unitcell_ranges[1],
-        num=max(
-            1, np.rint((unitcell_ranges[1] - unitcell_ranges[0]) / unitcell_step) + 1
-        ),
-    )
-    nb_lattices = len(a_values)
-    print("Number of lattice parameters to test: ", nb_lattices)
-    print("Total number of iterations: ", nb_angles * nb_lattices)
-    corr = np.zeros((len(angles_qx), len(angles_qz), len(angles_qy), len(a_values)))
-    for idz, alpha in enumerate(angles_qx):
-        for idy, beta in enumerate(angles_qz):
-            for idx, gamma in enumerate(angles_qy):
-                for idw, a in enumerate(a_values):
-                    _, _, _, rot_lattice, _ = simu.lattice(
-                        energy=energy,
-                        sdd=sdd,
-                        direct_beam=direct_beam,
-                        detector=detector,
-                        unitcell=unitcell,
-                        unitcell_param=a,
-                        euler_angles=(alpha, beta, gamma),
-                        offset_indices=False,
-                    )
-                    # peaks in the format [[h, l, k], ...]:
-                    # CXI convention downstream , vertical up, outboard
-
-                    # assign the peak shape to each lattice point
-                    struct_array = simu.assign_peakshape(
-                        array_shape=(nbz, nby, nbx),
-                        lattice_list=rot_lattice,
-                        peak_shape=peak_shape,
-                        pivot=pivot,
-                    )
-
-                    # calculate the correlation between experimental data
-                    # and simulated data
-                    corr[idz, idy, idx, idw] = np.multiply(
-                        bragg_peaks, struct_array[nonzero_indices]
-                    ).sum()
+    unitcell_params = list(a_values)
+nb_lattices = len(unitcell_params)
+print("Number of lattice parameters to test: ", nb_lattices)
+print("Total number of iterations: ", nb_angles * nb_lattices)
+
+corr = engine.search(
+    angles=(angles_qx, angles_qz, angles_qy),
+    unitcell_params=unitcell_params,
+    nb_workers=nb_workers,
+)
+if unitcell == "bct":
+    corr = corr.reshape(corr.shape[:3] + (len(a_values), len(c_values)))
 
 end = time.time()
 print(
-    "\nTime ellapsed in the loop over angles and lattice parameters:",
+    "\nTime ellapsed in the search over angles and lattice parameters:",
     str(datetime.timedelta(seconds=int(end - start))),
 )
 
@@ -649,6 +595,25 @@ if save_angles:
         + ".png"
     )
 
+################################################
+# refine the best values from coarse to fine #
+################################################
+best_corr = corr.max()
+if refinement_levels > 0:
+    (alpha, beta, gamma), best_param, best_corr = engine.refine(
+        euler_angles=(alpha, beta, gamma),
+        unitcell_param=best_param,
+        angular_step=angular_step / 2,
+        unitcell_step=unitcell_step / 2 if nb_lattices > 1 else 0,
+        nb_levels=refinement_levels,
+        nb_workers=nb_workers,
+    )
+    print(
+        "Refined maximum correlation for (angle_qx, angle_qz, angle_qy) = "
+        "{:.2f}, {:.2f}, {:.2f}".format(alpha, beta, gamma)
+    )
+    print("Refined unit cell parameter(s):", best_param, "nm")
+
 ###################################################
 # calculate the lattice at calculated best values #
 ###################################################
@@ -722,12 +687,7 @@ fig.text(
 )
 plt.pause(0.1)
 plt.savefig(
-    savedir
-    + "Overlay_"
-    + comment
-    + "_corr="
-    + str("{:.2f}".format(corr.max()))
-    + ".png"
+    savedir + "Overlay_" + comment + "_corr=" + str("{:.2f}".format(best_corr)) + ".png"
 )
 
 if debug:
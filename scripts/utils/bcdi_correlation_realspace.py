@@ -52,6 +52,7 @@ for raw in range(nbfiles):
         array=reference_obj, output_shape=[nbz + 10, nby + 10, nbx + 10]
     )
     correlation[raw, raw] = 1
+    registration = reg.RegistrationEngine(reference_obj, precision=100)
     for col in range(raw + 1, nbfiles):
         test_obj, _ = util.load_file(file_path[col])  # which index?
         test_obj = abs(test_obj) / abs(test_obj).max()
@@ -59,10 +60,7 @@ for raw in range(nbfiles):
             array=test_obj, output_shape=[nbz + 10, nby + 10, nbx + 10]
         )
         # align reconstructions
-        shiftz, shifty, shiftx = reg.getimageregistration(
-            abs(reference_obj), abs(test_obj), precision=100
-        )
-        test_obj = reg.subpixel_shift(test_obj, shiftz, shifty, shiftx)
+        test_obj, (shiftz, shifty, shiftx) = registration.align(test_obj)
         print("\nReference =", raw, "  Test =", col)
         print(
             "z shift",
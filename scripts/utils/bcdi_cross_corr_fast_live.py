@@ -8,10 +8,9 @@
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
 import numpy as np
-import xrayutilities as xu
-import fabio
 import matplotlib.pyplot as plt
 import os
+from bcdi.utils.correlation_monitor import CorrelationMonitor
 
 helptext = """
 Calculate the cross-correlation of 2D detector images in live.
@@ -31,51 +30,11 @@ else:
     roi = [0, 516, 0, 516]
 stop_flag = 0  # flag to exit the while loop
 stable_sample = 1  # 0 if a lot of change expected, 1 if very stable
+nb_workers = 4  # number of threads used for loading frames
+max_frames = 100  # maximum number of frames loaded between two refreshes of the plot
 ##############################################################################
 
 
-def load_file(start_img, current_img, mydetector, region=None):
-    """Load images at ID01 and stack them."""
-    # global index   # for testing, to simulate ongoing measurement
-    if region is None:
-        if mydetector == 0:
-            region = [0, 2164, 0, 1030]
-        elif mydetector == 1:
-            region = [0, 516, 0, 516]
-    frame_nb = current_img - start_img
-    rawdata = np.zeros((frame_nb, region[1] - region[0], region[3] - region[2]))
-    for idx in range(frame_nb):
-        i = start_img + idx
-        e = fabio.open(ccdfiletmp % i)
-        ccdraw = e.data
-        ccd = xu.blockAverage2D(ccdraw, nav[0], nav[1], roi=region)
-        rawdata[idx, :, :] = ccd
-    return rawdata
-
-
-def calc_corr(array, previous_array, is_stable=0):
-    """Calculate the cross correlation among a stack of images."""
-    if previous_array is None:
-        previous_array = np.array([])
-    starting_index = previous_array.shape[0]
-    nb_frames = array.shape[0]
-    corr = np.zeros((nb_frames, nb_frames))
-    corr[0:starting_index, 0:starting_index] = previous_array
-    for idx in range(starting_index, nb_frames, 1):
-        for idy in range(nb_frames):
-            if is_stable == 0:
-                corr[idx, idy] = (np.multiply(array[idx], array[idy]).sum()) / (
-                    np.sqrt(np.square(array[idx]).sum() * np.square(array[idy]).sum())
-                )
-            else:
-                corr[idx, idy] = 1 - (np.multiply(array[idx], array[idy]).sum()) / (
-                    np.sqrt(np.square(array[idx]).sum() * np.square(array[idy]).sum())
-                )
-        corr[:, idx] = corr[idx, :]
-        # since plot is symmetric, do not need to compute this again
-    return corr
-
-
 def press_key(event):
     """Process press_key events to exit a GUI."""
     global stop_flag
@@ -88,53 +47,41 @@ def press_key(event):
 
 
 ##############################################################################
+monitor = CorrelationMonitor(
+    template_file=ccdfiletmp,
+    start_index=start_image,
+    roi=roi,
+    binning=nav,
+    nb_workers=nb_workers,
+)
 plt.ion()
 fig, ax = plt.subplots(1, 1)
 plt.connect("key_press_event", press_key)
-index = 1
-previous = np.array([])
-stop_counter = 0
-stop_image_old = start_image
+image = None
+index = 0
 while stop_flag != 1:
-    # get the range of the dataset
-    no_error = 1
-    index = 0
-    while no_error == 1:
-        img_nb = start_image + index
-        fname = ccdfiletmp % img_nb
-        if os.path.isfile(fname):
-            index = index + 1
-        else:
-            no_error = 0
-    stop_image_new = start_image + index
-    if stop_image_new == stop_image_old:
-        stop_counter = stop_counter + 1
+    # load only the frames written since the last refresh
+    if monitor.update(max_frames=max_frames) == 0:
         plt.pause(1)
         continue
-    data = load_file(start_image, stop_image_new, detector, roi)
-    stop_counter = 0
-    cross_corr = calc_corr(data, previous, is_stable=stable_sample)
     if stable_sample == 0:
-        plt.title(
-            "Running, iteration: "
-            + str(index)
-            + "\n Press q to stop (mouse on the plot)"
-        )
-        index = index + 1
-        plt.imshow(cross_corr, vmin=0, vmax=1)
+        cross_corr, vmin, vmax = monitor.correlation, 0, 1
     else:
-        plt.title(
-            "Running, iteration: "
-            + str(index)
-            + "\n Press q to stop (mouse on the plot)"
+        cross_corr, vmin, vmax = np.log10(abs(1 - monitor.correlation)), -4, 0
+    nb_frames = monitor.nb_frames
+    extent = (-0.5, nb_frames - 0.5, -0.5, nb_frames - 0.5)
+    if image is None:
+        image = ax.imshow(
+            cross_corr, vmin=vmin, vmax=vmax, origin="lower", extent=extent
         )
-        index = index + 1
-        plt.imshow(np.log10(abs(cross_corr)), vmin=-4, vmax=0)
-    stop_image_old = stop_image_new
-    plt.gca().invert_yaxis()
-    plt.draw()
-    previous = cross_corr
-    del data, cross_corr
+    else:
+        image.set_data(cross_corr)
+        image.set_extent(extent)
+    ax.set_title(
+        "Running, iteration: " + str(index) + "\n Press q to stop (mouse on the plot)"
+    )
+    index = index + 1
+    fig.canvas.draw_idle()
     plt.pause(exposure_time)
 
 plt.ioff()
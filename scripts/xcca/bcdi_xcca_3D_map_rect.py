@@ -16,9 +16,7 @@ import tkinter as tk
 from tkinter import filedialog
 import gc
 import multiprocessing as mp
-import sys
 import bcdi.graph.graph_utils as gu
-import bcdi.utils.utilities as util
 import bcdi.xcca.xcca_utils as xcca
 import bcdi.postprocessing.facet_recognition as fu
 
@@ -60,32 +58,6 @@ plot_meandata = False  # if True, will plot the 1D average of the data
 corr_count = np.zeros(
     (int(180 / angular_resolution), 2)
 )  # initialize the cross-correlation array
-current_point = 0  # do not change this number, it is used as counter in the callback
-#############################################
-# define multiprocessing callback functions #
-#############################################
-
-
-def collect_result(result):
-    """
-    Callback processing the result after asynchronous multiprocessing.
-
-    Update the global arrays corr_count, corr_point.
-
-    :param result: the output of ccf_val, containing the sorted cross-correlation
-     values, the angular bins indices and the number of points contributing to the
-     angular bins
-    """
-    global corr_count, current_point
-    # result is a tuple: ccf_uniq_val, counter_val, counter_indices
-    corr_count[result[2], 0] = corr_count[result[2], 0] + result[0]
-
-    corr_count[result[2], 1] = corr_count[result[2], 1] + result[1]  # this line is ok
-
-    current_point += 1
-    if (current_point % 100) == 0:
-        sys.stdout.write("\rPoint {:d}".format(current_point))
-        sys.stdout.flush()
 
 
 def main(calc_self, user_comment):
@@ -99,7 +71,7 @@ def main(calc_self, user_comment):
     ##########################
     # check input parameters #
     ##########################
-    global corr_count, current_point
+    global corr_count
     if len(origin_qspace) != 3:
         raise ValueError("origin_qspace should be a tuple of 3 integer pixel values")
     if type(calc_self) is not bool:
@@ -316,7 +288,6 @@ def main(calc_self, user_comment):
     mp.freeze_support()
 
     for ind_q in range(len(q_range)):
-        pool = mp.Pool(mp.cpu_count())  # use this number of processes
         if calc_self:
             key_q1 = "q" + str(ind_q + 1)
             key_q2 = key_q1
@@ -326,13 +297,6 @@ def main(calc_self, user_comment):
                     nb_points[ind_q], nb_points[ind_q], corr_count.shape[0]
                 )
             )
-            for ind_point in range(nb_points[ind_q]):
-                pool.apply_async(
-                    xcca.calc_ccf_rect,
-                    args=(ind_point, key_q1, key_q2, angular_bins, q_int),
-                    callback=collect_result,
-                    error_callback=util.catch_error,
-                )
         else:
             key_q1 = "q1"
             key_q2 = "q" + str(ind_q + 1)
@@ -342,18 +306,14 @@ def main(calc_self, user_comment):
                     nb_points[0], nb_points[ind_q], corr_count.shape[0]
                 )
             )
-            for ind_point in range(nb_points[0]):
-                pool.apply_async(
-                    xcca.calc_ccf_rect,
-                    args=(ind_point, key_q1, key_q2, angular_bins, q_int),
-                    callback=collect_result,
-                    error_callback=util.catch_error,
-                )
 
-        # close the pool and let all the processes complete
-        pool.close()
-        pool.join()  # postpones the execution of next line of code
-        # until all processes in the queue are done.
+        corr_count[:, 0], corr_count[:, 1] = xcca.calc_ccf(
+            points_q1=q_int[key_q1],
+            points_q2=q_int[key_q2],
+            bin_values=angular_bins,
+            coordinates="rect",
+            nb_workers=mp.cpu_count(),
+        )
 
         # normalize the cross-correlation by the counter
         indices = np.nonzero(corr_count[:, 1])
@@ -364,7 +324,6 @@ def main(calc_self, user_comment):
         corr_count = np.zeros(
             (int(180 / angular_resolution), 2)
         )  # corr_count is declared as a global, this should work
-        current_point = 0
 
     end = time.time()
     print(
@@ -17,9 +17,7 @@ import tkinter as tk
 from tkinter import filedialog
 import gc
 import multiprocessing as mp
-import sys
 import bcdi.graph.graph_utils as gu
-import bcdi.utils.utilities as util
 import bcdi.xcca.xcca_utils as xcca
 import bcdi.postprocessing.facet_recognition as fu
 
@@ -66,58 +64,6 @@ plot_meandata = False  # if True, will plot the 1D average of the data
 corr_count = np.zeros(
     (int(180 / angular_resolution), 2)
 )  # initialize the cross-correlation array
-current_point = 0  # do not change this number, it is used as counter in the callback
-#############################################
-# define multiprocessing callback functions #
-#############################################
-
-
-def collect_result(result):
-    """
-    Callback processing the result after asynchronous multiprocessing.
-
-    Update the global arrays corr_count, corr_point.
-
-    :param result: the output of ccf_val, containing the sorted cross-correlation
-     values, the angular bins indices and the number of points contributing to the
-     angular bins
-    """
-    global corr_count, current_point
-    # result is a tuple: ccf_uniq_val, counter_val, counter_indices
-    corr_count[result[2], 0] = corr_count[result[2], 0] + result[0]
-
-    corr_count[result[2], 1] = corr_count[result[2], 1] + result[1]  # this line is ok
-
-    current_point += 1
-    if (current_point % 100) == 0:
-        sys.stdout.write("\rPoint {:d}".format(current_point))
-        sys.stdout.flush()
-
-
-def collect_result_debug(ccf_uniq_val, counter_val, counter_indices):
-    """
-    Similar behaviour as collect_result() when multiprocessing is not used.
-
-    It is usefull for debugging.
-
-    :param ccf_uniq_val: the sorted cross-correlation values
-    :param counter_val: the number of points contributing to the angular bins defined
-     by counter_indices
-    :param counter_indices: the indices of angular bins where to update
-     the cross-correlation
-    """
-    global corr_count, current_point
-    # result is a tuple: ccf_uniq_val, counter_val, counter_indices
-    corr_count[counter_indices, 0] = corr_count[counter_indices, 0] + ccf_uniq_val
-
-    corr_count[counter_indices, 1] = (
-        corr_count[counter_indices, 1] + counter_val
-    )  # this line is ok
-
-    current_point += 1
-    if (current_point % 100) == 0:
-        sys.stdout.write("\rPoint {:d}".format(current_point))
-        sys.stdout.flush()
 
 
 def main(user_comment):
@@ -391,30 +337,18 @@ def main(user_comment):
 
     start = time.time()
     if single_proc:
-        for idx in range(nb_points[0]):
-            ccf_uniq_val, counter_val, counter_indices = xcca.calc_ccf_polar(
-                point=idx,
-                q1_name="q1",
-                q2_name=key_q2,
-                bin_values=angular_bins,
-                polar_azi_int=theta_phi_int,
-            )
-            collect_result_debug(ccf_uniq_val, counter_val, counter_indices)
+        nb_workers = 1
     else:
         print("\nNumber of processors: ", mp.cpu_count())
         mp.freeze_support()
-        pool = mp.Pool(mp.cpu_count())  # use this number of processes
-        for idx in range(nb_points[0]):
-            pool.apply_async(
-                xcca.calc_ccf_polar,
-                args=(idx, "q1", key_q2, angular_bins, theta_phi_int),
-                callback=collect_result,
-                error_callback=util.catch_error,
-            )
-        # close the pool and let all the processes complete
-        pool.close()
-        pool.join()  # postpones the execution of next line of code
-        # until all processes in the queue are done.
+        nb_workers = mp.cpu_count()
+    corr_count[:, 0], corr_count[:, 1] = xcca.calc_ccf(
+        points_q1=theta_phi_int["q1"],
+        points_q2=theta_phi_int[key_q2],
+        bin_values=angular_bins,
+        coordinates="polar",
+        nb_workers=nb_workers,
+    )
     end = time.time()
     print(
         "\nTime ellapsed for the calculation of the CCF:",
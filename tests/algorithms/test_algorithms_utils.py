@@ -7,6 +7,8 @@
 #       authors:
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
+import numpy as np
+from scipy.signal import fftconvolve
 import unittest
 import bcdi.algorithms.algorithms_utils as alg
 
@@ -24,5 +26,58 @@ class Test(unittest.TestCase):
         self.assertTrue(True)
 
 
+class TestRichardsonLucy(unittest.TestCase):
+    """
+    Tests on the function algorithms_utils.richardson_lucy.
+
+    def richardson_lucy(image, psf, iterations=50, clip=True, guess=None,
+     dtype=np.float64, workers=None)
+    """
+
+    def setUp(self):
+        # executed before each test
+        rng = np.random.default_rng(0)
+        self.image = rng.random((10, 11, 12)) + 0.1
+        self.psf = rng.random((10, 11, 12)) ** 8
+        self.psf /= self.psf.sum()
+
+    def reference(self, iterations):
+        im_deconv = np.full(self.image.shape, 0.5)
+        error = np.empty(iterations)
+        for idx in range(iterations):
+            previous_deconv = np.copy(im_deconv)
+            relative_blur = self.image / fftconvolve(im_deconv, self.psf, "same")
+            im_deconv *= fftconvolve(relative_blur, self.psf[::-1, ::-1], "same")
+            error[idx] = np.linalg.norm(previous_deconv - im_deconv) / np.linalg.norm(
+                previous_deconv
+            )
+        return im_deconv, error
+
+    def test_same_as_fftconvolve(self):
+        im_deconv, error = alg.richardson_lucy(
+            self.image, self.psf, iterations=5, clip=False
+        )
+        ref_deconv, ref_error = self.reference(iterations=5)
+        self.assertTrue(np.allclose(im_deconv, ref_deconv))
+        self.assertTrue(np.allclose(error, ref_error))
+
+    def test_float32(self):
+        im_deconv, error = alg.richardson_lucy(
+            self.image, self.psf, iterations=5, clip=False, dtype=np.float32
+        )
+        ref_deconv, _ = self.reference(iterations=5)
+        self.assertEqual(im_deconv.dtype, np.float32)
+        self.assertEqual(error.shape, (5,))
+        self.assertTrue(np.allclose(im_deconv, ref_deconv, rtol=1e-4))
+
+    def test_guess_updated_in_place(self):
+        guess = np.full(self.image.shape, 0.5)
+        im_deconv, _ = alg.richardson_lucy(
+            self.image, self.psf, iterations=2, guess=guess
+        )
+        self.assertIs(im_deconv, guess)
+
+
 if __name__ == "__main__":
     run_tests(Test)
+    run_tests(TestRichardsonLucy)
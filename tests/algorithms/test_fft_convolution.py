@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+import numpy as np
+from scipy.signal import fftconvolve
+import unittest
+from bcdi.algorithms.fft_convolution import FFTConvolution
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    return runner.run(suite)
+
+
+class TestFFTConvolution(unittest.TestCase):
+    """Tests related to the FFTConvolution class."""
+
+    def setUp(self):
+        # executed before each test
+        rng = np.random.default_rng(0)
+        self.array = rng.random((11, 12, 13))
+        self.kernel = rng.random((4, 5, 6))
+        self.convolution = FFTConvolution(kernel=self.kernel, shape=self.array.shape)
+
+    def test_same_as_fftconvolve(self):
+        self.assertTrue(
+            np.allclose(
+                self.convolution(self.array),
+                fftconvolve(self.array, self.kernel, mode="same"),
+            )
+        )
+
+    def test_same_shape_kernel(self):
+        convolution = FFTConvolution(kernel=self.array, shape=self.array.shape)
+        self.assertTrue(
+            np.allclose(
+                convolution(self.kernel.sum() * self.array),
+                fftconvolve(self.kernel.sum() * self.array, self.array, mode="same"),
+            )
+        )
+
+    def test_fft_shape(self):
+        self.assertEqual(self.convolution.fft_shape, (15, 16, 18))
+
+    def test_reuse(self):
+        first = self.convolution(self.array)
+        self.convolution(2 * self.array)
+        self.assertTrue(np.array_equal(self.convolution(self.array), first))
+
+    def test_out(self):
+        out = np.empty(self.array.shape)
+        output = self.convolution(self.array, out=out)
+        self.assertIs(output, out)
+        self.assertTrue(
+            np.allclose(out, fftconvolve(self.array, self.kernel, mode="same"))
+        )
+
+    def test_float32(self):
+        convolution = FFTConvolution(
+            kernel=self.kernel, shape=self.array.shape, dtype=np.float32
+        )
+        output = convolution(self.array)
+        self.assertEqual(output.dtype, np.float32)
+        self.assertTrue(
+            np.allclose(
+                output, fftconvolve(self.array, self.kernel, mode="same"), rtol=1e-5
+            )
+        )
+
+    def test_workers(self):
+        convolution = FFTConvolution(
+            kernel=self.kernel, shape=self.array.shape, workers=2
+        )
+        self.assertTrue(
+            np.allclose(convolution(self.array), self.convolution(self.array))
+        )
+
+    def test_wrong_dtype(self):
+        with self.assertRaises(ValueError):
+            FFTConvolution(kernel=self.kernel, shape=self.array.shape, dtype=complex)
+
+    def test_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            FFTConvolution(kernel=self.kernel, shape=(11, 12))
+
+    def test_wrong_array_shape(self):
+        with self.assertRaises(ValueError):
+            self.convolution(np.ones((11, 12, 14)))
+
+
+if __name__ == "__main__":
+    run_tests(TestFFTConvolution)
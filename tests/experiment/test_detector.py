@@ -664,6 +664,64 @@ class TestMaxipix(unittest.TestCase):
         self.assertTrue(np.all(mask[:, 255:261]) == 1)
         self.assertTrue(np.all(mask[255:261, :]) == 1)
 
+    def test_correct_frames_same_as_mask_detector(self):
+        rng = np.random.default_rng(0)
+        self.det.saturation_threshold = 900
+        frames = rng.integers(0, 1000, size=(3, 516, 516))
+        flatfield = rng.random((516, 516)) + 0.5
+        hotpixels = np.zeros((516, 516))
+        hotpixels[10, 20] = 1
+        expected_mask = np.zeros((516, 516))
+        expected = []
+        for frame in frames:
+            corrected, expected_mask = self.det.mask_detector(
+                frame, expected_mask, flatfield=flatfield, hotpixels=hotpixels
+            )
+            expected.append(corrected * 2)
+        data, mask = self.det.correct_frames(
+            frames.astype(float),
+            np.zeros((516, 516)),
+            flatfield=flatfield,
+            hotpixels=hotpixels,
+            monitor=np.full(3, 2.0),
+        )
+        self.assertTrue(np.allclose(data, np.asarray(expected)))
+        self.assertTrue(np.array_equal(mask, expected_mask))
+
+    def test_correct_frames_in_place_float32(self):
+        data = np.ones((2, 516, 516), dtype=np.float32)
+        output, mask = self.det.correct_frames(data, self.mask)
+        self.assertIs(output, data)
+        self.assertTrue(np.all(data[:, 255:261, :] == 0))
+        self.assertTrue(np.all(mask[:, 255:261] == 1))
+
+    def test_correct_frames_integer_data(self):
+        output, _ = self.det.correct_frames(
+            np.ones((2, 516, 516), dtype=int), self.mask
+        )
+        self.assertEqual(output.dtype, np.float32)
+
+    def test_correct_frames_wrong_mask_shape(self):
+        with self.assertRaises(ValueError):
+            self.det.correct_frames(np.ones((2, 516, 516)), np.zeros((516, 515)))
+
+    def test_correct_frames_roi(self):
+        roi = [200, 300, 250, 270]
+        data, mask = self.det.correct_frames(
+            np.ones((2, 516, 516)), np.zeros((516, 516))
+        )
+        data_roi, mask_roi = self.det.correct_frames(
+            np.ones((2, 100, 20)), np.zeros((100, 20)), roi=roi
+        )
+        self.assertTrue(np.array_equal(data_roi, data[:, 200:300, 250:270]))
+        self.assertTrue(np.array_equal(mask_roi, mask[200:300, 250:270]))
+
+    def test_correct_frames_wrong_roi(self):
+        with self.assertRaises(ValueError):
+            self.det.correct_frames(
+                np.ones((2, 100, 20)), np.zeros((100, 20)), roi=[0, 100, 0, 21]
+            )
+
 
 class TestEiger2M(unittest.TestCase):
     """Tests related to the Eiger2M detector."""
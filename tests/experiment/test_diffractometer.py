@@ -7,8 +7,15 @@
 #       authors:
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
+import numpy as np
+import os
+import tables
+import tempfile
 import unittest
-from bcdi.experiment.diffractometer import Diffractometer
+from bcdi.experiment.detector import create_detector
+from bcdi.experiment.diffractometer import create_diffractometer, Diffractometer
+from bcdi.experiment.setup import Setup
+from bcdi.preprocessing.ReadNxs3 import DataSet
 
 
 def run_tests(test_class):
@@ -25,5 +32,199 @@ class Test(unittest.TestCase):
             Diffractometer(sample_offsets=[])
 
 
+class TestLoadFrames(unittest.TestCase):
+    """
+    Tests related to Diffractometer.load_frames.
+
+    def load_frames(self, data, mask2d, monitor, read_frame, detector, loading_roi,
+     nb_workers=1, flatfield=None, background=None, hotpixels=None, normalize="skip",
+     bin_during_loading=False, debugging=False, read_roi=False, read_blocks=False)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.diffractometer = create_diffractometer(
+            beamline="ID01", sample_offsets=None
+        )
+        self.detector = create_detector("Dummy", custom_pixelnumber=(8, 10))
+        self.detector.saturation_threshold = 50
+        rng = np.random.default_rng(0)
+        self.frames = rng.integers(0, 60, size=(6, 8, 10)).astype(float)
+        self.hotpixels = np.zeros((8, 10))
+        self.hotpixels[2, 3] = 1
+
+    def load(
+        self,
+        nb_workers,
+        normalize="skip",
+        series=False,
+        read_roi=False,
+        read_blocks=False,
+    ):
+        frames = self.frames.copy()
+        nb_points = 3 if series else 6
+        self.regions = []
+
+        def read_frame(points, roi=None):
+            self.regions.append(roi)
+            if roi is not None:
+                frames_roi = frames[:, roi[0] : roi[1], roi[2] : roi[3]]
+            else:
+                frames_roi = frames
+            if series:
+                return frames_roi[2 * points : 2 * points + 2]
+            return frames_roi[points]
+
+        return self.diffractometer.load_frames(
+            data=np.empty((nb_points, 8, 6)),
+            mask2d=np.zeros((8, 10)),
+            monitor=np.ones(nb_points),
+            read_frame=read_frame,
+            detector=self.detector,
+            loading_roi=[0, 8, 2, 8],
+            nb_workers=nb_workers,
+            hotpixels=self.hotpixels,
+            normalize=normalize,
+            read_roi=read_roi,
+            read_blocks=read_blocks,
+        )
+
+    def test_corrections(self):
+        data, mask2d, _ = self.load(nb_workers=1)
+        expected = self.frames[:, :, 2:8].copy()
+        expected[:, 2, 1] = 0
+        expected[expected > 50] = 0
+        self.assertTrue(np.array_equal(data, expected))
+        self.assertEqual(mask2d[2, 3], 1)
+        self.assertTrue(
+            np.array_equal(
+                mask2d != 0, (self.frames > 50).any(axis=0) | (self.hotpixels == 1)
+            )
+        )
+
+    def test_parallel_same_as_serial(self):
+        serial = self.load(nb_workers=1, normalize="sum_roi")
+        parallel = self.load(nb_workers=3, normalize="sum_roi")
+        for serial_array, parallel_array in zip(serial, parallel):
+            self.assertTrue(np.array_equal(serial_array, parallel_array))
+
+    def test_series(self):
+        data, _, monitor = self.load(nb_workers=2, normalize="sum_roi", series=True)
+        single_data, _, single_monitor = self.load(nb_workers=1, normalize="sum_roi")
+        self.assertTrue(np.array_equal(data, single_data[0::2] + single_data[1::2]))
+        self.assertTrue(
+            np.array_equal(monitor, single_monitor[0::2] + single_monitor[1::2])
+        )
+
+    def test_read_roi(self):
+        data, mask2d, monitor = self.load(nb_workers=1, read_roi=True)
+        self.assertTrue(all(region == [0, 8, 2, 8] for region in self.regions))
+        expected = self.load(nb_workers=1)
+        self.assertTrue(np.array_equal(data, expected[0]))
+        self.assertTrue(np.array_equal(monitor, expected[2]))
+        # the mask is only updated in the loading ROI
+        self.assertTrue(np.array_equal(mask2d[:, 2:8], expected[1][:, 2:8]))
+        self.assertFalse(mask2d[:, :2].any())
+
+    def test_read_roi_sum_roi(self):
+        # the region read is extended to the sum ROI
+        self.detector.sum_roi = [1, 5, 0, 4]
+        data, _, monitor = self.load(nb_workers=1, normalize="sum_roi", read_roi=True)
+        self.assertTrue(all(region == [0, 8, 0, 8] for region in self.regions))
+        expected = self.load(nb_workers=1, normalize="sum_roi")
+        self.assertTrue(np.array_equal(data, expected[0]))
+        self.assertTrue(np.array_equal(monitor, expected[2]))
+
+    def test_read_roi_series(self):
+        data, _, monitor = self.load(
+            nb_workers=2, normalize="sum_roi", series=True, read_roi=True
+        )
+        expected = self.load(nb_workers=1, normalize="sum_roi", series=True)
+        self.assertTrue(np.array_equal(data, expected[0]))
+        self.assertTrue(np.array_equal(monitor, expected[2]))
+
+    def test_read_blocks(self):
+        for nb_workers in (1, 2, 4):
+            with self.subTest(nb_workers=nb_workers):
+                output = self.load(
+                    nb_workers=nb_workers,
+                    normalize="sum_roi",
+                    read_roi=True,
+                    read_blocks=True,
+                )
+                expected = self.load(nb_workers=1, normalize="sum_roi", read_roi=True)
+                for array, expected_array in zip(output, expected):
+                    self.assertTrue(np.array_equal(array, expected_array))
+
+    def test_read_blocks_length(self):
+        self.load(nb_workers=2, read_blocks=True)
+        self.assertEqual(len(self.regions), 2)
+
+    def test_wrong_nb_workers(self):
+        with self.assertRaises(ValueError):
+            self.load(nb_workers=0)
+
+
+class TestLazyLogfileSIXS(unittest.TestCase):
+    """
+    Tests related to DiffractometerSIXS with a lazy logfile.
+
+    def motor_positions(self, setup, **kwargs)
+    def load_data(self, logfile, detector, setup, flatfield=None, hotpixels=None,
+     background=None, normalize="skip", bin_during_loading=False, debugging=False,
+     **kwargs)
+    """
+
+    def setUp(self):
+        # executed before each test, write a small FLY scan
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = "fly_scan.nxs"
+        self.mu = np.linspace(10, 11, num=4)
+        with tables.open_file(
+            os.path.join(self.tmpdir.name, self.filename), mode="w"
+        ) as h5file:
+            entry = h5file.create_group("/", "scan_00001")
+            scan_data = h5file.create_group(entry, "scan_data")
+            for name, values in (
+                ("mu", self.mu),
+                ("beta", np.full(4, 0.5)),
+                ("delta", np.full(4, 30.0)),
+                ("gamma", np.full(4, 2.0)),
+                ("mpx_image", np.ones((4, 512, 3), dtype=np.uint32)),
+            ):
+                h5file.create_array(scan_data, name, values)
+            sixs = h5file.create_group(entry, "SIXS")
+            mono = h5file.create_group(sixs, "Monochromator")
+            h5file.create_array(mono, "energy", np.array([8.5]))
+            h5file.create_array(mono, "wavelength", np.array([1.46]))
+        self.setup = Setup(beamline="SIXS_2019")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_logfile_closed(self):
+        logfile = DataSet(self.filename, directory=self.tmpdir.name, lazy=True)
+        beta, mu, gamma, delta, _ = self.setup.diffractometer.motor_positions(
+            setup=self.setup, logfile=logfile
+        )
+        self.assertIsNone(logfile._file)
+        self.assertTrue(np.array_equal(mu, self.mu))
+        self.assertEqual((beta, gamma, delta), (0.5, 2.0, 30.0))
+        # the frames can still be accessed after reading the motors
+        self.assertEqual(logfile.mpx_image.shape, (4, 512, 3))
+        logfile.close()
+
+    def test_logfile_closed_on_error(self):
+        logfile = DataSet(self.filename, directory=self.tmpdir.name, lazy=True)
+        # there is no Merlin stack in the file
+        with self.assertRaises(AttributeError):
+            self.setup.diffractometer.load_data(
+                logfile=logfile, detector=create_detector("Merlin"), setup=self.setup
+            )
+        self.assertIsNone(logfile._file)
+
+
 if __name__ == "__main__":
     run_tests(Test)
+    run_tests(TestLoadFrames)
+    run_tests(TestLazyLogfileSIXS)
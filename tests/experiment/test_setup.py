@@ -7,7 +7,9 @@
 #       authors:
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
+import numpy as np
 import unittest
+from bcdi.experiment.detector import create_detector
 from bcdi.experiment.setup import Setup
 
 
@@ -25,5 +27,141 @@ class Test(unittest.TestCase):
             Setup()
 
 
+class TestGridCylindrical(unittest.TestCase):
+    """
+    Tests related to Setup.grid_cylindrical.
+
+    def grid_cylindrical(self, array, rotation_angle, direct_beam, interp_angle,
+     interp_radius, fill_value=np.nan, comment="", multiprocessing=False)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.setup = Setup(beamline="P10_SAXS")
+        rng = np.random.default_rng(0)
+        self.array = rng.random((46, 7, 30))
+        self.rotation_angle = np.linspace(0, 180, num=46)
+        self.interp_angle, self.interp_radius = self.setup._beamline.cartesian2polar(
+            nb_pixels=40, pivot=20, offset_angle=0
+        )
+
+    def grid(self, array, rotation_angle, **kwargs):
+        return self.setup.grid_cylindrical(
+            array=array,
+            rotation_angle=rotation_angle,
+            direct_beam=15,
+            interp_angle=self.interp_angle,
+            interp_radius=self.interp_radius,
+            **kwargs,
+        )
+
+    def test_same_as_interp_2dslice(self):
+        output = self.grid(self.array, self.rotation_angle)
+        self.assertEqual(output.shape, (40, 7, 40))
+        for idx in range(7):
+            expected, _ = self.setup.interp_2dslice(
+                array=self.array[:, idx, :],
+                slice_index=idx,
+                rotation_angle=self.rotation_angle,
+                direct_beam=15,
+                interp_angle=self.interp_angle,
+                interp_radius=self.interp_radius,
+                fill_value=np.nan,
+            )
+            # the detector vertical axis is flipped
+            # same interpolation up to floating point round-off
+            np.testing.assert_allclose(
+                output[:, 6 - idx, :], expected, rtol=1e-12, equal_nan=True
+            )
+
+    def test_multiprocessing(self):
+        np.testing.assert_allclose(
+            self.grid(self.array, self.rotation_angle, multiprocessing=True),
+            self.grid(self.array, self.rotation_angle),
+            rtol=1e-12,
+            equal_nan=True,
+        )
+
+    def test_decreasing_angles(self):
+        np.testing.assert_allclose(
+            self.grid(self.array[::-1], self.rotation_angle[::-1]),
+            self.grid(self.array, self.rotation_angle),
+            rtol=1e-12,
+            equal_nan=True,
+        )
+
+    def test_fill_value_integer_array(self):
+        output = self.grid(
+            np.ones(self.array.shape, dtype=int), self.rotation_angle, fill_value=0
+        )
+        self.assertEqual(output.dtype, int)
+        self.assertEqual(set(np.unique(output)), {0, 1})
+
+
+class TestTransformationCDIEwald(unittest.TestCase):
+    """
+    Tests related to Setup.transformation_cdi_ewald.
+
+    def transformation_cdi_ewald(self, arrays, direct_beam, cdi_angle, fill_value,
+     gridder="griddata", fill_holes=False)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.setup = Setup(
+            beamline="P10_SAXS",
+            detector=create_detector("Eiger4M"),
+            energy=8000,
+            distance=5.0,
+        )
+        self.direct_beam = (3, 5)
+        # the frames are gridded by blocks of 10 frames for this frame shape,
+        # the last block holds a single frame
+        self.cdi_angle = np.linspace(0, 40, num=41)
+        self.shape = (41, 6, 10)
+
+    def transform(self, arrays, gridder):
+        return self.setup.transformation_cdi_ewald(
+            arrays=arrays,
+            direct_beam=self.direct_beam,
+            cdi_angle=self.cdi_angle,
+            fill_value=(np.nan,) * len(arrays),
+            gridder=gridder,
+        )
+
+    def test_single_frame_block(self):
+        for gridder in ("nearest", "linear"):
+            (output,), _ = self.transform((np.ones(self.shape),), gridder=gridder)
+            self.assertEqual(output.shape, (10, 6, 10))
+            self.assertTrue(np.allclose(output[~np.isnan(output)], 1))
+
+    def test_same_as_griddata(self):
+        q_values = self.setup._beamline.ewald_curvature_saxs(
+            wavelength=self.setup.wavelength * 1e9,
+            beam_direction=self.setup.beam_direction,
+            pixelsize_x=self.setup.detector.pixelsize_x * 1e9,
+            pixelsize_y=self.setup.detector.pixelsize_y * 1e9,
+            distance=self.setup.distance * 1e9,
+            array_shape=self.shape,
+            cdi_angle=self.cdi_angle,
+            direct_beam=self.direct_beam,
+        )
+        gradient = (100, 200, -150)
+        data = 1 + sum(grad * q for grad, q in zip(gradient, q_values))
+        (expected,), grid = self.transform((data,), gridder="griddata")
+        # the data is averaged in the vicinity of each node, it differs from the
+        # interpolated value by less than its variation over one voxel
+        tolerance = sum(abs(grad) * (q[1] - q[0]) for grad, q in zip(gradient, grid))
+        for gridder in ("nearest", "linear"):
+            (output,), axes = self.transform((data,), gridder=gridder)
+            for axis, grid_axis in zip(axes, grid):
+                self.assertTrue(np.allclose(axis, grid_axis))
+            both = np.logical_and(~np.isnan(output), ~np.isnan(expected))
+            self.assertGreater(both.sum(), 100)
+            self.assertLess(abs(output - expected)[both].max(), tolerance)
+
+
 if __name__ == "__main__":
     run_tests(Test)
+    run_tests(TestGridCylindrical)
+    run_tests(TestTransformationCDIEwald)
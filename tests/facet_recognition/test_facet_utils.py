@@ -7,6 +7,8 @@
 #       authors:
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
+import numpy as np
+from scipy import stats
 import unittest
 import bcdi.postprocessing.facet_recognition as fu
 
@@ -24,5 +26,369 @@ class Test(unittest.TestCase):
         self.assertTrue(True)
 
 
+class TestBinnedKDE(unittest.TestCase):
+    """
+    Tests related to binned_kde.
+
+    def binned_kde(points, axes, covariance, weights=None, oversampling=None)
+    """
+
+    def setUp(self):
+        # executed before each test
+        rng = np.random.default_rng(0)
+        self.points = np.concatenate(
+            (
+                rng.normal(loc=(-1, 0.5), scale=(0.3, 0.2), size=(500, 2)),
+                rng.normal(loc=(1, -0.5), scale=(0.2, 0.4), size=(300, 2)),
+            )
+        ).T
+        self.axes = (np.linspace(-2, 2, num=41), np.linspace(-3, 3, num=61))
+        self.grid = np.meshgrid(*self.axes, indexing="ij")
+
+    def test_same_as_gaussian_kde(self):
+        kde = stats.gaussian_kde(self.points, bw_method=0.2)
+        expected = kde(np.vstack([axis.ravel() for axis in self.grid])).reshape(
+            self.grid[0].shape
+        )
+        density = fu.binned_kde(self.points, self.axes, covariance=kde.covariance)
+        self.assertEqual(density.shape, (41, 61))
+        self.assertTrue(np.allclose(density, expected, atol=5e-3 * expected.max()))
+
+    def test_narrow_kernel(self):
+        # the kernel is narrower than the grid step, the binning grid is refined
+        kde = stats.gaussian_kde(self.points, bw_method=0.03)
+        expected = kde(np.vstack([axis.ravel() for axis in self.grid])).reshape(
+            self.grid[0].shape
+        )
+        density = fu.binned_kde(self.points, self.axes, covariance=kde.covariance)
+        self.assertTrue(np.allclose(density, expected, atol=1e-2 * expected.max()))
+
+    def test_oversampling(self):
+        kde = stats.gaussian_kde(self.points, bw_method=0.2)
+        density = fu.binned_kde(
+            self.points, self.axes, covariance=kde.covariance, oversampling=4
+        )
+        self.assertTrue(
+            np.allclose(
+                density,
+                fu.binned_kde(self.points, self.axes, covariance=kde.covariance),
+                atol=5e-3 * density.max(),
+            )
+        )
+
+    def test_weights(self):
+        weights = np.linspace(1, 3, num=self.points.shape[1])
+        kde = stats.gaussian_kde(self.points, bw_method=0.2, weights=weights)
+        expected = kde(np.vstack([axis.ravel() for axis in self.grid])).reshape(
+            self.grid[0].shape
+        )
+        density = fu.binned_kde(
+            self.points, self.axes, covariance=kde.covariance, weights=weights
+        )
+        self.assertTrue(np.allclose(density, expected, atol=5e-3 * expected.max()))
+
+    def test_normalization(self):
+        # the density integrates to 1
+        density = fu.binned_kde(self.points, self.axes, covariance=np.identity(2) / 25)
+        self.assertTrue(np.isclose(density.sum() * 0.1 * 0.1, 1, atol=5e-3))
+
+    def test_points_outside(self):
+        # points far outside of the grid do not contribute
+        points = np.concatenate((self.points, [[10, -10], [0, 0]]), axis=1)
+        density = fu.binned_kde(
+            points, self.axes, covariance=np.identity(2) / 25, weights=np.ones(802)
+        )
+        self.assertTrue(np.isclose(density.sum() * 0.1 * 0.1, 800 / 802, atol=5e-3))
+
+    def test_wrong_points_shape(self):
+        with self.assertRaises(ValueError):
+            fu.binned_kde(self.points.T, self.axes, covariance=np.identity(2))
+
+    def test_wrong_covariance_shape(self):
+        with self.assertRaises(ValueError):
+            fu.binned_kde(self.points, self.axes, covariance=np.identity(3))
+
+
+class TestCalcStereoprojFacet(unittest.TestCase):
+    """
+    Tests related to calc_stereoproj_facet.
+
+    def calc_stereoproj_facet(projection_axis, vectors, radius_mean, stereo_center)
+    """
+
+    def test_projection(self):
+        vectors = np.array([[0, 1, 0], [1, 0, 0], [0.6, 0, 0.8]])
+        stereo_proj, uv_labels = fu.calc_stereoproj_facet(
+            projection_axis=0, vectors=vectors, radius_mean=1, stereo_center=0
+        )
+        self.assertEqual(uv_labels, ("axis 1", "axis 2"))
+        self.assertTrue(np.allclose(stereo_proj[0], [90, 0, 90, 0]))
+        self.assertTrue(
+            np.allclose(stereo_proj[1], [0, 0, np.nan, np.nan], equal_nan=True)
+        )
+        self.assertTrue(np.allclose(stereo_proj[2], [0, 45, 0, 180]))
+
+    def test_projection_axis(self):
+        vectors = np.array([[0.6, 0.8, 0], [0.8, 0, 0.6]])
+        stereo_proj, uv_labels = fu.calc_stereoproj_facet(
+            projection_axis=2, vectors=vectors, radius_mean=1, stereo_center=0
+        )
+        self.assertEqual(uv_labels, ("axis 0", "axis 1"))
+        self.assertTrue(np.allclose(stereo_proj[0], [54, 72, 54, 72]))
+        self.assertTrue(np.allclose(stereo_proj[1], [45, 0, 180, 0]))
+
+    def test_wrong_projection_axis(self):
+        with self.assertRaises(ValueError):
+            fu.calc_stereoproj_facet(
+                projection_axis=3,
+                vectors=np.ones((1, 3)),
+                radius_mean=1,
+                stereo_center=0,
+            )
+
+
+class TestFindFacet(unittest.TestCase):
+    """
+    Tests on the function facet_recognition.find_facet.
+
+    def find_facet(refplane_indices, surf_indices, original_shape, step_shift,
+     plane_label, plane_coeffs, min_points, debugging=False)
+    """
+
+    def setUp(self):
+        # executed before each test, the surface is the top and bottom faces of a cube
+        self.shape = (20, 20, 20)
+        surface = np.zeros(self.shape)
+        surface[5, 5:15, 5:15] = 1
+        surface[14, 5:15, 5:15] = 1
+        self.surf_indices = np.nonzero(surface)
+        plane = np.zeros(self.shape)
+        plane[10, 4:16, 4:16] = 1
+        self.plane_indices = np.nonzero(plane)
+
+    def test_shift_positive(self):
+        shift = fu.find_facet(
+            refplane_indices=self.plane_indices,
+            surf_indices=self.surf_indices,
+            original_shape=self.shape,
+            step_shift=1,
+            plane_label=1,
+            plane_coeffs=(1, 0, 0, -10),
+            min_points=5,
+        )
+        self.assertEqual(shift, 4)
+
+    def test_shift_outside_of_array(self):
+        # the plane is shifted outside of the array before reaching the surface
+        surface = np.zeros(self.shape)
+        surface[5, 5:15, 5:15] = 1
+        shift = fu.find_facet(
+            refplane_indices=self.plane_indices,
+            surf_indices=np.nonzero(surface),
+            original_shape=self.shape,
+            step_shift=5,
+            plane_label=1,
+            plane_coeffs=(1, 0, 0, -10),
+            min_points=5,
+        )
+        self.assertEqual(shift, -5)
+
+
+class TestMeshAdjacency(unittest.TestCase):
+    """
+    Tests on the function facet_recognition.mesh_adjacency.
+
+    def mesh_adjacency(faces, nb_vertices)
+    """
+
+    def test_square(self):
+        # two triangles sharing the edge (0, 2)
+        faces = np.array([[0, 1, 2], [0, 2, 3]])
+        adjacency = fu.mesh_adjacency(faces, nb_vertices=5).toarray()
+        expected = np.array(
+            [
+                [0, 1, 1, 1, 0],
+                [1, 0, 1, 0, 0],
+                [1, 1, 0, 1, 0],
+                [1, 0, 1, 0, 0],
+                [0, 0, 0, 0, 0],
+            ]
+        )
+        self.assertTrue(np.array_equal(adjacency, expected))
+
+    def test_degenerated_face(self):
+        adjacency = fu.mesh_adjacency(np.array([[0, 0, 1]]), nb_vertices=2)
+        self.assertTrue(np.array_equal(adjacency.toarray(), [[0, 1], [1, 0]]))
+
+
+class TestLaplacianStep(unittest.TestCase):
+    """
+    Tests on the function facet_recognition.laplacian_step.
+
+    def laplacian_step(vertices, adjacency, factor, fixed_indices=None)
+    """
+
+    def setUp(self):
+        # executed before each test, pyramid with a square base
+        self.vertices = np.array(
+            [[0, 0, 0], [2, 0, 0], [2, 2, 0], [0, 2, 0], [1, 1, 3]], dtype=float
+        )
+        self.faces = np.array([[0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4]])
+        self.adjacency = fu.mesh_adjacency(self.faces, nb_vertices=5)
+
+    def test_same_as_loop(self):
+        expected = np.copy(self.vertices)
+        for idx in range(self.vertices.shape[0]):
+            neighbours = self.adjacency[idx].indices
+            weights = 1 / np.linalg.norm(
+                self.vertices[neighbours] - self.vertices[idx], axis=1
+            )
+            barycenter = (weights[:, np.newaxis] * self.vertices[neighbours]).sum(
+                axis=0
+            ) / weights.sum()
+            expected[idx] += 0.33 * (barycenter - self.vertices[idx])
+        output = fu.laplacian_step(self.vertices, self.adjacency, factor=0.33)
+        self.assertTrue(np.allclose(output, expected))
+
+    def test_apex(self):
+        # the apex is moved towards the center of the base
+        output = fu.laplacian_step(self.vertices, self.adjacency, factor=0.5)
+        self.assertTrue(np.allclose(output[4], [1, 1, 1.5]))
+
+    def test_fixed_indices(self):
+        output = fu.laplacian_step(
+            self.vertices, self.adjacency, factor=0.5, fixed_indices=[4]
+        )
+        self.assertTrue(np.array_equal(output[4], self.vertices[4]))
+        self.assertFalse(np.array_equal(output[0], self.vertices[0]))
+
+    def test_isolated_vertex(self):
+        vertices = np.concatenate((self.vertices, [[5, 5, 5]]))
+        adjacency = fu.mesh_adjacency(self.faces, nb_vertices=6)
+        output = fu.laplacian_step(vertices, adjacency, factor=0.5)
+        self.assertTrue(np.array_equal(output[5], vertices[5]))
+
+
+class TestNormalsDensity(unittest.TestCase):
+    """
+    Tests on the function facet_recognition.normals_density.
+
+    def normals_density(normals, weights, radius, max_pairs=2 ** 22)
+    """
+
+    def setUp(self):
+        # executed before each test
+        rng = np.random.default_rng(0)
+        self.normals = rng.normal(size=(300, 3))
+        self.normals /= np.linalg.norm(self.normals, axis=1)[:, np.newaxis]
+        self.normals[::50] = np.nan
+        self.weights = rng.random(300)
+        self.radius = 0.4
+        distances = np.linalg.norm(
+            self.normals[:, np.newaxis] - self.normals[np.newaxis], axis=-1
+        )
+        distances[~(distances < self.radius)] = 0
+        self.expected = (distances * self.weights[np.newaxis]).sum(axis=1)
+
+    def test_same_as_brute_force(self):
+        intensity = fu.normals_density(self.normals, self.weights, self.radius)
+        self.assertTrue(np.allclose(intensity, self.expected))
+
+    def test_chunks(self):
+        # chunks of a few normals
+        intensity = fu.normals_density(
+            self.normals, self.weights, self.radius, max_pairs=50
+        )
+        self.assertTrue(np.allclose(intensity, self.expected))
+
+    def test_nan_normals(self):
+        intensity = fu.normals_density(self.normals, self.weights, self.radius)
+        self.assertTrue(np.array_equal(intensity[::50], np.zeros(6)))
+
+    def test_all_nan(self):
+        intensity = fu.normals_density(np.full((4, 3), np.nan), np.ones(4), self.radius)
+        self.assertTrue(np.array_equal(intensity, np.zeros(4)))
+
+
+class TestRemoveDuplicates(unittest.TestCase):
+    """
+    Tests on the function facet_recognition.remove_duplicates.
+
+    def remove_duplicates(vertices, faces, debugging=False)
+    """
+
+    def test_duplicates(self):
+        vertices = np.array(
+            [[0, 0, 0], [1, 0, 0], [0, 0, 0], [0, 1, 0], [1, 0, 0], [0, 0, 1]],
+            dtype=float,
+        )
+        faces = np.array([[0, 1, 3], [2, 4, 5], [0, 2, 3], [3, 4, 5]])
+        new_vertices, new_faces = fu.remove_duplicates(vertices, faces)
+        self.assertTrue(np.array_equal(new_vertices, vertices[[0, 1, 3, 5]]))
+        # the face [0, 2, 3] is degenerated and removed
+        self.assertTrue(np.array_equal(new_faces, [[0, 1, 2], [0, 1, 3], [2, 1, 3]]))
+        self.assertTrue(
+            np.array_equal(new_vertices[new_faces], vertices[faces[[0, 1, 3]]])
+        )
+
+    def test_no_duplicates(self):
+        vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype=float)
+        faces = np.array([[0, 1, 2]])
+        new_vertices, new_faces = fu.remove_duplicates(vertices, faces)
+        self.assertTrue(np.array_equal(new_vertices, vertices))
+        self.assertTrue(np.array_equal(new_faces, faces))
+
+
+class TestSurfaceGradient(unittest.TestCase):
+    """
+    Tests related to surface_gradient and surface_normal_field.
+
+    def surface_gradient(points, support, width=2, normal_field=None)
+    """
+
+    def setUp(self):
+        # executed before each test, a cube in the middle of the array
+        self.support = np.zeros((20, 20, 20))
+        self.support[5:15, 5:15, 5:15] = 1
+
+    def test_faces(self):
+        vectors = fu.surface_gradient(
+            [(14, 10, 10), (10, 5, 10), (10.2, 9.8, 14.4)], support=self.support
+        )
+        self.assertEqual(len(vectors), 3)
+        self.assertTrue(np.allclose(vectors[0], [1, 0, 0]))
+        self.assertTrue(np.allclose(vectors[1], [0, -1, 0]))
+        self.assertTrue(np.allclose(vectors[2], [0, 0, 1]))
+
+    def test_corner(self):
+        vector = fu.surface_gradient((14, 5, 14), support=self.support)[0]
+        self.assertTrue(np.allclose(vector, np.array([1, -1, 1]) / np.sqrt(3)))
+
+    def test_normal_field(self):
+        normal_field = fu.surface_normal_field(self.support, width=1)
+        self.assertEqual(normal_field.shape, (3, 20, 20, 20))
+        self.assertTrue(np.allclose(normal_field[:, 10, 10, 10], 0))
+        points = np.transpose(np.nonzero(self.support))
+        self.assertTrue(
+            np.allclose(
+                fu.surface_gradient(points, support=None, normal_field=normal_field),
+                fu.surface_gradient(points, support=self.support, width=1),
+                equal_nan=True,
+            )
+        )
+
+    def test_wrong_ndim(self):
+        with self.assertRaises(ValueError):
+            fu.surface_normal_field(np.ones((3, 3)))
+
+
 if __name__ == "__main__":
     run_tests(Test)
+    run_tests(TestBinnedKDE)
+    run_tests(TestCalcStereoprojFacet)
+    run_tests(TestFindFacet)
+    run_tests(TestMeshAdjacency)
+    run_tests(TestLaplacianStep)
+    run_tests(TestNormalsDensity)
+    run_tests(TestRemoveDuplicates)
+    run_tests(TestSurfaceGradient)
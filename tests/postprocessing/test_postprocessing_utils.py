@@ -7,6 +7,9 @@
 #       authors:
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
+import numpy as np
+import os
+import tempfile
 import unittest
 import bcdi.postprocessing.postprocessing_utils as pu
 
@@ -24,5 +27,319 @@ class Test(unittest.TestCase):
         self.assertTrue(True)
 
 
+class TestGetOpticalpath(unittest.TestCase):
+    """
+    Tests on the function postprocessing_utils.get_opticalpath.
+
+    def get_opticalpath(support, direction, k, voxel_size=None, debugging=False,
+     **kwargs)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.support = np.zeros((32, 32, 32))
+        self.support[10:20, 10:20, 10:20] = 1
+
+    def test_direction_out(self):
+        path = pu.get_opticalpath(support=self.support, direction="out", k=(0, 0, 1))
+        self.assertAlmostEqual(path[15, 15, 15], 5)
+
+    def test_direction_in(self):
+        path = pu.get_opticalpath(support=self.support, direction="in", k=(0, 0, 1))
+        self.assertAlmostEqual(path[15, 15, 15], 6)
+
+    def test_voxel_size(self):
+        path = pu.get_opticalpath(
+            support=self.support, direction="out", k=(0, 0, 1), voxel_size=(1, 1, 2)
+        )
+        self.assertAlmostEqual(path[15, 15, 15], 10)
+
+    def test_outside_support_box(self):
+        path = pu.get_opticalpath(support=self.support, direction="out", k=(0, 1, 1))
+        self.assertEqual(path[0:10, :, :].sum(), 0)
+
+
+class TestMeanFilter(unittest.TestCase):
+    """
+    Tests on the function postprocessing_utils.mean_filter.
+
+    def mean_filter(array, support, half_width=0, width_z=None, width_y=None,
+     width_x=None, vmin=np.nan, vmax=np.nan, title="Object", debugging=False)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.support = np.zeros((10, 10, 10))
+        self.support[2:8, 2:8, 2:8] = 1
+        self.array = np.random.random((10, 10, 10))
+
+    def test_no_averaging(self):
+        output = pu.mean_filter(
+            array=np.copy(self.array), support=self.support, half_width=0
+        )
+        self.assertTrue(np.array_equal(output, self.array))
+
+    def test_inside_support(self):
+        output = pu.mean_filter(
+            array=np.copy(self.array), support=self.support, half_width=1
+        )
+        self.assertAlmostEqual(output[4, 4, 4], self.array[3:6, 3:6, 3:6].mean())
+
+    def test_support_edge(self):
+        output = pu.mean_filter(
+            array=np.copy(self.array), support=self.support, half_width=1
+        )
+        self.assertAlmostEqual(output[2, 2, 2], self.array[2:4, 2:4, 2:4].mean())
+
+    def test_outside_support(self):
+        output = pu.mean_filter(
+            array=np.copy(self.array), support=self.support, half_width=2
+        )
+        self.assertEqual(output[0, 0, 0], self.array[0, 0, 0])
+
+    def test_complex(self):
+        array = self.array * np.exp(1j * self.array)
+        output = pu.mean_filter(
+            array=np.copy(array), support=self.support, half_width=1
+        )
+        self.assertAlmostEqual(output[4, 4, 4], array[3:6, 3:6, 3:6].mean())
+
+
+class TestOrthoModes(unittest.TestCase):
+    """
+    Tests on the function postprocessing_utils.ortho_modes.
+
+    def ortho_modes(array_stack, nb_mode=None, method="eig", verbose=False, out=None)
+    """
+
+    def setUp(self):
+        # executed before each test, mixtures of two orthogonal modes
+        rng = np.random.default_rng(0)
+        self.modes = np.zeros((2, 4, 5, 6), dtype=complex)
+        self.modes[0, :2] = 3 * np.exp(1j * rng.random((2, 5, 6)))
+        self.modes[1, 2:] = np.exp(1j * rng.random((2, 5, 6)))
+        coefficients = rng.normal(size=(5, 2)) + 1j * rng.normal(size=(5, 2))
+        self.stack = np.tensordot(coefficients, self.modes, axes=1)
+
+    def test_orthogonal(self):
+        modes, _, _ = pu.ortho_modes(self.stack)
+        overlap = np.matmul(modes.reshape((5, -1)).conj(), modes.reshape((5, -1)).T)
+        self.assertTrue(np.allclose(overlap - np.diag(np.diag(overlap)), 0, atol=1e-8))
+
+    def test_intensity_conserved(self):
+        modes, _, weights = pu.ortho_modes(self.stack)
+        self.assertTrue(
+            np.isclose((abs(modes) ** 2).sum(), (abs(self.stack) ** 2).sum())
+        )
+        self.assertTrue(np.isclose(weights.sum(), 1))
+        self.assertTrue(np.all(np.diff(weights) <= 1e-12))
+        self.assertTrue(np.allclose(weights[2:], 0))
+
+    def test_nb_mode(self):
+        modes, eigenvectors, weights = pu.ortho_modes(self.stack, nb_mode=2)
+        self.assertEqual(modes.shape, (2, 4, 5, 6))
+        self.assertEqual(eigenvectors.shape, (5, 5))
+        self.assertEqual(len(weights), 5)
+        # the stack has a rank of 2, two modes contain the whole intensity
+        self.assertTrue(
+            np.isclose((abs(modes) ** 2).sum(), (abs(self.stack) ** 2).sum())
+        )
+
+    def test_same_as_svd(self):
+        stack = self.stack.real
+        modes, _, weights = pu.ortho_modes(stack, method="eig")
+        svd_modes, _, svd_weights = pu.ortho_modes(stack, method="svd")
+        self.assertTrue(np.allclose(weights, svd_weights))
+        self.assertTrue(np.allclose(abs(modes[:2]), abs(svd_modes[:2])))
+
+    def test_dtype(self):
+        modes, _, _ = pu.ortho_modes(self.stack.astype(np.complex64))
+        self.assertEqual(modes.dtype, np.complex64)
+        modes, _, _ = pu.ortho_modes(np.ones((3, 2, 2, 2), dtype=int))
+        self.assertEqual(modes.dtype, float)
+
+    def test_memmap(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "stack.npy")
+            np.save(filename, self.stack)
+            out = np.lib.format.open_memmap(
+                os.path.join(tmpdir, "modes.npy"),
+                mode="w+",
+                dtype=complex,
+                shape=(2, 4, 5, 6),
+            )
+            output, _, weights = pu.ortho_modes(
+                np.load(filename, mmap_mode="r"), nb_mode=2, out=out
+            )
+            self.assertIs(output, out)
+            modes, _, expected_weights = pu.ortho_modes(self.stack, nb_mode=2)
+            self.assertTrue(np.allclose(output, modes))
+            self.assertTrue(np.allclose(weights, expected_weights))
+            del output, out
+
+    def test_out_not_contiguous(self):
+        out = np.zeros((6, 5, 4, 5), dtype=complex).T
+        output, _, _ = pu.ortho_modes(self.stack, out=out)
+        self.assertIs(output, out)
+        modes, _, _ = pu.ortho_modes(self.stack)
+        self.assertTrue(np.allclose(out, modes))
+
+    def test_wrong_out_shape(self):
+        with self.assertRaises(ValueError):
+            pu.ortho_modes(self.stack, nb_mode=2, out=np.empty((3, 4, 5, 6)))
+
+    def test_wrong_method(self):
+        with self.assertRaises(ValueError):
+            pu.ortho_modes(self.stack, method="qr")
+
+
+class TestSortReconstruction(unittest.TestCase):
+    """
+    Tests related to sort_reconstruction.
+
+    def sort_reconstruction(
+        file_path, data_range, amplitude_threshold, sort_method="variance/mean",
+        nb_workers=1, use_cache=True,
+    )
+    """
+
+    def setUp(self):
+        # executed before each test, save three objects of increasing volume
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.files = []
+        for idx, (half_width, value) in enumerate(((2, 1), (4, 2), (3, 4))):
+            obj = np.zeros((12, 14, 10), dtype=complex)
+            obj[
+                6 - half_width : 6 + half_width,
+                7 - half_width : 7 + half_width,
+                5 - half_width : 5 + half_width,
+            ] = value
+            obj[6, 7, 5] = 2 * value
+            filename = os.path.join(self.tmpdir.name, f"rec_{idx}.npz")
+            np.savez(filename, obj=obj)
+            self.files.append(filename)
+        pu._reconstruction_metrics_cache.clear()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        pu._reconstruction_metrics_cache.clear()
+
+    def test_metrics(self):
+        obj = np.load(self.files[1])["obj"]
+        amp = abs(obj) / abs(obj).max()
+        amp = amp[amp > 0.3]
+        metrics = pu.reconstruction_metrics(
+            self.files[1], data_range=(6, 7, 5), amplitude_threshold=0.3
+        )
+        self.assertTrue(
+            np.allclose(
+                metrics,
+                [1 / amp.mean(), amp.var(), amp.var() / amp.mean(), 1 / amp.size],
+            )
+        )
+
+    def test_metrics_cropped(self):
+        # only the central region defined by data_range is considered
+        metrics = pu.reconstruction_metrics(
+            self.files[1], data_range=(1, 1, 1), amplitude_threshold=0.3
+        )
+        self.assertEqual(metrics[3], 1 / 8)
+
+    def test_volume(self):
+        order = pu.sort_reconstruction(
+            self.files,
+            data_range=(6, 7, 5),
+            amplitude_threshold=0.3,
+            sort_method="volume",
+        )
+        self.assertEqual(list(order), [1, 2, 0])
+
+    def test_mean_amplitude(self):
+        order = pu.sort_reconstruction(
+            self.files,
+            data_range=(6, 7, 5),
+            amplitude_threshold=0.3,
+            sort_method="mean_amplitude",
+        )
+        self.assertEqual(list(order), [0, 2, 1])
+
+    def test_duplicated_files(self):
+        order = pu.sort_reconstruction(
+            self.files + self.files[:1],
+            data_range=(6, 7, 5),
+            amplitude_threshold=0.3,
+            sort_method="volume",
+        )
+        self.assertEqual(list(order), [1, 2, 0, 3])
+
+    def test_cache(self):
+        pu.sort_reconstruction(
+            self.files, data_range=(6, 7, 5), amplitude_threshold=0.3
+        )
+        self.assertEqual(len(pu._reconstruction_metrics_cache), 3)
+        # replace the largest object by a single voxel, keeping the timestamp
+        stat = os.stat(self.files[1])
+        obj = np.zeros((12, 14, 10))
+        obj[6, 7, 5] = 1
+        np.savez(self.files[1], obj=obj)
+        os.utime(self.files[1], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        order = pu.sort_reconstruction(
+            self.files,
+            data_range=(6, 7, 5),
+            amplitude_threshold=0.3,
+            sort_method="volume",
+        )
+        self.assertEqual(list(order), [1, 2, 0])
+        # the modification time is part of the key, the file is loaded again
+        os.utime(self.files[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        order = pu.sort_reconstruction(
+            self.files,
+            data_range=(6, 7, 5),
+            amplitude_threshold=0.3,
+            sort_method="volume",
+        )
+        self.assertEqual(len(pu._reconstruction_metrics_cache), 4)
+        self.assertEqual(list(order), [2, 0, 1])
+
+    def test_no_cache(self):
+        pu.sort_reconstruction(
+            self.files,
+            data_range=(6, 7, 5),
+            amplitude_threshold=0.3,
+            use_cache=False,
+        )
+        self.assertEqual(len(pu._reconstruction_metrics_cache), 0)
+
+    def test_several_workers(self):
+        for sort_method in ("variance/mean", "mean_amplitude", "variance", "volume"):
+            serial = pu.sort_reconstruction(
+                self.files,
+                data_range=(6, 7, 5),
+                amplitude_threshold=0.3,
+                sort_method=sort_method,
+                use_cache=False,
+            )
+            parallel = pu.sort_reconstruction(
+                self.files,
+                data_range=(6, 7, 5),
+                amplitude_threshold=0.3,
+                sort_method=sort_method,
+                nb_workers=2,
+                use_cache=False,
+            )
+            self.assertTrue(np.array_equal(serial, parallel))
+
+    def test_wrong_nb_workers(self):
+        with self.assertRaises(ValueError):
+            pu.sort_reconstruction(
+                self.files,
+                data_range=(6, 7, 5),
+                amplitude_threshold=0.3,
+                nb_workers=0,
+            )
+
+
 if __name__ == "__main__":
     run_tests(Test)
+    run_tests(TestOrthoModes)
+    run_tests(TestSortReconstruction)
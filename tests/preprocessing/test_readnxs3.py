@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+import numpy as np
+import os
+import tables
+import tempfile
+import unittest
+from bcdi.preprocessing.ReadNxs3 import DataSet
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    return runner.run(suite)
+
+
+class TestDataSetLazy(unittest.TestCase):
+    """Tests related to the lazy mode of ReadNxs3.DataSet."""
+
+    def setUp(self):
+        # executed before each test, write a small FLY scan
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = "fly_scan.nxs"
+        self.mu = np.linspace(10, 11, num=4)
+        self.stack = np.arange(4 * 512 * 3, dtype=np.uint32).reshape((4, 512, 3))
+        with tables.open_file(
+            os.path.join(self.tmpdir.name, self.filename), mode="w"
+        ) as h5file:
+            entry = h5file.create_group("/", "scan_00001")
+            scan_data = h5file.create_group(entry, "scan_data")
+            h5file.create_array(scan_data, "mu", self.mu)
+            h5file.create_array(scan_data, "imon0", np.ones(4))
+            h5file.create_array(scan_data, "mpx_image", self.stack)
+            sixs = h5file.create_group(entry, "SIXS")
+            mono = h5file.create_group(sixs, "Monochromator")
+            h5file.create_array(mono, "energy", np.array([8.5]))
+            h5file.create_array(mono, "wavelength", np.array([1.46]))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_as_eager(self):
+        eager = DataSet(self.filename, directory=self.tmpdir.name)
+        with DataSet(self.filename, directory=self.tmpdir.name, lazy=True) as lazy:
+            self.assertEqual(lazy.attlist, eager.attlist)
+            self.assertEqual(lazy.det2d(), eager.det2d())
+            self.assertTrue(np.array_equal(lazy.mu, eager.mu))
+            self.assertTrue(np.array_equal(lazy.mpx_image[:], eager.mpx_image))
+
+    def test_counters_read_on_access(self):
+        with DataSet(self.filename, directory=self.tmpdir.name, lazy=True) as dataset:
+            self.assertNotIn("mu", dataset.__dict__)
+            self.assertTrue(np.array_equal(dataset.mu, self.mu))
+            self.assertIn("mu", dataset.__dict__)
+            self.assertNotIn("imon0", dataset.__dict__)
+
+    def test_stack_not_read(self):
+        with DataSet(self.filename, directory=self.tmpdir.name, lazy=True) as dataset:
+            stack = dataset.mpx_image
+            self.assertNotIsInstance(stack, np.ndarray)
+            self.assertEqual(stack.shape, self.stack.shape)
+            self.assertTrue(np.array_equal(stack[2, 10:20, :], self.stack[2, 10:20]))
+            # detector alias generated from the size of the frames
+            self.assertIs(dataset.maxipix, stack)
+
+    def test_missing_attribute(self):
+        with DataSet(self.filename, directory=self.tmpdir.name, lazy=True) as dataset:
+            with self.assertRaises(AttributeError):
+                _ = dataset.merlin
+
+    def test_close(self):
+        dataset = DataSet(self.filename, directory=self.tmpdir.name, lazy=True)
+        _ = dataset.mu
+        dataset.close()
+        self.assertIsNone(dataset._file)
+        # counters not accessed before closing are read by close()
+        self.assertIn("imon0", dataset.__dict__)
+        self.assertTrue(np.array_equal(dataset.mu, self.mu))
+        self.assertTrue(np.array_equal(dataset.imon0, np.ones(4)))
+        self.assertEqual(dataset.det2d(), ["mpx_image", "maxipix"])
+        self.assertIsNone(dataset._file)
+        with self.assertRaises(AttributeError):
+            _ = dataset.merlin
+
+    def test_stack_after_close(self):
+        dataset = DataSet(self.filename, directory=self.tmpdir.name, lazy=True)
+        dataset.close()
+        # the file is reopened to access the stack
+        self.assertTrue(np.array_equal(dataset.maxipix[1, :5], self.stack[1, :5]))
+        self.assertIsNotNone(dataset._file)
+        dataset.close()
+        self.assertIsNone(dataset._file)
+
+
+if __name__ == "__main__":
+    run_tests(TestDataSetLazy)
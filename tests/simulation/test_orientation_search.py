@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+import numpy as np
+import unittest
+from bcdi.simulation.orientation_search import OrientationSearch
+import bcdi.postprocessing.postprocessing_utils as pu
+import bcdi.simulation.simulation_utils as simu
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    return runner.run(suite)
+
+
+LATTICES = {
+    "bcc": simu.bcc_lattice,
+    "bct": simu.bct_lattice,
+    "cubic": simu.cubic_lattice,
+    "fcc": simu.fcc_lattice,
+}
+
+
+class TestOrientationSearch(unittest.TestCase):
+    """
+    Tests related to OrientationSearch.
+
+    class OrientationSearch(q_values, pivot, unitcell, peak_shape, voxels,
+     weights=None)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.shape = (30, 28, 32)
+        self.pivot = (10, 16, 20)
+        step = 0.06
+        self.q_values = tuple(
+            (np.arange(nb) - piv) * step for nb, piv in zip(self.shape, self.pivot)
+        )
+        self.peak_shape = pu.blackman_window(shape=(5, 5, 5), normalization=100)
+        self.euler_angles = (10, -5, 20)
+
+    def simulate(self, unitcell, unitcell_param, euler_angles):
+        _, lattice_pos, _ = LATTICES[unitcell](
+            q_values=self.q_values,
+            unitcell_param=unitcell_param,
+            pivot=self.pivot,
+            euler_angles=euler_angles,
+        )
+        return simu.assign_peakshape(
+            array_shape=self.shape,
+            lattice_list=lattice_pos,
+            peak_shape=self.peak_shape,
+            pivot=self.pivot,
+        )
+
+    def create_engine(self, unitcell, unitcell_param):
+        data = self.simulate(unitcell, unitcell_param, self.euler_angles)
+        voxels = np.nonzero(data)
+        engine = OrientationSearch(
+            q_values=self.q_values,
+            pivot=self.pivot,
+            unitcell=unitcell,
+            peak_shape=self.peak_shape,
+            voxels=voxels,
+            weights=data[voxels],
+        )
+        return engine, voxels, data[voxels]
+
+    def test_same_as_assign_peakshape(self):
+        angles = np.random.default_rng(0).uniform(-40, 40, size=(8, 3))
+        for unitcell, unitcell_param in (
+            ("bcc", 15.0),
+            ("bct", (12.0, 14.0)),
+            ("cubic", 13.0),
+            ("fcc", 17.0),
+        ):
+            engine, voxels, weights = self.create_engine(unitcell, unitcell_param)
+            expected = [
+                np.dot(
+                    weights,
+                    self.simulate(unitcell, unitcell_param, tuple(angle))[voxels],
+                )
+                for angle in angles
+            ]
+            self.assertTrue(
+                np.allclose(engine.scores(unitcell_param, angles), expected)
+            )
+
+    def test_sparse_voxels(self):
+        # fewer experimental voxels than voxels in the peak shape
+        data = self.simulate("fcc", 17.0, self.euler_angles)
+        voxels = tuple(indices[::20] for indices in np.nonzero(data))
+        engine = OrientationSearch(
+            q_values=self.q_values,
+            pivot=self.pivot,
+            unitcell="fcc",
+            peak_shape=self.peak_shape,
+            voxels=voxels,
+        )
+        angles = np.random.default_rng(1).uniform(-40, 40, size=(8, 3))
+        expected = [
+            self.simulate("fcc", 17.0, tuple(angle))[voxels].sum() for angle in angles
+        ]
+        self.assertTrue(np.allclose(engine.scores(17.0, angles), expected))
+
+    def test_maximum_at_true_orientation(self):
+        engine, _, weights = self.create_engine("fcc", 17.0)
+        scores = engine.scores(17.0, [(0, 0, 0), self.euler_angles])
+        self.assertAlmostEqual(scores[1], np.dot(weights, weights))
+        self.assertLess(scores[0], scores[1])
+
+    def test_search_shape(self):
+        engine, _, _ = self.create_engine("bct", (12.0, 14.0))
+        corr = engine.search(
+            angles=([0, 10], [-5], [0, 10, 20]),
+            unitcell_params=[(12.0, 14.0), (12.0, 14.5)],
+        )
+        self.assertEqual(corr.shape, (2, 1, 3, 2))
+        self.assertAlmostEqual(
+            corr[1, 0, 2, 0], engine.scores((12.0, 14.0), [self.euler_angles])[0]
+        )
+
+    def test_search_parallel(self):
+        engine, _, _ = self.create_engine("fcc", 17.0)
+        angles = ([0, 10], [-10, -5, 0], [10, 20])
+        serial = engine.search(angles=angles, unitcell_params=[16.5, 17.0])
+        parallel = engine.search(
+            angles=angles, unitcell_params=[16.5, 17.0], nb_workers=2
+        )
+        self.assertTrue(np.array_equal(serial, parallel))
+
+    def test_refine(self):
+        engine, _, weights = self.create_engine("fcc", 17.0)
+        start = engine.scores(16.8, [(6, -2, 24)])[0]
+        angles, unitcell_param, score = engine.refine(
+            euler_angles=(6, -2, 24),
+            unitcell_param=16.8,
+            angular_step=8,
+            unitcell_step=0.4,
+            nb_levels=3,
+            zoom=2,
+        )
+        self.assertGreaterEqual(score, start)
+        self.assertAlmostEqual(score, np.dot(weights, weights))
+        self.assertAlmostEqual(engine.scores(unitcell_param, [angles])[0], score)
+
+    def test_empty_voxels(self):
+        engine = OrientationSearch(
+            q_values=self.q_values,
+            pivot=self.pivot,
+            unitcell="cubic",
+            peak_shape=self.peak_shape,
+            voxels=(np.array([], dtype=int),) * 3,
+        )
+        self.assertTrue(np.array_equal(engine.scores(13.0, [(0, 0, 0)]), [0]))
+
+    def test_wrong_unitcell(self):
+        with self.assertRaises(ValueError):
+            OrientationSearch(
+                self.q_values, self.pivot, "hcp", self.peak_shape, ([1], [1], [1])
+            )
+
+    def test_wrong_peak_shape(self):
+        with self.assertRaises(ValueError):
+            OrientationSearch(
+                self.q_values,
+                self.pivot,
+                "fcc",
+                np.ones((4, 4, 4)),
+                ([1], [1], [1]),
+            )
+
+    def test_wrong_unitcell_param(self):
+        engine, _, _ = self.create_engine("bct", (12.0, 14.0))
+        with self.assertRaises(TypeError):
+            engine.scores(12.0, [(0, 0, 0)])
+
+
+if __name__ == "__main__":
+    run_tests(TestOrientationSearch)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+import numpy as np
+import os
+import tempfile
+import unittest
+from bcdi.utils.correlation_monitor import CorrelationMonitor
+import bcdi.utils.utilities as util
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    return runner.run(suite)
+
+
+class TestCorrelationMonitor(unittest.TestCase):
+    """
+    Tests related to CorrelationMonitor.
+
+    class CorrelationMonitor(template_file, start_index=0, read_frame=read_fabio,
+     roi=None, binning=(1, 1), nb_workers=1, capacity=256)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.template = os.path.join(self.tmpdir.name, "frame_%05d.npy")
+        self.frames = np.random.default_rng(0).random((7, 12, 10))
+        self.start_index = 3
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, start, stop):
+        for idx in range(start, stop):
+            np.save(self.template % (self.start_index + idx), self.frames[idx])
+
+    @staticmethod
+    def expected_correlation(frames):
+        flat = frames.reshape((len(frames), -1))
+        norms = np.sqrt((flat ** 2).sum(axis=1))
+        return flat @ flat.T / np.outer(norms, norms)
+
+    def create_monitor(self, **kwargs):
+        return CorrelationMonitor(
+            template_file=self.template,
+            start_index=self.start_index,
+            read_frame=np.load,
+            **kwargs,
+        )
+
+    def test_no_frame(self):
+        monitor = self.create_monitor()
+        self.assertEqual(monitor.update(), 0)
+        self.assertEqual(monitor.correlation.shape, (0, 0))
+
+    def test_incremental(self):
+        monitor = self.create_monitor(capacity=2)
+        self.write(0, 3)
+        self.assertEqual(monitor.update(), 3)
+        self.write(3, 7)
+        self.assertEqual(monitor.update(), 4)
+        self.assertEqual(monitor.update(), 0)
+        self.assertEqual(monitor.nb_frames, 7)
+        self.assertTrue(
+            np.allclose(monitor.correlation, self.expected_correlation(self.frames))
+        )
+        self.assertTrue(
+            np.allclose(monitor.norms, np.sqrt((self.frames ** 2).sum(axis=(1, 2))))
+        )
+
+    def test_max_frames(self):
+        monitor = self.create_monitor()
+        self.write(0, 7)
+        self.assertEqual(monitor.update(max_frames=5), 5)
+        self.assertEqual(monitor.update(max_frames=5), 2)
+        self.assertTrue(
+            np.allclose(monitor.correlation, self.expected_correlation(self.frames))
+        )
+
+    def test_roi_binning(self):
+        monitor = self.create_monitor(roi=[2, 10, 0, 9], binning=(2, 3))
+        self.write(0, 7)
+        monitor.update()
+        binned = np.stack(
+            [util.bin_data(frame[2:10, 0:9], (2, 3)) for frame in self.frames]
+        )
+        self.assertTrue(
+            np.allclose(monitor.correlation, self.expected_correlation(binned))
+        )
+
+    def test_workers(self):
+        self.write(0, 7)
+        serial = self.create_monitor()
+        serial.update()
+        parallel = self.create_monitor(nb_workers=3)
+        parallel.update()
+        self.assertTrue(np.array_equal(serial.correlation, parallel.correlation))
+
+    def test_wrong_shape(self):
+        monitor = self.create_monitor()
+        self.write(0, 2)
+        monitor.update()
+        np.save(self.template % (self.start_index + 2), np.ones((5, 5)))
+        with self.assertRaises(ValueError):
+            monitor.update()
+
+    def test_wrong_binning(self):
+        with self.assertRaises(ValueError):
+            self.create_monitor(binning=(0, 1))
+
+
+if __name__ == "__main__":
+    run_tests(TestCorrelationMonitor)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+import numpy as np
+import unittest
+import bcdi.utils.image_registration as reg
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    return runner.run(suite)
+
+
+def gaussian(shape, center, width=2):
+    """Create a real gaussian array."""
+    grid = np.meshgrid(*(np.arange(nb) for nb in shape), indexing="ij")
+    return np.exp(
+        -sum((axis - pos) ** 2 for axis, pos in zip(grid, center)) / (2 * width ** 2)
+    )
+
+
+class TestRegistrationEngine(unittest.TestCase):
+    """Tests related to the RegistrationEngine class."""
+
+    def setUp(self):
+        # executed before each test
+        self.shape = (24, 26, 22)
+        self.reference = gaussian(self.shape, center=(12, 13, 11))
+        self.shifts = ((1.5, -2.25, 0.5), (-3, 2, 1.75), (0.25, 0, -1))
+        self.arrays = [
+            gaussian(self.shape, center=(12 - z, 13 - y, 11 - x))
+            for z, y, x in self.shifts
+        ]
+
+    def test_get_shift(self):
+        engine = reg.RegistrationEngine(self.reference, precision=100)
+        self.assertTrue(
+            np.allclose(engine.get_shift(self.arrays[0]), self.shifts[0], atol=0.02)
+        )
+
+    def test_get_shifts(self):
+        engine = reg.RegistrationEngine(self.reference, precision=100, batch_size=2)
+        shifts = engine.get_shifts(array for array in self.arrays)
+        self.assertEqual(shifts.shape, (3, 3))
+        self.assertTrue(np.allclose(shifts, self.shifts, atol=0.02))
+
+    def test_same_as_dft_registration(self):
+        # each array is registered with the shifts of dft_registration
+        for precision in (1, 2, 10, 1000):
+            engine = reg.RegistrationEngine(self.reference, precision=precision)
+            batch_shifts = engine.get_shifts(self.arrays)
+            for array, shifts in zip(self.arrays, batch_shifts):
+                expected = []
+                for axis in range(3):
+                    _, _, row_shift, col_shift = reg.dft_registration(
+                        np.fft.fftn(np.fft.fftshift(self.reference.sum(axis=axis))),
+                        np.fft.fftn(np.fft.fftshift(array.sum(axis=axis))),
+                        ups_factor=precision,
+                    )
+                    expected.append((row_shift, col_shift))
+                self.assertTrue(
+                    np.allclose(
+                        shifts,
+                        (
+                            (expected[2][0] + expected[1][0]) / 2,
+                            (expected[2][1] + expected[0][0]) / 2,
+                            (expected[1][1] + expected[0][1]) / 2,
+                        ),
+                    )
+                )
+
+    def test_2d(self):
+        reference = self.reference[:, :, 11]
+        engine = reg.RegistrationEngine(reference, precision=100)
+        shifts = engine.get_shifts([array[:, :, 11] for array in self.arrays])
+        self.assertEqual(shifts.shape, (3, 2))
+        _, _, row_shift, col_shift = reg.dft_registration(
+            np.fft.fftn(reference), np.fft.fftn(self.arrays[1][:, :, 11]), 100
+        )
+        self.assertTrue(np.allclose(shifts[1], (row_shift, col_shift)))
+
+    def test_align(self):
+        engine = reg.RegistrationEngine(self.reference, precision=100)
+        aligned, shifts = engine.align(self.arrays[1])
+        self.assertTrue(np.allclose(shifts, self.shifts[1], atol=0.02))
+        self.assertTrue(np.allclose(aligned, self.reference, atol=1e-2))
+
+    def test_empty(self):
+        engine = reg.RegistrationEngine(self.reference)
+        self.assertEqual(engine.get_shifts([]).shape, (0, 3))
+
+    def test_wrong_shape(self):
+        engine = reg.RegistrationEngine(self.reference)
+        with self.assertRaises(ValueError):
+            engine.get_shift(self.reference[1:])
+
+    def test_wrong_precision(self):
+        with self.assertRaises(ValueError):
+            reg.RegistrationEngine(self.reference, precision=0)
+
+    def test_wrong_ndim(self):
+        with self.assertRaises(ValueError):
+            reg.RegistrationEngine(np.ones(5))
+
+
+class TestSubpixelShift(unittest.TestCase):
+    """
+    Tests related to subpixel_shift.
+
+    def subpixel_shift(array, z_shift, y_shift, x_shift=0)
+    """
+
+    def test_integer_shift(self):
+        array = np.random.default_rng(0).random((8, 9, 10))
+        shifted = reg.subpixel_shift(array, 2, -3, 1)
+        self.assertTrue(
+            np.allclose(shifted, np.roll(array, (2, -3, 1), axis=(0, 1, 2)))
+        )
+
+    def test_subpixel_shift(self):
+        shape = (24, 26, 22)
+        shifted = reg.subpixel_shift(gaussian(shape, (12, 13, 11)), 1.5, -0.5, 0.25)
+        self.assertTrue(
+            np.allclose(shifted, gaussian(shape, (13.5, 12.5, 11.25)), atol=1e-6)
+        )
+
+    def test_2d(self):
+        array = np.random.default_rng(0).random((8, 9))
+        shifted = reg.subpixel_shift(array, -1, 4)
+        self.assertTrue(np.allclose(shifted, np.roll(array, (-1, 4), axis=(0, 1))))
+
+    def test_no_shift(self):
+        array = np.random.default_rng(0).random((8, 9, 10))
+        self.assertTrue(np.allclose(reg.subpixel_shift(array, 0, 0, 0), array))
+
+
+if __name__ == "__main__":
+    run_tests(TestRegistrationEngine)
+    run_tests(TestSubpixelShift)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+import numpy as np
+import os
+from scipy.interpolate import RegularGridInterpolator
+import tempfile
+import unittest
+from bcdi.utils.interpolation_plan import InterpolationPlan
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    return runner.run(suite)
+
+
+class TestInterpolationPlan(unittest.TestCase):
+    """Tests related to the InterpolationPlan class."""
+
+    def setUp(self):
+        # executed before each test
+        rng = np.random.default_rng(0)
+        self.shape = (12, 15, 10)
+        self.array = rng.random(self.shape) + 1j * rng.random(self.shape)
+        self.axes = (
+            np.arange(-8, 8) * 0.9,
+            np.arange(-9, 10) * 1.1,
+            np.arange(-7, 7) * 0.8,
+        )
+        self.matrix = np.array([[1.1, 0.2, -0.1], [0.05, 0.9, 0.3], [-0.2, 0.1, 1.2]])
+        self.plan = InterpolationPlan(
+            input_shape=self.shape, output_axes=self.axes, matrix=self.matrix
+        )
+
+    def reference(self, array, fill_value):
+        grid_z, grid_y, grid_x = np.meshgrid(*self.axes, indexing="ij")
+        points = np.stack(
+            [
+                self.matrix[axis, 0] * grid_z
+                + self.matrix[axis, 1] * grid_y
+                + self.matrix[axis, 2] * grid_x
+                for axis in range(3)
+            ],
+            axis=-1,
+        )
+        rgi = RegularGridInterpolator(
+            tuple(
+                np.arange(-nb_points // 2, nb_points // 2) for nb_points in self.shape
+            ),
+            array,
+            method="linear",
+            bounds_error=False,
+            fill_value=fill_value,
+        )
+        return rgi(points.reshape((-1, 3))).reshape(grid_z.shape)
+
+    def test_output_shape(self):
+        self.assertEqual(self.plan.output_shape, (16, 19, 14))
+
+    def test_same_as_rgi(self):
+        output = self.plan.apply(self.array, fill_value=0)
+        self.assertTrue(np.allclose(output, self.reference(self.array, 0)))
+
+    def test_fill_value(self):
+        output = self.plan.apply(self.array.real, fill_value=-1)
+        self.assertTrue(np.allclose(output, self.reference(self.array.real, -1)))
+        self.assertTrue((output == -1).any())
+
+    def test_output_type(self):
+        output = self.plan.apply(np.ones(self.shape, dtype=int))
+        self.assertEqual(output.dtype, float)
+
+    def test_identity(self):
+        plan = InterpolationPlan(
+            input_shape=self.shape,
+            output_axes=tuple(
+                np.arange(-nb_points // 2, nb_points // 2) for nb_points in self.shape
+            ),
+            matrix=np.identity(3),
+        )
+        self.assertTrue(np.allclose(plan.apply(self.array), self.array))
+
+    def test_wrong_array_shape(self):
+        with self.assertRaises(ValueError):
+            self.plan.apply(np.ones((12, 15, 11)))
+
+    def test_wrong_matrix_shape(self):
+        with self.assertRaises(ValueError):
+            InterpolationPlan(
+                input_shape=self.shape, output_axes=self.axes, matrix=np.ones((2, 3))
+            )
+
+    def test_is_compatible(self):
+        self.assertTrue(self.plan.is_compatible(self.shape, self.axes, self.matrix))
+        self.assertFalse(
+            self.plan.is_compatible(self.shape, self.axes, 2 * self.matrix)
+        )
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "plan.npz")
+            self.plan.save(filename)
+            plan = InterpolationPlan.load(filename)
+        self.assertTrue(plan.is_compatible(self.shape, self.axes, self.matrix))
+        self.assertTrue(
+            np.array_equal(plan.apply(self.array), self.plan.apply(self.array))
+        )
+
+    def test_load_not_precomputed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "plan.npz")
+            self.plan.save(filename)
+            plan = InterpolationPlan.load(filename, memory_budget=1, precompute=False)
+        self.assertFalse(plan.is_precomputed)
+        self.assertTrue(
+            np.allclose(plan.apply(self.array), self.plan.apply(self.array))
+        )
+
+    def test_discard_precomputed(self):
+        expected = self.plan.apply(self.array)
+        self.plan.discard_precomputed()
+        self.assertFalse(self.plan.is_precomputed)
+        self.assertTrue(np.allclose(self.plan.apply(self.array), expected))
+
+    def test_not_precomputed(self):
+        plan = InterpolationPlan(
+            input_shape=self.shape,
+            output_axes=self.axes,
+            matrix=self.matrix,
+            precompute=False,
+            memory_budget=1,
+        )
+        self.assertFalse(plan.is_precomputed)
+        self.assertEqual(plan.nb_planes, 1)
+        self.assertTrue(
+            np.allclose(plan.apply(self.array), self.plan.apply(self.array))
+        )
+
+    def test_precomputed_by_slabs(self):
+        # the precomputed indices and weights are calculated plane by plane
+        plan = InterpolationPlan(
+            input_shape=self.shape,
+            output_axes=self.axes,
+            matrix=self.matrix,
+            memory_budget=1,
+        )
+        self.assertTrue(plan.is_precomputed)
+        self.assertEqual(plan.nb_planes, 1)
+        self.assertTrue(np.array_equal(plan._indices, self.plan._indices))
+        self.assertTrue(np.array_equal(plan._fractions, self.plan._fractions))
+        self.assertTrue(np.array_equal(plan._inside, self.plan._inside))
+
+    def test_memory_budget(self):
+        self.plan.memory_budget = 5 * 19 * 14 * InterpolationPlan.bytes_per_voxel
+        self.assertEqual(self.plan.nb_planes, 5)
+        self.assertTrue(
+            np.allclose(self.plan.apply(self.array), self.reference(self.array, 0))
+        )
+
+    def test_wrong_memory_budget(self):
+        with self.assertRaises(ValueError):
+            self.plan.memory_budget = 0
+
+    def test_out(self):
+        out = np.zeros(self.plan.output_shape, dtype=complex)
+        output = self.plan.apply(self.array, out=out)
+        self.assertIs(output, out)
+        self.assertTrue(np.allclose(out, self.reference(self.array, 0)))
+
+    def test_wrong_out_shape(self):
+        with self.assertRaises(ValueError):
+            self.plan.apply(self.array, out=np.zeros((16, 19, 13)))
+
+
+if __name__ == "__main__":
+    run_tests(TestInterpolationPlan)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# BCDI: tools for pre(post)-processing Bragg coherent X-ray diffraction imaging data
+#   (c) 07/2017-06/2019 : CNRS UMR 7344 IM2NP
+#   (c) 07/2019-05/2021 : DESY PHOTON SCIENCE
+#   (c) 06/2021-present : DESY CFEL
+#       authors:
+#         Jerome Carnis, carnis_jerome@yahoo.fr
+
+import numpy as np
+import unittest
+from bcdi.utils.scatter_gridder import ScatterGridder
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    return runner.run(suite)
+
+
+class TestScatterGridder(unittest.TestCase):
+    """Tests related to the ScatterGridder class."""
+
+    def setUp(self):
+        # executed before each test
+        self.axes = (
+            np.linspace(-1, 1, num=5),
+            np.linspace(0, 3, num=4),
+            np.linspace(-2, 2, num=9),
+        )
+        self.grid = np.meshgrid(*self.axes, indexing="ij")
+
+    def test_shape(self):
+        gridder = ScatterGridder(axes=self.axes)
+        self.assertEqual(gridder.shape, (5, 4, 9))
+
+    def test_points_on_nodes(self):
+        gridder = ScatterGridder(axes=self.axes, nb_arrays=2)
+        values = 2 * self.grid[0] + self.grid[2]
+        gridder.add(points=self.grid, values=(values, np.ones(values.shape)))
+        gridded, ones = gridder.result()
+        self.assertTrue(np.allclose(gridded, values))
+        self.assertTrue(np.allclose(ones, 1))
+        self.assertTrue(np.allclose(gridder.weights, 1))
+
+    def test_linear_weights(self):
+        # a point in the middle of a cell is spread equally onto its 8 corners
+        gridder = ScatterGridder(axes=self.axes, method="linear")
+        gridder.add(points=([0.25], [1.5], [0.25]), values=([3.0],))
+        self.assertTrue(np.isclose(gridder.weights.sum(), 1))
+        self.assertTrue(np.allclose(gridder.weights[2:4, 1:3, 4:6], 0.125))
+        gridded = gridder.result(fill_value=np.nan)[0]
+        self.assertTrue(np.allclose(gridded[2:4, 1:3, 4:6], 3))
+        self.assertEqual(np.isnan(gridded).sum(), gridded.size - 8)
+
+    def test_linear_function(self):
+        # linear functions are approximately preserved inside of the grid
+        rng = np.random.default_rng(0)
+        points = (
+            rng.uniform(-1, 1, 50000),
+            rng.uniform(0, 3, 50000),
+            rng.uniform(-2, 2, 50000),
+        )
+        gridder = ScatterGridder(axes=self.axes, method="linear")
+        gridder.add(points=points, values=(points[0] - 2 * points[1] + points[2],))
+        gridded = gridder.result()[0]
+        expected = self.grid[0] - 2 * self.grid[1] + self.grid[2]
+        self.assertTrue(
+            np.allclose(gridded[1:-1, 1:-1, 1:-1], expected[1:-1, 1:-1, 1:-1], atol=0.1)
+        )
+
+    def test_nearest(self):
+        gridder = ScatterGridder(axes=self.axes, method="nearest")
+        gridder.add(
+            points=([0.1, 0.4, 2], [1.1, 0.9, 1], [0.6, 0.4, 0]),
+            values=([1.0, 3.0, 5.0],),
+        )
+        gridded = gridder.result(fill_value=-1)[0]
+        self.assertEqual(gridder.weights[2, 1, 5], 1)
+        self.assertEqual(gridder.weights[3, 1, 5], 1)
+        self.assertEqual(gridded[2, 1, 5], 1)
+        self.assertEqual(gridded[3, 1, 5], 3)
+        # the third point is outside of the grid
+        self.assertEqual(gridder.weights.sum(), 2)
+        self.assertEqual((gridded == -1).sum(), gridded.size - 2)
+
+    def test_several_blocks(self):
+        values = self.grid[0] * self.grid[1]
+        gridder = ScatterGridder(axes=self.axes)
+        gridder.add(points=[axis[:2] for axis in self.grid], values=(values[:2],))
+        gridder.add(points=[axis[2:] for axis in self.grid], values=(values[2:],))
+        self.assertTrue(np.allclose(gridder.result()[0], values))
+
+    def test_fill_holes(self):
+        gridder = ScatterGridder(axes=self.axes, method="nearest")
+        gridder.add(points=([0], [1], [0]), values=([2.0],))
+        gridded = gridder.result(fill_value=np.nan)[0]
+        self.assertTrue(np.isnan(gridded[2, 1, 5]))
+        filled = gridder.result(fill_value=np.nan, fill_holes=True)[0]
+        self.assertEqual(filled[2, 1, 5], 2)
+        self.assertEqual(filled[2, 1, 4], 2)
+        self.assertTrue(np.isnan(filled[0, 0, 0]))
+
+    def test_not_uniform_axes(self):
+        with self.assertRaises(ValueError):
+            ScatterGridder(axes=(np.array([0, 1, 3]),) + self.axes[1:])
+
+    def test_wrong_method(self):
+        with self.assertRaises(ValueError):
+            ScatterGridder(axes=self.axes, method="cubic")
+
+    def test_wrong_nb_values(self):
+        gridder = ScatterGridder(axes=self.axes, nb_arrays=2)
+        with self.assertRaises(ValueError):
+            gridder.add(points=self.grid, values=(self.grid[0],))
+
+
+if __name__ == "__main__":
+    run_tests(TestScatterGridder)
@@ -8,6 +8,8 @@
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
 import numpy as np
+import os
+import tempfile
 import unittest
 import bcdi.utils.utilities as util
 
@@ -18,6 +20,150 @@ def run_tests(test_class):
     return runner.run(suite)
 
 
+class TestBoxSum(unittest.TestCase):
+    """
+    Tests on the function utilities.box_sum.
+
+    def box_sum(array, half_width)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.array = np.arange(60, dtype=float).reshape((3, 4, 5))
+
+    def test_half_width_zero(self):
+        self.assertTrue(np.array_equal(util.box_sum(self.array, 0), self.array))
+
+    def test_1d(self):
+        output = util.box_sum(np.arange(5), half_width=1)
+        self.assertTrue(np.array_equal(output, np.array([1, 3, 6, 9, 7])))
+
+    def test_3d_inner_voxel(self):
+        output = util.box_sum(self.array, half_width=1)
+        self.assertAlmostEqual(output[1, 1, 1], self.array[0:3, 0:3, 0:3].sum())
+
+    def test_3d_edge_voxel(self):
+        output = util.box_sum(self.array, half_width=2)
+        self.assertAlmostEqual(output[0, 3, 4], self.array[0:3, 1:4, 2:5].sum())
+
+    def test_anisotropic_width(self):
+        output = util.box_sum(self.array, half_width=(0, 1, 0))
+        self.assertAlmostEqual(output[2, 0, 3], self.array[2, 0:2, 3].sum())
+
+    def test_complex(self):
+        output = util.box_sum(self.array * 1j, half_width=1)
+        self.assertAlmostEqual(output[1, 1, 1], self.array[0:3, 0:3, 0:3].sum() * 1j)
+
+    def test_boolean(self):
+        output = util.box_sum(np.ones((3, 3), dtype=bool), half_width=1)
+        self.assertEqual(output[1, 1], 9)
+
+    def test_wrong_half_width(self):
+        with self.assertRaises(ValueError):
+            util.box_sum(self.array, half_width=-1)
+
+
+class TestFindNearest(unittest.TestCase):
+    """
+    Tests on the function utilities.find_nearest.
+
+    def find_nearest(reference_array, test_values, width=None)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.reference = np.linspace(-1, 1, num=21)
+        self.test_values = np.array([-1.5, -0.96, -0.04, 0.06, 0.31, 1.06])
+
+    def argmin_loop(self, reference, test_values):
+        return np.array(
+            [np.abs(reference - value).argmin() for value in test_values], dtype=int
+        )
+
+    def test_number(self):
+        self.assertEqual(util.find_nearest(self.reference, 0.31), 13)
+
+    def test_uniform(self):
+        self.assertTrue(
+            np.array_equal(
+                util.find_nearest(self.reference, self.test_values),
+                [0, 0, 10, 11, 13, 20],
+            )
+        )
+
+    def test_uniform_descending(self):
+        reference = self.reference[::-1]
+        self.assertTrue(
+            np.array_equal(
+                util.find_nearest(reference, self.test_values),
+                self.argmin_loop(reference, self.test_values),
+            )
+        )
+
+    def test_not_uniform(self):
+        reference = np.random.default_rng(0).random(30)
+        test_values = np.linspace(-0.2, 1.2, num=100)
+        self.assertTrue(
+            np.array_equal(
+                util.find_nearest(reference, test_values),
+                self.argmin_loop(reference, test_values),
+            )
+        )
+
+    def test_midpoints(self):
+        # equal distances, the smallest index is returned as in numpy.argmin
+        test_values = (self.reference[1:] + self.reference[:-1]) / 2
+        self.assertTrue(
+            np.array_equal(
+                util.find_nearest(self.reference, test_values),
+                self.argmin_loop(self.reference, test_values),
+            )
+        )
+
+    def test_repeated_values(self):
+        reference = np.array([3, 1, 2, 1, 3, 2], dtype=float)
+        self.assertTrue(
+            np.array_equal(util.find_nearest(reference, [0.9, 2.6, 4]), [1, 0, 0])
+        )
+
+    def test_width(self):
+        self.assertTrue(
+            np.array_equal(
+                util.find_nearest(self.reference, self.test_values, width=0.1),
+                [-1, 0, 10, 11, 13, -1],
+            )
+        )
+
+    def test_nan_test_value(self):
+        # NaN distances, the first index is returned as in numpy.argmin
+        reference = np.random.default_rng(0).random(30)
+        for ref in (self.reference, reference):
+            test_values = np.array([0.31, np.nan, -0.5])
+            self.assertTrue(
+                np.array_equal(
+                    util.find_nearest(ref, test_values),
+                    self.argmin_loop(ref, test_values),
+                )
+            )
+
+    def test_nan_reference(self):
+        reference = np.array([0.5, 0.1, np.nan, 0.8, np.nan])
+        test_values = np.array([0.12, np.nan, 0.9])
+        self.assertTrue(
+            np.array_equal(
+                util.find_nearest(reference, test_values),
+                self.argmin_loop(reference, test_values),
+            )
+        )
+
+    def test_empty(self):
+        self.assertEqual(util.find_nearest(self.reference, []).size, 0)
+
+    def test_2d_test_values(self):
+        with self.assertRaises(ValueError):
+            util.find_nearest(self.reference, np.ones((2, 2)))
+
+
 class TestInRange(unittest.TestCase):
     """Tests on the function utilities.in_range."""
 
@@ -99,5 +245,240 @@ class TestIsFloat(unittest.TestCase):
             util.is_float(np.ones(3))
 
 
+class TestLoadFile(unittest.TestCase):
+    """
+    Tests on the function utilities.load_file.
+
+    def load_file(file_path, fieldname=None, crop_shape=None)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.array = np.arange(7 * 8 * 9).reshape((7, 8, 9))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_npy(self):
+        filename = os.path.join(self.tmpdir.name, "array.npy")
+        np.save(filename, self.array)
+        array, extension = util.load_file(filename)
+        self.assertEqual(extension, ".npy")
+        self.assertTrue(np.array_equal(array, self.array))
+
+    def test_crop_npy(self):
+        filename = os.path.join(self.tmpdir.name, "array.npy")
+        np.save(filename, self.array)
+        array, _ = util.load_file(filename, crop_shape=(3, 4, 9))
+        self.assertIsInstance(array, np.ndarray)
+        self.assertTrue(
+            np.array_equal(array, util.crop_pad(self.array, output_shape=(3, 4, 9)))
+        )
+
+    def test_crop_npz(self):
+        filename = os.path.join(self.tmpdir.name, "array.npz")
+        np.savez(filename, obj=self.array)
+        array, _ = util.load_file(filename, crop_shape=(4, 5, 6))
+        self.assertTrue(
+            np.array_equal(array, util.crop_pad(self.array, output_shape=(4, 5, 6)))
+        )
+
+    def test_crop_larger_shape(self):
+        # the array is not padded
+        filename = os.path.join(self.tmpdir.name, "array.npy")
+        np.save(filename, self.array)
+        array, _ = util.load_file(filename, crop_shape=(10, 4, 12))
+        self.assertTrue(np.array_equal(array, self.array[:, 2:6, :]))
+
+
+class TestRadialProfile(unittest.TestCase):
+    """
+    Tests on the function utilities.radial_profile.
+
+    def radial_profile(array, distances, nb_bins, mask=None, max_distance=None)
+    """
+
+    def setUp(self):
+        # executed before each test
+        rng = np.random.default_rng(0)
+        self.array = rng.random((20, 24, 22))
+        self.array[rng.random(self.array.shape) < 0.1] = np.nan
+        self.axes = (
+            np.arange(20) * 0.1 - 1.0,
+            np.arange(24) * 0.15 - 1.5,
+            np.arange(22) * 0.08 - 0.8,
+        )
+        self.distances = np.sqrt(
+            self.axes[0][:, np.newaxis, np.newaxis] ** 2
+            + self.axes[1][np.newaxis, :, np.newaxis] ** 2
+            + self.axes[2][np.newaxis, np.newaxis, :] ** 2
+        )
+
+    def expected(self, nb_bins, mask=None):
+        edges = np.linspace(0, self.distances.max(), num=nb_bins + 1)
+        result = np.full((4, nb_bins), np.nan)
+        for index in range(nb_bins):
+            in_shell = (self.distances >= edges[index]) & (
+                self.distances < edges[index + 1]
+            )
+            if mask is not None:
+                in_shell &= mask == 0
+            values = self.array[in_shell]
+            values = values[~np.isnan(values)]
+            result[3, index] = len(values)
+            if len(values) > 0:
+                result[:3, index] = values.mean(), np.median(values), values.std()
+        return edges, result
+
+    def test_statistics(self):
+        edges, mean, median, std, counts = util.radial_profile(
+            self.array, self.distances, nb_bins=15
+        )
+        expected_edges, expected = self.expected(nb_bins=15)
+        self.assertTrue(np.allclose(edges, expected_edges))
+        self.assertTrue(np.allclose(mean, expected[0]))
+        self.assertTrue(np.allclose(median, expected[1]))
+        self.assertTrue(np.allclose(std, expected[2]))
+        self.assertTrue(np.array_equal(counts, expected[3]))
+
+    def test_axes(self):
+        # 1D coordinates with different steps along each axis
+        result = util.radial_profile(self.array, self.axes, nb_bins=15)
+        expected = util.radial_profile(self.array, self.distances, nb_bins=15)
+        for val1, val2 in zip(result, expected):
+            self.assertTrue(np.allclose(val1, val2, equal_nan=True))
+
+    def test_mask(self):
+        mask = np.zeros(self.array.shape)
+        mask[:, :10, :] = 1
+        _, mean, _, _, counts = util.radial_profile(
+            self.array, self.distances, nb_bins=15, mask=mask
+        )
+        _, expected = self.expected(nb_bins=15, mask=mask)
+        self.assertTrue(np.allclose(mean, expected[0], equal_nan=True))
+        self.assertTrue(np.array_equal(counts, expected[3]))
+
+    def test_empty_shells(self):
+        _, mean, median, std, counts = util.radial_profile(
+            self.array, self.distances, nb_bins=15, max_distance=10
+        )
+        self.assertEqual(counts[-1], 0)
+        self.assertTrue(np.isnan(mean[-1]) and np.isnan(median[-1]))
+        self.assertTrue(np.isnan(std[-1]))
+        self.assertEqual(counts.sum(), np.count_nonzero(~np.isnan(self.array)))
+
+    def test_2d(self):
+        _, mean, _, _, counts = util.radial_profile(
+            self.array[0], self.distances[0], nb_bins=5
+        )
+        self.assertEqual(mean.shape, (5,))
+        # the voxel at the largest distance does not belong to any shell
+        self.assertEqual(counts.sum(), np.count_nonzero(~np.isnan(self.array[0])) - 1)
+
+    def test_wrong_axes(self):
+        with self.assertRaises(ValueError):
+            util.radial_profile(self.array, self.axes[:2], nb_bins=5)
+
+
+class TestRotateCrystal(unittest.TestCase):
+    """
+    Tests related to util.rotate_crystal.
+
+    def rotate_crystal(arrays, axis_to_align=None, reference_axis=None,
+     voxel_size=None, fill_value=0, rotation_matrix=None, is_orthogonal=False,
+     reciprocal_space=False, debugging=False, **kwargs)
+    """
+
+    def setUp(self):
+        # executed before each test
+        rng = np.random.default_rng(0)
+        self.array = rng.random((6, 7, 8))
+
+    def test_identity(self):
+        output = util.rotate_crystal(self.array, rotation_matrix=np.identity(3))
+        self.assertTrue(np.allclose(output, self.array))
+
+    def test_same_axes(self):
+        output = util.rotate_crystal(
+            self.array, axis_to_align=(0, 1, 0), reference_axis=(0, 1, 0)
+        )
+        self.assertTrue(np.allclose(output, self.array))
+
+    def test_rotation_90deg(self):
+        # rotation of 90 degrees around y, the voxel at (z, x) = (-1, 1) moves to (1, 1)
+        array = np.zeros((7, 5, 7))
+        array[3, 2, 5] = 1
+        output = util.rotate_crystal(
+            array, axis_to_align=(1, 0, 0), reference_axis=(0, 0, 1)
+        )
+        self.assertEqual(output.shape, array.shape)
+        self.assertTrue(np.isclose(output.sum(), 1))
+        self.assertEqual(np.unravel_index(output.argmax(), output.shape), (5, 2, 5))
+
+    def test_integer_array(self):
+        output = util.rotate_crystal(
+            np.ones((4, 4, 4), dtype=int), rotation_matrix=np.identity(3)
+        )
+        self.assertEqual(output.dtype, float)
+
+    def test_several_arrays(self):
+        rotation_matrix = util.rotation_matrix_3d((0.1, 1, 0.2), (0, 1, 0))
+        first, second = util.rotate_crystal(
+            (self.array, 2 * self.array),
+            rotation_matrix=rotation_matrix,
+            voxel_size=(1, 2, 3),
+            fill_value=(0, 0),
+        )
+        single = util.rotate_crystal(
+            self.array, rotation_matrix=rotation_matrix, voxel_size=(1, 2, 3)
+        )
+        self.assertTrue(np.allclose(first, single))
+        self.assertTrue(np.allclose(second, 2 * single))
+
+
+class TestTransformedExtent(unittest.TestCase):
+    """
+    Tests related to util.transformed_extent.
+
+    def transformed_extent(matrix, shape)
+    """
+
+    def test_same_as_full_grid(self):
+        rng = np.random.default_rng(0)
+        matrix = rng.normal(size=(3, 3))
+        shape = (5, 8, 7)
+        grid = np.meshgrid(
+            *(np.arange(-nb // 2, nb // 2) for nb in shape), indexing="ij"
+        )
+        positions = np.matmul(matrix, np.stack([axis.ravel() for axis in grid]))
+        self.assertTrue(
+            np.allclose(
+                util.transformed_extent(matrix, shape), np.ptp(positions, axis=1)
+            )
+        )
+
+    def test_identity(self):
+        self.assertTrue(
+            np.array_equal(
+                util.transformed_extent(np.identity(3), (4, 5, 1)), [3, 4, 0]
+            )
+        )
+
+    def test_wrong_matrix_shape(self):
+        with self.assertRaises(ValueError):
+            util.transformed_extent(np.identity(2), (4, 5, 6))
+
+    def test_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            util.transformed_extent(np.identity(3), (4, 5))
+
+
 if __name__ == "__main__":
+    run_tests(TestBoxSum)
+    run_tests(TestFindNearest)
     run_tests(TestInRange)
+    run_tests(TestLoadFile)
+    run_tests(TestRadialProfile)
+    run_tests(TestRotateCrystal)
+    run_tests(TestTransformedExtent)
@@ -7,6 +7,7 @@
 #       authors:
 #         Jerome Carnis, carnis_jerome@yahoo.fr
 
+import numpy as np
 import unittest
 import bcdi.xcca.xcca_utils as xcca
 
@@ -24,5 +25,131 @@ class Test(unittest.TestCase):
         self.assertTrue(True)
 
 
+class TestCalcCCF(unittest.TestCase):
+    """
+    Tests on the function xcca_utils.calc_ccf.
+
+    def calc_ccf(points_q1, points_q2, bin_values, coordinates="rect",
+     block_size=None, nb_workers=1)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.bins = np.linspace(0, np.pi, 180, endpoint=False)
+        self.points_q1 = np.array([[0.1, 0, 0, 2], [0, 0.1, 0, 3]])
+        self.points_q2 = np.array([[0.2, 0, 0, 1], [0, 0, 0.2, 5], [-0.2, 0, 0, 1]])
+
+    def test_counter(self):
+        _, counter = xcca.calc_ccf(self.points_q1, self.points_q2, self.bins)
+        self.assertEqual(counter[0], 1)
+        self.assertEqual(counter[90], 4)
+        self.assertEqual(counter.sum(), 5)
+
+    def test_ccf(self):
+        ccf, _ = xcca.calc_ccf(self.points_q1, self.points_q2, self.bins)
+        self.assertAlmostEqual(ccf[0], 2)
+        self.assertAlmostEqual(ccf[90], 2 * 5 + 3 * 1 + 3 * 5 + 3 * 1)
+
+    def test_block_size(self):
+        ccf, counter = xcca.calc_ccf(self.points_q1, self.points_q2, self.bins)
+        ccf_1, counter_1 = xcca.calc_ccf(
+            self.points_q1, self.points_q2, self.bins, block_size=1
+        )
+        self.assertTrue(np.allclose(ccf, ccf_1))
+        self.assertTrue(np.array_equal(counter, counter_1))
+
+    def test_nb_workers(self):
+        ccf, counter = xcca.calc_ccf(self.points_q1, self.points_q2, self.bins)
+        ccf_2, counter_2 = xcca.calc_ccf(
+            self.points_q1, self.points_q2, self.bins, nb_workers=2
+        )
+        self.assertTrue(np.allclose(ccf, ccf_2))
+        self.assertTrue(np.array_equal(counter, counter_2))
+
+    def test_polar(self):
+        points_q1 = np.array([[np.pi / 2, 0, 2], [np.pi / 2, np.pi / 2, 3]])
+        points_q2 = np.array([[np.pi / 2, 0, 1], [0, 0, 5], [np.pi / 2, np.pi, 1]])
+        ccf, counter = xcca.calc_ccf(points_q1, points_q2, self.bins, "polar")
+        ccf_rect, counter_rect = xcca.calc_ccf(
+            self.points_q1, self.points_q2, self.bins
+        )
+        self.assertTrue(np.allclose(ccf, ccf_rect))
+        self.assertTrue(np.array_equal(counter, counter_rect))
+
+    def test_calc_ccf_rect(self):
+        ccf_val, counter_val, counter_indices = xcca.calc_ccf_rect(
+            point=0,
+            q1_name="q1",
+            q2_name="q2",
+            bin_values=self.bins,
+            q_int={"q1": self.points_q1, "q2": self.points_q2},
+        )
+        self.assertTrue(np.array_equal(counter_indices, [0, 90]))
+        self.assertTrue(np.array_equal(counter_val, [1, 1]))
+        self.assertTrue(np.allclose(ccf_val, [2, 10]))
+
+    def test_wrong_coordinates(self):
+        with self.assertRaises(ValueError):
+            xcca.calc_ccf(self.points_q1, self.points_q2, self.bins, "spherical")
+
+
+class TestRadialBins(unittest.TestCase):
+    """
+    Tests on the function xcca_utils.radial_bins.
+
+    def radial_bins(q_values, origin, nb_bins)
+    """
+
+    def setUp(self):
+        # executed before each test
+        self.q_values = (np.arange(5), np.arange(6), np.arange(7))
+        self.origin = (2, 3, 3)
+
+    def test_offsets(self):
+        _, sorted_indices, offsets = xcca.radial_bins(
+            q_values=self.q_values, origin=self.origin, nb_bins=4
+        )
+        self.assertEqual(len(offsets), 5)
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(offsets[-1], len(sorted_indices))
+
+    def test_shells(self):
+        q_axis, sorted_indices, offsets = xcca.radial_bins(
+            q_values=self.q_values, origin=self.origin, nb_bins=4
+        )
+        grid = np.meshgrid(*self.q_values, indexing="ij")
+        distances = np.sqrt(
+            sum((grid[idx] - self.origin[idx]) ** 2 for idx in range(3))
+        ).ravel()
+        width = q_axis[1] - q_axis[0]
+        for index in range(4):
+            shell = distances[sorted_indices[offsets[index] : offsets[index + 1]]]
+            self.assertTrue(np.all(shell >= q_axis[index] - width / 2 - 1e-12))
+            self.assertTrue(np.all(shell < q_axis[index] + width / 2 + 1e-12))
+
+    def test_cache(self):
+        result = xcca.radial_bins(q_values=self.q_values, origin=self.origin, nb_bins=4)
+        self.assertIs(
+            xcca.radial_bins(q_values=self.q_values, origin=self.origin, nb_bins=4),
+            result,
+        )
+
+    def test_angular_avg_constant(self):
+        data = np.ones((5, 6, 7))
+        data[0, 0, 0] = np.nan
+        mask = np.zeros((5, 6, 7))
+        mask[1, 1, 1] = 1
+        data[1, 1, 1] = 100
+        _, mean, median = xcca.angular_avg(
+            data=data,
+            q_values=self.q_values,
+            mask=mask,
+            origin=self.origin,
+            nb_bins=4,
+        )
+        self.assertTrue(np.allclose(mean, 1))
+        self.assertTrue(np.allclose(median, 1))
+
+
 if __name__ == "__main__":
     run_tests(Test)